@@ -0,0 +1,58 @@
+"""
+Benchmark of the event loop latency during a login storm.
+
+A ticker coroutine sleeps 5 ms again and again and records how late it wakes up, like any other
+request served by the same worker. Meanwhile a burst of password verifications runs either inline
+(passlib called from the coroutine, as the login route used to do) or on the bcrypt thread pool
+through Auth.verify_and_update_password.
+
+Usage:
+    python -m benchmarks.login_storm [logins]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from src.services.auth import auth_service
+
+TICK = 0.005
+
+
+async def ticker(stop: asyncio.Event, delays: list[float]) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        delays.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def inline_verify(password: str, hashed: str) -> None:
+    auth_service.pwd_context.verify_and_update(password, hashed)
+
+
+async def storm(label: str, verify, hashed: str, logins: int) -> None:
+    stop = asyncio.Event()
+    delays: list[float] = []
+    tick = asyncio.create_task(ticker(stop, delays))
+    start = time.perf_counter()
+    await asyncio.gather(*(verify("password", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+
+    delays.sort()
+    p99 = delays[int(len(delays) * 0.99) - 1] if len(delays) > 1 else delays[0]
+    print(
+        f"{label:<12}{elapsed:8.2f} s total  ticks {len(delays):5d}  "
+        f"median lag {statistics.median(delays):8.2f} ms  p99 {p99:8.2f} ms  max {delays[-1]:8.2f} ms"
+    )
+
+
+async def main(logins: int) -> None:
+    hashed = auth_service.get_password_hash("password")
+    await storm("inline", inline_verify, hashed, logins)
+    await storm("offloaded", auth_service.verify_and_update_password, hashed, logins)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 32))
@@ -0,0 +1,64 @@
+"""
+Microbenchmark of the overhead of the rate limiter per request.
+
+Runs the same burst of requests of one client through RateLimiter.hit with one Redis call per request
+(rate_limit_batch = 1) and with leased batches (the configured rate_limit_batch), and reports the time
+and the Redis calls per request. Against a real Redis (REDIS_URL) the difference grows with the round trip,
+without it an in-process fakeredis is used and only the client side cost is measured.
+
+Usage:
+    python -m benchmarks.rate_limiter [requests]
+    REDIS_URL=redis://localhost:6379/0 python -m benchmarks.rate_limiter [requests]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import redis.asyncio
+
+from src.conf.config import settings
+from src.database.redis import redis_manager
+from src.services.rate_limit import Policy, RateLimiter
+
+
+async def measure(label: str, batch: int, requests: int) -> None:
+    settings.rate_limit_batch = batch
+    limiter = RateLimiter()
+    policy = Policy(times=requests * 10, seconds=60)
+    client = redis_manager.client
+    await limiter.hit(f"bench:warm-up:{batch}", policy)
+
+    calls = 0
+    evalsha = client.evalsha
+
+    async def counted(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return await evalsha(*args, **kwargs)
+
+    client.evalsha = counted
+    start = time.perf_counter()
+    for _ in range(requests):
+        await limiter.hit(f"bench:{batch}", policy)
+    per_request = (time.perf_counter() - start) / requests * 1_000_000
+    client.evalsha = evalsha
+    print(f"{label:<24}{per_request:10.2f} us/request{calls / requests:10.2f} Redis calls/request")
+
+
+async def main(requests: int) -> None:
+    url = os.environ.get("REDIS_URL")
+    if url:
+        redis_manager._client = redis.asyncio.from_url(url)
+    else:
+        from fakeredis import aioredis
+
+        redis_manager._client = aioredis.FakeRedis()
+    batch = settings.rate_limit_batch
+    await measure("one call per request", 1, requests)
+    await measure(f"leases of {batch}", batch, requests)
+    await redis_manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
@@ -1,66 +1,66 @@
-import logging
-import time
-from ipaddress import ip_address, ip_network
-from typing import Callable
+import asyncio
+import contextlib
+from typing import AsyncIterator
 
-import click
-import redis.asyncio as redis_async
 import uvicorn
-from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
-from fastapi.responses import JSONResponse
-from fastapi_limiter import FastAPILimiter
+from fastapi import Depends, FastAPI, HTTPException, Response
+from fastapi.staticfiles import StaticFiles
+from prometheus_client import REGISTRY
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.conf.config import settings, init_async_redis
-from src.database.db import get_db
+from src.conf.config import settings
+from src.database.db import get_db, sessionmanager
+from src.database.models import Role
+from src.database.redis import redis_manager
 from src.routes import addressbook, auth, users
+from src.services.cache import contact_cache, user_cache
+from src.services.metrics import MetricsMiddleware, StatsCollector, mark_worker_dead, metrics_response, scrape_access
+from src.services.roles import RoleAccess
 
 # logger = logging.getLogger("uvicorn")
 
-app = FastAPI()
 
-app.include_router(auth.router, prefix="/api")
-app.include_router(addressbook.router, prefix="/api")
-app.include_router(users.router, prefix="/api")
-
-
-@app.on_event("startup")
-async def startup() -> FastAPILimiter:
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     """
-    The startup function is called when the server starts up.
-    It's a good place to initialize things that are needed by your application,
-    such as databases and caches.  It can also be used to pre-load data into memory,
-    or do other tasks that need to happen before the server begins serving requests.
+    The lifespan function opens the shared resources of the application before it serves requests
+    and closes them when the server stops: the Redis connection pool used by the rate limiter and
+    the caches, and the listener of the user cache invalidations. Redis is connected on first use,
+    an unreachable Redis does not stop the application from starting.
 
-    :return: A fastapilimiter object
+    :param app: FastAPI: The application
+    :return: An async iterator that yields once the application is ready
     """
+    redis_manager.init()
+    listener = asyncio.create_task(user_cache.listen())
     try:
-        r = await init_async_redis()
-        await FastAPILimiter.init(r)
-    except redis_async.ConnectionError as e:
-        click.secho(f"ERROR redis: {e}", bold=True, fg="red", italic=True)
-        raise HTTPException(status_code=500, detail="Error connecting to the redis")
+        yield
+    finally:
+        listener.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await listener
+        await redis_manager.close()
+        mark_worker_dead()
 
 
+app = FastAPI(lifespan=lifespan)
 
-@app.middleware("http")
-async def custom_midleware(request: Request, call_next) -> Response:
-    """
-    The custom_midleware function is a custom middleware function that adds the time it took to process the request
-    to the response headers. It does this by getting the current time before calling call_next, and then subtracting
-    the start_time from it after call_next returns. The result is added to a new header called &quot;performance&quot;.
+app.include_router(auth.router, prefix="/api")
+app.include_router(addressbook.router, prefix="/api")
+app.include_router(users.router, prefix="/api")
 
+if settings.avatar_store == "local":
+    app.mount(settings.avatar_local_url, StaticFiles(directory=settings.avatar_local_dir, check_dir=False), name="avatars")
 
-    :param request: Request: Pass the request to the next middleware
-    :param call_next: Call the next middleware in the chain
-    :return: A response object with a performance header
-    """
-    start_time = time.time()
-    response = await call_next(request)
-    during = time.time() - start_time
-    response.headers["performance"] = str(during)
-    return response
+
+app.add_middleware(MetricsMiddleware)
+stats_collector = StatsCollector(
+    db_pools=sessionmanager.pool_stats,
+    redis_pool=redis_manager.stats,
+    caches={"contact": contact_cache.stats, "user": user_cache.stats},
+)
+REGISTRY.register(stats_collector)
 
 
 # @app.middleware("http")
@@ -122,5 +122,50 @@ async def healthchecker(db: AsyncSession = Depends(get_db)) -> dict:
         raise HTTPException(status_code=500, detail="Error connecting to the database")
 
 
+@app.get("/api/cache/stats", tags=["healthchecker"], dependencies=[Depends(RoleAccess([Role.admin]))])
+async def cache_stats() -> dict:
+    """
+    The cache_stats function returns the hit and miss counters of the contact cache of this worker.
+
+    :return: A dictionary with the counters
+    """
+    return contact_cache.stats()
+
+
+@app.get("/api/db/pool", tags=["healthchecker"], dependencies=[Depends(RoleAccess([Role.admin]))])
+async def pool_stats() -> dict:
+    """
+    The pool_stats function returns the connection pool metrics of this worker:
+    checked out connections, overflow, and the average and longest wait for a connection.
+
+    :return: A dictionary with the metrics of the primary and the replica pools
+    """
+    return sessionmanager.pool_stats()
+
+
+@app.get("/api/redis/pool", tags=["healthchecker"], dependencies=[Depends(RoleAccess([Role.admin]))])
+async def redis_pool_stats() -> dict:
+    """
+    The redis_pool_stats function returns the state of the Redis connection pool of this worker.
+
+    :return: A dictionary with the open and the idle connections of the pool
+    """
+    return redis_manager.stats()
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(scrape_access)])
+async def metrics() -> Response:
+    """
+    The metrics function exposes the metrics in the Prometheus text format:
+    request latency by route and status, requests in progress, SQL and Redis timings,
+    cache hit ratios and the state of the connection pools.
+    The scraper is allowed by its address or by the static scrape token, a user token would expire between scrapes.
+    Run several workers with PROMETHEUS_MULTIPROC_DIR set, so the metrics of all of them are served.
+
+    :return: A Response with the metrics
+    """
+    return metrics_response([stats_collector])
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", reload=True)
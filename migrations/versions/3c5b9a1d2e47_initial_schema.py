@@ -0,0 +1,73 @@
+"""initial schema
+
+The schema the application was deployed with before the migration history existed,
+a database created by Base.metadata.create_all at that time can be stamped with this revision.
+
+Revision ID: 3c5b9a1d2e47
+Revises: 
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c5b9a1d2e47"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=50), nullable=False),
+        sa.Column("email", sa.String(length=150), nullable=False),
+        sa.Column("confirmed", sa.Boolean(), nullable=False),
+        sa.Column("password", sa.String(length=255), nullable=False),
+        sa.Column("refresh_token", sa.String(length=255), nullable=True),
+        sa.Column("avatar", sa.String(length=255), nullable=True),
+        sa.Column("roles", sa.Enum("admin", "moderator", "user", name="role"), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+    )
+    op.create_table(
+        "addressbook",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("first_name", sa.String(length=55), nullable=False),
+        sa.Column("last_name", sa.String(length=55), nullable=False),
+        sa.Column("birthday", sa.Date(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "contacts",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("contact_type", sa.Enum("email", "phone", name="contacttype"), nullable=False),
+        sa.Column("contact_value", sa.String(length=50), nullable=False),
+        sa.Column("contact_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["contact_id"], ["addressbook.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("contacts")
+    op.drop_table("addressbook")
+    op.drop_table("users")
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("DROP TYPE IF EXISTS contacttype")
+        op.execute("DROP TYPE IF EXISTS role")
@@ -0,0 +1,52 @@
+"""contacts user_id and birthday key
+
+contacts.user_id copies the owner of the address book entry, so contact values can be unique per user.
+addressbook.birthday_key stores the birthday as month * 100 + day, so upcoming birthdays are a range scan.
+Both columns are added nullable, backfilled from the existing rows, and contacts.user_id is then made NOT NULL.
+
+Revision ID: 4e1a7c2b9d58
+Revises: 3c5b9a1d2e47
+Create Date: 2026-10-16 12:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4e1a7c2b9d58"
+down_revision: Union[str, Sequence[str], None] = "3c5b9a1d2e47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+birthday_keys = {
+    "postgresql": "CAST(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) AS SMALLINT)",
+    "sqlite": "CAST(strftime('%m', birthday) AS INTEGER) * 100 + CAST(strftime('%d', birthday) AS INTEGER)",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_context().dialect.name
+
+    with op.batch_alter_table("addressbook") as batch_op:
+        batch_op.add_column(sa.Column("birthday_key", sa.SmallInteger(), nullable=True))
+    op.execute(f"UPDATE addressbook SET birthday_key = {birthday_keys[dialect]} WHERE birthday IS NOT NULL")
+
+    with op.batch_alter_table("contacts") as batch_op:
+        batch_op.add_column(sa.Column("user_id", sa.Integer(), nullable=True))
+    op.execute("UPDATE contacts SET user_id = (SELECT addressbook.user_id FROM addressbook WHERE addressbook.id = contacts.contact_id)")
+    with op.batch_alter_table("contacts") as batch_op:
+        batch_op.alter_column("user_id", existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key("contacts_user_id_fkey", "users", ["user_id"], ["id"], ondelete="CASCADE")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("contacts") as batch_op:
+        batch_op.drop_constraint("contacts_user_id_fkey", type_="foreignkey")
+        batch_op.drop_column("user_id")
+    with op.batch_alter_table("addressbook") as batch_op:
+        batch_op.drop_column("birthday_key")
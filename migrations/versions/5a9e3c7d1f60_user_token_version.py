@@ -0,0 +1,30 @@
+"""user token version
+
+Revision ID: 5a9e3c7d1f60
+Revises: c71e4f8a9b25
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5a9e3c7d1f60"
+down_revision: Union[str, Sequence[str], None] = "c71e4f8a9b25"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.add_column(sa.Column("token_version", sa.Integer(), server_default="0", nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("token_version")
@@ -0,0 +1,58 @@
+"""unique contacts
+
+Duplicate names and contact values are rejected by unique constraints instead of checks before the insert.
+Contact values repeated within one address book entry are removed first, they only repeat the same data.
+Other duplicates have to be resolved by hand, the migration stops and reports them.
+
+Revision ID: 6d3f8b0e2a17
+Revises: 4e1a7c2b9d58
+Create Date: 2026-10-16 12:07:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6d3f8b0e2a17"
+down_revision: Union[str, Sequence[str], None] = "4e1a7c2b9d58"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+duplicates = {
+    "uq_addressbook_user_id_name": (
+        "SELECT count(*) FROM (SELECT 1 FROM addressbook GROUP BY user_id, first_name, last_name HAVING count(*) > 1) AS d"
+    ),
+    "uq_contacts_user_id_type_value": (
+        "SELECT count(*) FROM (SELECT 1 FROM contacts GROUP BY user_id, contact_type, contact_value HAVING count(*) > 1) AS d"
+    ),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        "DELETE FROM contacts WHERE id NOT IN "
+        "(SELECT min(id) FROM contacts GROUP BY contact_id, contact_type, contact_value)"
+    )
+    if not op.get_context().as_sql:
+        connection = op.get_bind()
+        for name, query in duplicates.items():
+            count = connection.execute(sa.text(query)).scalar()
+            if count:
+                raise RuntimeError(f"{count} duplicate groups violate {name}, resolve them before upgrading")
+
+    with op.batch_alter_table("addressbook") as batch_op:
+        batch_op.create_unique_constraint("uq_addressbook_user_id_name", ["user_id", "first_name", "last_name"])
+    with op.batch_alter_table("contacts") as batch_op:
+        batch_op.create_unique_constraint("uq_contacts_user_id_type_value", ["user_id", "contact_type", "contact_value"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("contacts") as batch_op:
+        batch_op.drop_constraint("uq_contacts_user_id_type_value", type_="unique")
+    with op.batch_alter_table("addressbook") as batch_op:
+        batch_op.drop_constraint("uq_addressbook_user_id_name", type_="unique")
@@ -0,0 +1,42 @@
+"""hot path indexes
+
+Every per-user read filters addressbook by user_id and joins contacts on contact_id.
+On PostgreSQL the indexes are built CONCURRENTLY outside of the migration transaction,
+so the migration can run against a live database without blocking writes.
+
+Revision ID: 8f2d6e0b4a13
+Revises: 6d3f8b0e2a17
+Create Date: 2026-10-16 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8f2d6e0b4a13"
+down_revision: Union[str, Sequence[str], None] = "6d3f8b0e2a17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+indexes = [
+    ("ix_addressbook_user_id_name", "addressbook", ["user_id", "last_name", "first_name", "id"]),
+    ("ix_addressbook_user_id_birthday_key", "addressbook", ["user_id", "birthday_key"]),
+    ("ix_contacts_contact_id_type", "contacts", ["contact_id", "contact_type"]),
+    ("ix_contacts_type_value", "contacts", ["contact_type", "contact_value"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(indexes):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,100 @@
+"""search indexes
+
+PostgreSQL serves the contains search with trigram GIN indexes, built CONCURRENTLY.
+SQLite mirrors names and contact values into an FTS5 table with the trigram tokenizer,
+kept in sync by triggers (rowid is id * 2 for names and id * 2 + 1 for contact values).
+
+Revision ID: c71e4f8a9b25
+Revises: 8f2d6e0b4a13
+Create Date: 2026-10-16 12:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c71e4f8a9b25"
+down_revision: Union[str, Sequence[str], None] = "8f2d6e0b4a13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+trigram_indexes = [
+    ("ix_addressbook_first_name_trgm", "addressbook", "first_name"),
+    ("ix_addressbook_last_name_trgm", "addressbook", "last_name"),
+    ("ix_contacts_contact_value_trgm", "contacts", "contact_value"),
+]
+
+fts_triggers = [
+    """CREATE TRIGGER addressbook_fts_ai AFTER INSERT ON addressbook BEGIN
+        INSERT INTO addressbook_fts (rowid, body, abc_id, user_id)
+        VALUES (new.id * 2, new.first_name || ' ' || new.last_name, new.id, new.user_id);
+    END""",
+    """CREATE TRIGGER addressbook_fts_au AFTER UPDATE OF first_name, last_name, user_id ON addressbook BEGIN
+        DELETE FROM addressbook_fts WHERE rowid = old.id * 2;
+        INSERT INTO addressbook_fts (rowid, body, abc_id, user_id)
+        VALUES (new.id * 2, new.first_name || ' ' || new.last_name, new.id, new.user_id);
+    END""",
+    """CREATE TRIGGER addressbook_fts_ad AFTER DELETE ON addressbook BEGIN
+        DELETE FROM addressbook_fts WHERE rowid = old.id * 2;
+    END""",
+    """CREATE TRIGGER contacts_fts_ai AFTER INSERT ON contacts BEGIN
+        INSERT INTO addressbook_fts (rowid, body, abc_id, user_id)
+        VALUES (new.id * 2 + 1, new.contact_value, new.contact_id, new.user_id);
+    END""",
+    """CREATE TRIGGER contacts_fts_au AFTER UPDATE OF contact_value, contact_id ON contacts BEGIN
+        DELETE FROM addressbook_fts WHERE rowid = old.id * 2 + 1;
+        INSERT INTO addressbook_fts (rowid, body, abc_id, user_id)
+        VALUES (new.id * 2 + 1, new.contact_value, new.contact_id, new.user_id);
+    END""",
+    """CREATE TRIGGER contacts_fts_ad AFTER DELETE ON contacts BEGIN
+        DELETE FROM addressbook_fts WHERE rowid = old.id * 2 + 1;
+    END""",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_context().dialect.name
+
+    if dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        with op.get_context().autocommit_block():
+            for name, table, column in trigram_indexes:
+                op.create_index(
+                    name,
+                    table,
+                    [column],
+                    postgresql_using="gin",
+                    postgresql_ops={column: "gin_trgm_ops"},
+                    postgresql_concurrently=True,
+                )
+
+    elif dialect == "sqlite":
+        op.execute("CREATE VIRTUAL TABLE addressbook_fts USING fts5(body, abc_id UNINDEXED, user_id UNINDEXED, tokenize = 'trigram')")
+        op.execute(
+            "INSERT INTO addressbook_fts (rowid, body, abc_id, user_id) "
+            "SELECT id * 2, first_name || ' ' || last_name, id, user_id FROM addressbook"
+        )
+        op.execute(
+            "INSERT INTO addressbook_fts (rowid, body, abc_id, user_id) "
+            "SELECT id * 2 + 1, contact_value, contact_id, user_id FROM contacts"
+        )
+        for statement in fts_triggers:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_context().dialect.name
+
+    if dialect == "postgresql":
+        with op.get_context().autocommit_block():
+            for name, table, _ in reversed(trigram_indexes):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+    elif dialect == "sqlite":
+        for trigger in ["contacts_fts_ad", "contacts_fts_au", "contacts_fts_ai", "addressbook_fts_ad", "addressbook_fts_au", "addressbook_fts_ai"]:
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS addressbook_fts")
@@ -1,35 +1,81 @@
-import redis.asyncio
-
 from pydantic_settings import BaseSettings
 
-async def init_async_redis():
-    return redis.asyncio.Redis(
-        host=settings.redis_host,
-        password=settings.redis_password,
-        port=settings.redis_port,
-        db=0,
-        encoding="utf-8",
-    )
-    
+
 class Settings(BaseSettings):
     postgres_user: str = "postgres"
     postgres_password: str = "secretPassword"
     postgres_db: str = "postgres"
     postgres_domain: str = "localhost"
     postgres_port: int = 5432
+    postgres_replica_domains: str = ""
+    replica_read_your_writes: float = 5.0
+    replica_retry_after: float = 30.0
+
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = False
+    db_pgbouncer: bool = False
+    db_slow_query: float = 0.2
+    db_repeated_query_limit: int = 10
+    db_query_header: bool = False
+    metrics_token: str = ""
+    metrics_allowed_ips: str = ""
     
     secret_key: str = "secret_key"
     algorithm: str = "HS256"
+    auth_claims_tokens: bool = False
+    token_cache_size: int = 4096
+    refresh_token_ttl: int = 7 * 24 * 3600
+
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+    password_hash_max_pending: int = 64
+    password_hash_timeout: float = 5.0
+
+    login_account_free_attempts: int = 5
+    login_ip_free_attempts: int = 20
+    login_backoff_base: float = 1.0
+    login_backoff_max: float = 900.0
+    login_fail_window: int = 900
+    login_lock_cache_size: int = 4096
 
     mail_username: str = "example@meta.ua"
     mail_password: str = "secretPassword"
     mail_from: str = "example@meta.ua"
     mail_port: int = 465
     mail_server: str = "smtp.meta.ua"
+    mail_ssl_tls: bool = True
+    mail_starttls: bool = False
+    email_smtp_pool_size: int = 2
+    email_smtp_timeout: float = 10.0
+    email_batch_size: int = 10
+    email_max_attempts: int = 5
+    email_retry_base: float = 30.0
+    email_claim_idle: int = 60
+    email_dedupe_ttl: int = 60
+    email_recipient_limit: int = 5
+    email_recipient_window: int = 3600
 
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_password: str = ""
+    redis_max_connections: int = 50
+    redis_socket_timeout: float = 5.0
+    redis_connect_timeout: float = 2.0
+    redis_health_check_interval: int = 30
+    redis_command_timeout: float = 0.25
+    redis_breaker_failures: int = 5
+    redis_breaker_reset: float = 5.0
+    rate_limit_local_size: int = 10000
+    rate_limit_batch: int = 10
+    rate_limits: dict[str, str] = {
+        "contacts:create": "10/60",
+        "contacts:import": "10/60",
+        "contacts:add_phone": "10/60",
+        "contacts:add_email": "10/60",
+    }
 
     # allowed_ips: str
 
@@ -37,6 +83,23 @@ class Settings(BaseSettings):
     cloudinary_api_key: str = "1234567890"
     cloudinary_api_secret: str = "secret"
 
+    avatar_store: str = "cloudinary"
+    avatar_local_dir: str = "static/avatars"
+    avatar_local_url: str = "/static/avatars"
+    avatar_size: int = 250
+    avatar_max_bytes: int = 5 * 1024 * 1024
+    avatar_max_pixels: int = 40_000_000
+
+    import_batch_size: int = 500
+    import_max_errors: int = 1000
+    export_chunk_size: int = 500
+
+    contact_cache_ttl: int = 300
+    list_cache_ttl: int = 60
+    user_cache_ttl: int = 900
+    user_cache_local_ttl: float = 30.0
+    user_cache_local_size: int = 1024
+
     class ConfigDict:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -45,6 +108,13 @@ class Settings(BaseSettings):
     def sqlalchemy_database_url(self) -> str:
         return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.postgres_domain}/{self.postgres_db}"
 
+    @property
+    def sqlalchemy_replica_urls(self) -> list[str]:
+        domains = [domain.strip() for domain in self.postgres_replica_domains.split(",") if domain.strip()]
+        return [
+            f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{domain}/{self.postgres_db}" for domain in domains
+        ]
+
 settings = Settings()  # type: ignore
 settings.redis_host = "redis-16977.c293.eu-central-1-1.ec2.cloud.redislabs.com"
 settings.redis_port = 16977
@@ -1,49 +1,304 @@
 import contextlib
-from typing import AsyncIterator
+import logging
+import time
+from typing import AsyncIterator, Callable, Sequence
+from uuid import uuid4
 
+import redis
+from fastapi import Depends
+from sqlalchemy import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     async_sessionmaker, create_async_engine)
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from src.conf.config import settings
+from src.database.redis import redis_manager
+from src.services.metrics import instrument_engine
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 print(SQLALCHEMY_DATABASE_URL)
 
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    A connection pool that measures how long checkouts wait for a free connection.
+
+    Attributes:
+        checkouts (int): The number of connections handed out.
+        wait_total (float): The total time spent waiting for connections, in seconds.
+        wait_max (float): The longest wait for a connection, in seconds.
+        timeouts (int): The number of checkouts that failed after pool_timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            logger.warning("Connection pool exhausted: %s", self.status())
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        self.checkouts += 1
+        return connection
+
+    def stats(self) -> dict:
+        """
+        Returns the live state and the counters of the pool.
+
+        :return: A dictionary with the pool metrics.
+        :rtype: dict
+        """
+        return {
+            "pool": type(self).__name__,
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.checkouts,
+            "wait_avg_ms": self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+            "timeouts": self.timeouts,
+        }
+
+
+def engine_options(url: str) -> dict:
+    """
+    Builds the create_async_engine options of a database URL from the pool settings.
+
+    In PgBouncer mode (transaction pooling) connections are not pooled by the application and
+    the prepared statement caches of asyncpg are disabled, because the server connection can change
+    between two statements. The statements SQLAlchemy still prepares get unique names,
+    so two clients sharing a server connection never reuse the name of each other's statement.
+    Other databases (SQLite in tests) keep the defaults of SQLAlchemy.
+
+    :param url: The SQLAlchemy database URL.
+    :type url: str
+    :return: The keyword arguments for create_async_engine.
+    :rtype: dict
+    """
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    if settings.db_pgbouncer:
+        return {
+            "poolclass": NullPool,
+            "connect_args": {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            },
+        }
+    return {
+        "poolclass": InstrumentedPool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
 
 class DatabaseSessionManager:
     """
     A manager for creating and managing database sessions.
 
-    This class provides methods to create and manage asynchronous database sessions.
+    This class provides methods to create and manage asynchronous database sessions
+    on the primary database and on its read replicas.
 
     Attributes:
-        _engine (AsyncEngine): The asynchronous SQLAlchemy engine.
-        _session_maker (async_sessionmaker): The asynchronous session maker.
+        _engine (AsyncEngine): The asynchronous SQLAlchemy engine of the primary database.
+        _session_maker (async_sessionmaker): The asynchronous session maker of the primary database.
+        _replica_engines (List[AsyncEngine]): The engines of the read replicas.
+        _replica_makers (List[async_sessionmaker]): The session makers of the read replicas.
+        _replica_down_until (List[float]): Until when every replica is skipped after a failed connection.
+        _last_write (Dict[int, float]): When every user wrote last, for the read-your-writes window.
 
     Methods:
-        __init__(self, url: str):
-            Initializes the DatabaseSessionManager with a given database URL.
+        __init__(self, url: str, replica_urls: Sequence[str] = ()):
+            Initializes the DatabaseSessionManager with a given database URL and optional replica URLs.
 
         session(self) -> AsyncIterator[AsyncSession]:
             A context manager that yields an asynchronous database session.
 
+        replica_session(self, user_id: int | None = None) -> AsyncIterator[AsyncSession | None]:
+            A context manager that yields a session on a healthy replica, or None when the primary should be used.
+
+        pool_stats(self) -> dict:
+            Returns the metrics of the connection pools.
+
     Example:
-        sessionmanager = DatabaseSessionManager(settings.sqlalchemy_database_url)
+        sessionmanager = DatabaseSessionManager(settings.sqlalchemy_database_url, settings.sqlalchemy_replica_urls)
         async with sessionmanager.session() as session:
             # Use the session for database operations
     """
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, replica_urls: Sequence[str] = ()):
         """
         Initializes the DatabaseSessionManager with a given database URL.
 
         :param url: The SQLAlchemy database URL.
         :type url: str
+        :param replica_urls: The SQLAlchemy URLs of the read replicas.
+        :type replica_urls: Sequence[str]
         """
-        self._engine: AsyncEngine | None = create_async_engine(url)
+        self._engine: AsyncEngine | None = create_async_engine(url, **engine_options(url))
         self._session_maker: async_sessionmaker | None = async_sessionmaker(
             autocommit=False, autoflush=False, expire_on_commit=False, bind=self._engine
         )
+        self._replica_engines = [
+            create_async_engine(replica_url, **{**engine_options(replica_url), "pool_pre_ping": True}) for replica_url in replica_urls
+        ]
+        self._replica_makers = [
+            async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+            for engine in self._replica_engines
+        ]
+        instrument_engine(self._engine, "primary")
+        for engine in self._replica_engines:
+            instrument_engine(engine, "replica")
+        self._replica_down_until = [0.0] * len(self._replica_engines)
+        self._next_replica = 0
+        self._last_write: dict[int, float] = {}
+
+    def pool_stats(self) -> dict:
+        """
+        Returns the metrics of the connection pools of the primary and of every replica.
+
+        :return: A dictionary with the metrics of every pool.
+        :rtype: dict
+        """
+
+        def stats(engine: AsyncEngine) -> dict:
+            pool = engine.pool
+            if isinstance(pool, InstrumentedPool):
+                return pool.stats()
+            return {"pool": type(pool).__name__, "status": pool.status()}
+
+        return {
+            "primary": stats(self._engine),
+            "replicas": [stats(engine) for engine in self._replica_engines],
+        }
+
+    @staticmethod
+    def write_key(user_id: int) -> str:
+        """
+        Builds the Redis key of the read-your-writes window of a user.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        :return: The Redis key.
+        :rtype: str
+        """
+        return f"db:last-write:{user_id}"
+
+    async def mark_write(self, user_id: int) -> None:
+        """
+        Remembers that a user has just written to the primary database.
+        Reads of the user go to the primary for settings.replica_read_your_writes seconds, until the replicas catch up.
+        The window is kept in this worker and in Redis, so the other workers see it too.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        """
+        now = time.monotonic()
+        if len(self._last_write) > 10000:
+            self._last_write = {
+                key: written for key, written in self._last_write.items() if now - written < settings.replica_read_your_writes
+            }
+        self._last_write[user_id] = now
+        if not self._replica_makers:
+            return
+        try:
+            async with redis_manager.guard() as client:
+                await client.set(self.write_key(user_id), 1, px=max(int(settings.replica_read_your_writes * 1000), 1))
+        except (redis.RedisError, OSError) as err:
+            logger.warning("Read-your-writes window of user %d is only kept by this worker: %s", user_id, err)
+
+    async def recent_write(self, user_id: int) -> bool:
+        """
+        Checks if a user wrote within the read-your-writes window, on this worker or on another one.
+        When Redis can not be asked, the read goes to the primary.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        :return: True if the reads of the user have to go to the primary.
+        :rtype: bool
+        """
+        written = self._last_write.get(user_id)
+        if written is not None and time.monotonic() - written < settings.replica_read_your_writes:
+            return True
+        try:
+            async with redis_manager.guard() as client:
+                return bool(await client.exists(self.write_key(user_id)))
+        except (redis.RedisError, OSError):
+            return True
+
+    def pick_replica(self) -> int | None:
+        """
+        Picks the next healthy replica in round-robin order.
+        A replica that failed to connect is skipped for settings.replica_retry_after seconds.
+
+        :return: The index of the replica, None when no replica is available.
+        :rtype: int | None
+        """
+        now = time.monotonic()
+        for _ in range(len(self._replica_makers)):
+            index = self._next_replica
+            self._next_replica = (self._next_replica + 1) % len(self._replica_makers)
+            if self._replica_down_until[index] <= now:
+                return index
+        return None
+
+    @contextlib.asynccontextmanager
+    async def replica_session(self, user_id: int | None = None) -> AsyncIterator[AsyncSession | None]:
+        """
+        Provides an asynchronous context manager to yield a read-only session on a replica.
+
+        None is yielded when the primary should serve the read: no replica is configured or healthy,
+        the user is within the read-your-writes window, or the replica can not be connected.
+        In the last case the replica is marked as down and the next one is used by later requests.
+
+        :param user_id: The id of the user who reads, None to skip the read-your-writes check.
+        :type user_id: int | None
+        :return: A session on a replica or None.
+        :rtype: AsyncSession | None
+        """
+        index = None
+        if self._replica_makers and (user_id is None or not await self.recent_write(user_id)):
+            index = self.pick_replica()
+        if index is None:
+            yield None
+            return
+
+        session: AsyncSession | None = self._replica_makers[index]()
+        try:
+            await session.connection()
+        except (DBAPIError, OSError) as err:
+            logger.warning("Replica %d unavailable: %s", index, err)
+            self._replica_down_until[index] = time.monotonic() + settings.replica_retry_after
+            await session.close()
+            session = None
+
+        if session is None:
+            yield None
+            return
+        try:
+            yield session
+        finally:
+            await session.close()
 
     @contextlib.asynccontextmanager
     async def session(self) -> AsyncIterator[AsyncSession]:
@@ -69,7 +324,7 @@ class DatabaseSessionManager:
             await session.close()
 
 
-sessionmanager = DatabaseSessionManager(settings.sqlalchemy_database_url)
+sessionmanager = DatabaseSessionManager(settings.sqlalchemy_database_url, settings.sqlalchemy_replica_urls)
 
 
 async def get_db():
@@ -85,3 +340,36 @@ async def get_db():
     """
     async with sessionmanager.session() as session:
         yield session
+
+
+async def get_db_replica(db: AsyncSession = Depends(get_db)) -> AsyncIterator[AsyncSession]:
+    """
+    Asynchronous generator function to get a read-only database session on a replica.
+    The primary session of get_db is used when no replica is available. It does not connect unless it is used.
+
+    Yields:
+        AsyncSession: An asynchronous database session.
+    """
+    async with sessionmanager.replica_session() as session:
+        yield session if session is not None else db
+
+
+def read_your_writes_db(user_dependency: Callable) -> Callable:
+    """
+    Builds a dependency that gets a read-only database session for the current user.
+    Reads go to a replica unless the user wrote within the read-your-writes window.
+
+    Usage:
+        get_db_read = read_your_writes_db(auth_service.get_current_claims)
+
+    :param user_dependency: The dependency that returns the current user.
+    :type user_dependency: Callable
+    :return: The dependency.
+    :rtype: Callable
+    """
+
+    async def get_db_read(current_user=Depends(user_dependency), db: AsyncSession = Depends(get_db)) -> AsyncIterator[AsyncSession]:
+        async with sessionmanager.replica_session(current_user.id) as session:
+            yield session if session is not None else db
+
+    return get_db_read
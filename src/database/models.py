@@ -2,8 +2,10 @@ import enum
 from datetime import date, datetime
 from typing import List
 
-from sqlalchemy import Date, DateTime, Enum, String, func
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy import (DDL, Date, DateTime, Enum, Index, SmallInteger, String,
+                        UniqueConstraint, event, func)
+from sqlalchemy.orm import (DeclarativeBase, Mapped, mapped_column, relationship,
+                            validates)
 from sqlalchemy.sql.schema import ForeignKey
 
 
@@ -43,6 +45,30 @@ class ContactType(enum.Enum):
     phone: str = "phone"
 
 
+def birthday_key(birthday: date | None) -> int | None:
+    """
+    The birthday_key function encodes the month and day of a date as month * 100 + day (e.g. 1228 for 28 Dec).
+    The key orders birthdays within a year regardless of the birth year, so upcoming birthdays are a range scan.
+
+    :param birthday: date | None: The birthday
+    :return: The month-day key or None
+    """
+    if birthday is None:
+        return None
+    return birthday.month * 100 + birthday.day
+
+
+def birthday_key_default(context) -> int | None:
+    """
+    The birthday_key_default function fills addressbook.birthday_key for Core inserts (bulk import).
+    ORM writes keep it in sync through AddressBookContact.validate_birthday.
+
+    :param context: The execution context of the insert
+    :return: The month-day key of the inserted birthday
+    """
+    return birthday_key(context.get_current_parameters().get("birthday"))
+
+
 class AddressBookContact(Base):
     """
     Represents a contact in the address book.
@@ -52,6 +78,7 @@ class AddressBookContact(Base):
         first_name (str): First name of the contact.
         last_name (str): Last name of the contact.
         birthday (date): Birthday of the contact.
+        birthday_key (int): Month and day of the birthday as month * 100 + day, kept in sync with birthday.
         user_id (int): User ID associated with the contact.
         created_at (datetime): Date and time of creation.
         updated_at (datetime): Date and time of the last update.
@@ -59,11 +86,29 @@ class AddressBookContact(Base):
     """
 
     __tablename__ = "addressbook"
+    __table_args__ = (
+        UniqueConstraint("user_id", "first_name", "last_name", name="uq_addressbook_user_id_name"),
+        Index("ix_addressbook_user_id_name", "user_id", "last_name", "first_name", "id"),
+        Index("ix_addressbook_user_id_birthday_key", "user_id", "birthday_key"),
+        Index(
+            "ix_addressbook_first_name_trgm",
+            "first_name",
+            postgresql_using="gin",
+            postgresql_ops={"first_name": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_addressbook_last_name_trgm",
+            "last_name",
+            postgresql_using="gin",
+            postgresql_ops={"last_name": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     first_name: Mapped[str] = mapped_column(String(55), nullable=False)
     last_name: Mapped[str] = mapped_column(String(55), nullable=False)
     birthday: Mapped[date] = mapped_column(Date)
+    birthday_key: Mapped[int] = mapped_column(SmallInteger, nullable=True, default=birthday_key_default)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
@@ -71,6 +116,21 @@ class AddressBookContact(Base):
 
     contacts: Mapped[List["Contact"]] = relationship(backref="addressbook", cascade="all, delete")
 
+    __mapper_args__ = {"eager_defaults": True}
+
+    @validates("birthday")
+    def validate_birthday(self, key: str, value: date | None) -> date | None:
+        """
+        The validate_birthday function keeps birthday_key in sync whenever the birthday is set.
+
+        :param self: Represent the instance of the class
+        :param key: str: The name of the attribute
+        :param value: date | None: The new birthday
+        :return: The birthday unchanged
+        """
+        self.birthday_key = birthday_key(value)
+        return value
+
 
 class Contact(Base):
     """
@@ -81,20 +141,35 @@ class Contact(Base):
         contact_type (ContactType): Type of the contact.
         contact_value (str): Value of the contact.
         contact_id (int): ID of the associated address book contact.
+        user_id (int): User ID of the address book owner, contact values are unique per user.
         created_at (datetime): Date and time of creation.
         updated_at (datetime): Date and time of the last update.
     """
 
     __tablename__ = "contacts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "contact_type", "contact_value", name="uq_contacts_user_id_type_value"),
+        Index("ix_contacts_contact_id_type", "contact_id", "contact_type"),
+        Index("ix_contacts_type_value", "contact_type", "contact_value"),
+        Index(
+            "ix_contacts_contact_value_trgm",
+            "contact_value",
+            postgresql_using="gin",
+            postgresql_ops={"contact_value": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     contact_type: Mapped[Enum] = mapped_column("contact_type", Enum(ContactType), nullable=False)
     contact_value: Mapped[str] = mapped_column(String(50), nullable=False)
     contact_id: Mapped[int] = mapped_column(ForeignKey("addressbook.id", ondelete="CASCADE"), nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
 
+    __mapper_args__ = {"eager_defaults": True}
+
 
 class User(Base):
     """
@@ -109,6 +184,7 @@ class User(Base):
         refresh_token (str): Refresh token of the user.
         avatar (str): Avatar URL of the user.
         roles (Role): Role of the user.
+        token_version (int): Version of the access tokens, incrementing it revokes the issued tokens.
         created_at (datetime): Date and time of creation.
         updated_at (datetime): Date and time of the last update.
         addressbook (List[AddressBookContact]): List of address book contacts associated with the user.
@@ -125,8 +201,50 @@ class User(Base):
     refresh_token: Mapped[str] = mapped_column(String(255), nullable=True)
     avatar: Mapped[str] = mapped_column(String(255), nullable=True)
     roles: Mapped[Enum] = mapped_column("roles", Enum(Role), default=Role.user)
+    token_version: Mapped[int] = mapped_column(default=0, server_default="0")
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
 
     addressbook: Mapped[List["AddressBookContact"]] = relationship(backref="users", cascade="all, delete")
+
+
+# Search indexes.
+# PostgreSQL serves the ILIKE search with the trigram GIN indexes declared on the tables above.
+# SQLite has no trigram operator class, so names and contact values are mirrored into an FTS5 table
+# with the trigram tokenizer. Triggers keep it in sync on every write; the rowid is id * 2 for names
+# and id * 2 + 1 for contact values, so each source row maps to exactly one FTS row.
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+
+addressbook_fts_ddl = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS addressbook_fts
+    USING fts5(body, abc_id UNINDEXED, user_id UNINDEXED, tokenize = 'trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS addressbook_fts_ai AFTER INSERT ON addressbook BEGIN
+        INSERT INTO addressbook_fts (rowid, body, abc_id, user_id)
+        VALUES (new.id * 2, new.first_name || ' ' || new.last_name, new.id, new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS addressbook_fts_au AFTER UPDATE OF first_name, last_name, user_id ON addressbook BEGIN
+        DELETE FROM addressbook_fts WHERE rowid = old.id * 2;
+        INSERT INTO addressbook_fts (rowid, body, abc_id, user_id)
+        VALUES (new.id * 2, new.first_name || ' ' || new.last_name, new.id, new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS addressbook_fts_ad AFTER DELETE ON addressbook BEGIN
+        DELETE FROM addressbook_fts WHERE rowid = old.id * 2;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN
+        INSERT INTO addressbook_fts (rowid, body, abc_id, user_id)
+        VALUES (new.id * 2 + 1, new.contact_value, new.contact_id, new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE OF contact_value, contact_id ON contacts BEGIN
+        DELETE FROM addressbook_fts WHERE rowid = old.id * 2 + 1;
+        INSERT INTO addressbook_fts (rowid, body, abc_id, user_id)
+        VALUES (new.id * 2 + 1, new.contact_value, new.contact_id, new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN
+        DELETE FROM addressbook_fts WHERE rowid = old.id * 2 + 1;
+    END""",
+]
+
+for statement in addressbook_fts_ddl:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Base.metadata, "after_drop", DDL("DROP TABLE IF EXISTS addressbook_fts").execute_if(dialect="sqlite"))
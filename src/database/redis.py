@@ -0,0 +1,256 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import AsyncIterator
+
+import redis.asyncio
+import redis.exceptions
+
+from src.conf.config import settings
+from src.services.metrics import REDIS_CALL_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(redis.exceptions.ConnectionError):
+    """
+    Raised instead of calling Redis while the circuit breaker is open.
+    It is a redis ConnectionError, so the callers handle it like any other outage.
+    """
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker of the calls to Redis.
+
+    After settings.redis_breaker_failures consecutive failures the circuit opens and calls fail at once,
+    without waiting for a timeout. After settings.redis_breaker_reset seconds one call is let through
+    as a probe: a success closes the circuit, a failure keeps it open for another period.
+
+    Attributes:
+        failures (int): The consecutive failures.
+        opened_at (float | None): When the circuit opened, None while it is closed.
+        trips (int): How many times the circuit opened.
+        probing (bool): If a probe call is in flight.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trips = 0
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        """
+        Returns the state of the circuit.
+
+        :return: "closed", "open" or "half-open" when a probe may be sent.
+        :rtype: str
+        """
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """
+        Tells if a call may be sent to Redis, in the half-open state only one probe at a time is allowed.
+
+        :return: True when the call may be sent.
+        :rtype: bool
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        """
+        Records a call answered by Redis and closes the circuit.
+
+        :return: None
+        """
+        if self.opened_at is not None:
+            logger.warning("Redis is reachable again, circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self) -> None:
+        """
+        Records a failed call, the circuit opens past the threshold or when the probe failed.
+
+        :return: None
+        """
+        self.failures += 1
+        if self.opened_at is not None:
+            self.opened_at = time.monotonic()
+        elif self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self.trips += 1
+            logger.warning("Redis failed %d times in a row, circuit opened", self.failures)
+        self.probing = False
+
+    def release(self) -> None:
+        """
+        Ends a call that neither reached Redis nor failed to, e.g. a cancelled one.
+
+        :return: None
+        """
+        self.probing = False
+
+
+class RedisManager:
+    """
+    A manager of the Redis connection pool shared by the whole application.
+
+    The pool is opened by the lifespan of the application and closed at shutdown. Code running outside
+    the application, e.g. scripts, gets a pool opened on first use. Tests replace the client with a fake one.
+    Calls made through guard share one circuit breaker, so an outage costs one timeout per breaker
+    threshold instead of one per request.
+
+    Attributes:
+        _pool (ConnectionPool): The connection pool.
+        _client (Redis): The client using the pool.
+        breaker (CircuitBreaker): The circuit breaker of the calls made through guard.
+
+    Methods:
+        init(self) -> Redis:
+            Opens the pool, it is a no-op when the pool is open.
+
+        guard(self) -> AsyncIterator[Redis]:
+            A context manager of a call to Redis through the circuit breaker.
+
+        close(self) -> None:
+            Closes the client and disconnects every connection of the pool.
+
+        stats(self) -> dict:
+            Returns the state of the connection pool.
+
+    Example:
+        redis_manager.init()
+        async with redis_manager.guard() as client:
+            await client.get("key")
+        await redis_manager.close()
+    """
+
+    def __init__(self):
+        self._pool: redis.asyncio.ConnectionPool | None = None
+        self._client: redis.asyncio.Redis | None = None
+        self.breaker = CircuitBreaker(settings.redis_breaker_failures, settings.redis_breaker_reset)
+
+    def init(self) -> redis.asyncio.Redis:
+        """
+        Opens the connection pool with the limits and timeouts of the settings.
+        Connections are made when they are first used, so this does not wait for Redis.
+
+        :return: The client using the pool.
+        :rtype: redis.asyncio.Redis
+        """
+        if self._client is None:
+            self._pool = redis.asyncio.ConnectionPool(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                password=settings.redis_password or None,
+                db=0,
+                encoding="utf-8",
+                max_connections=settings.redis_max_connections,
+                socket_timeout=settings.redis_socket_timeout,
+                socket_connect_timeout=settings.redis_connect_timeout,
+                health_check_interval=settings.redis_health_check_interval,
+                retry_on_timeout=True,
+            )
+            self._client = redis.asyncio.Redis(connection_pool=self._pool)
+        return self._client
+
+    @property
+    def client(self) -> redis.asyncio.Redis:
+        """
+        Returns the shared client, the pool is opened on first use.
+
+        :return: The Redis client.
+        :rtype: redis.asyncio.Redis
+        """
+        if self._client is None:
+            return self.init()
+        return self._client
+
+    @contextlib.asynccontextmanager
+    async def guard(self) -> AsyncIterator[redis.asyncio.Redis]:
+        """
+        A context manager of a call to Redis through the circuit breaker.
+        The call is cut after settings.redis_command_timeout seconds. Connection errors and timeouts are
+        counted by the breaker, while it is open CircuitOpenError is raised without calling Redis.
+        The duration of the call is recorded in REDIS_CALL_DURATION by its outcome.
+
+        :return: An async iterator that yields the Redis client.
+        :rtype: AsyncIterator[redis.asyncio.Redis]
+        """
+        if not self.breaker.allow():
+            REDIS_CALL_DURATION.labels("circuit_open").observe(0.0)
+            raise CircuitOpenError("Redis circuit is open")
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            async with asyncio.timeout(settings.redis_command_timeout):
+                yield self.client
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, OSError):
+            outcome = "failure"
+            self.breaker.failure()
+            raise
+        except redis.exceptions.RedisError:
+            outcome = "error"
+            self.breaker.success()
+            raise
+        except BaseException:
+            outcome = "other"
+            self.breaker.release()
+            raise
+        else:
+            self.breaker.success()
+        finally:
+            REDIS_CALL_DURATION.labels(outcome).observe(time.perf_counter() - start)
+
+    async def close(self) -> None:
+        """
+        Closes the client and disconnects every connection of the pool.
+
+        :return: None
+        """
+        client, pool = self._client, self._pool
+        self._client = self._pool = None
+        if client is not None:
+            await client.close()
+        if pool is not None:
+            await pool.disconnect()
+
+    def stats(self) -> dict:
+        """
+        Returns the state of the connection pool.
+
+        :return: A dictionary with the pool metrics.
+        :rtype: dict
+        """
+        pool = self._pool
+        breaker = {"circuit": self.breaker.state, "circuit_trips": self.breaker.trips}
+        if pool is None:
+            return {"open": self._client is not None, **breaker}
+        return {
+            "open": True,
+            **breaker,
+            "max_connections": pool.max_connections,
+            "created_connections": pool._created_connections,
+            "available_connections": len(pool._available_connections),
+            "in_use_connections": len(pool._in_use_connections),
+        }
+
+
+redis_manager = RedisManager()
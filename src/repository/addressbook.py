@@ -1,48 +1,174 @@
-from datetime import date, timedelta
+import base64
+import json
+from datetime import date, datetime, timedelta
 
+from asyncpg.exceptions import IntegrityConstraintViolationError
 from fastapi import HTTPException, status
-from sqlalchemy import and_, extract, or_, select
+from sqlalchemy import (and_, case, column, func, insert, literal, or_, select,
+                        table, tuple_, union_all)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 
+from src.database.db import sessionmanager
 from src.database.models import AddressBookContact as ABC
-from src.database.models import Contact, ContactType
+from src.database.models import Contact, ContactType, birthday_key
 from src.schemas.addressbook import (AddressbookCreate,
                                      AddressbookUpdateBirthday,
                                      AddressbookUpdateName, EmailCreate,
                                      PhoneCreate)
+from src.services.cache import contact_cache
 
+# Every read serialized as AddressbookResponse loads the contacts collection with one batched
+# "SELECT ... WHERE contacts.contact_id IN (...)", so a page of N entries always costs two queries.
+contacts_loader = selectinload(ABC.contacts)
 
-async def search_contacts(criteria: str, current_user: int, db: AsyncSession):
+
+async def contacts_changed(current_user: int, contact_id: int | None = None) -> None:
+    """
+    The contacts_changed function is called after every committed write to the address book of a user.
+    It starts the read-your-writes window of the user, so the next reads do not hit a lagging replica,
+    and invalidates the cached responses of the user.
+
+    :param current_user: int: The id of the user
+    :param contact_id: int | None: The id of the changed contact, None when contacts were only added
+    :return: None
+    """
+    await sessionmanager.mark_write(current_user)
+    await contact_cache.invalidate(current_user, contact_id)
+
+
+def encode_cursor(*key) -> str:
+    """
+    The encode_cursor function builds an opaque pagination cursor from the sort key of the last row of a page.
+
+    :param key: The values of the sort key, e.g. (last_name, first_name, id)
+    :return: A url-safe cursor string
+    """
+    raw = json.dumps(list(key), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    """
+    The decode_cursor function restores the sort key encoded by encode_cursor.
+    Every value is converted with the matching type, so a tampered cursor is rejected with 400.
+
+    :param cursor: str: The cursor received from the client
+    :param types: type: The expected type of every value of the key
+    :return: A tuple with the values of the sort key
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(key, list) or len(key) != len(types):
+            raise ValueError(cursor)
+        return tuple(cast(value) for cast, value in zip(types, key))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def like_pattern(criteria: str) -> str:
+    """
+    The like_pattern function wraps the criteria in % wildcards for a "contains" LIKE,
+    escaping the LIKE wildcards typed by the user with a backslash.
+
+    :param criteria: str: The text to search for
+    :return: A LIKE pattern to be used with escape="\\"
+    """
+    escaped = criteria.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_matches(criteria: str, current_user: int, dialect: str):
+    """
+    The search_matches function builds a subquery of (abc_id, score) rows for every name or contact value
+    of the user that contains the criteria. A lower score is a better match.
+
+    On SQLite the addressbook_fts table is queried with MATCH and ranked with bm25.
+    On PostgreSQL every branch is an ILIKE served by a trigram GIN index and ranked by similarity.
+    Other backends fall back to plain ILIKE with an equal score.
+
+    :param criteria: str: The text to search for
+    :param current_user: int: Filter the results to only return contacts that belong to the current user
+    :param dialect: str: The name of the database dialect
+    :return: A subquery with abc_id and score columns
+    """
+
+    pattern = like_pattern(criteria)
+
+    if dialect == "sqlite":
+        fts = table("addressbook_fts", column("body"), column("abc_id"), column("user_id"), column("rank"))
+        if len(criteria) >= 3:
+            phrase = '"' + criteria.replace('"', '""') + '"'
+            return select(fts.c.abc_id, fts.c.rank.label("score")).where(fts.c.body.match(phrase), fts.c.user_id == current_user).subquery()
+        # The trigram tokenizer cannot match less than three characters, so short criteria scan the FTS table.
+        return (
+            select(fts.c.abc_id, literal(0.0).label("score"))
+            .where(fts.c.body.ilike(pattern, escape="\\"), fts.c.user_id == current_user)
+            .subquery()
+        )
+
+    def score(value):
+        if dialect == "postgresql":
+            return -func.similarity(value, criteria)
+        return literal(0.0)
+
+    return union_all(
+        select(ABC.id.label("abc_id"), score(ABC.first_name).label("score")).where(
+            ABC.user_id == current_user, ABC.first_name.ilike(pattern, escape="\\")
+        ),
+        select(ABC.id.label("abc_id"), score(ABC.last_name).label("score")).where(
+            ABC.user_id == current_user, ABC.last_name.ilike(pattern, escape="\\")
+        ),
+        select(Contact.contact_id.label("abc_id"), score(Contact.contact_value).label("score"))
+        .join(ABC, ABC.id == Contact.contact_id)
+        .where(ABC.user_id == current_user, Contact.contact_value.ilike(pattern, escape="\\")),
+    ).subquery()
+
+
+async def search_contacts(criteria: str, limit: int, cursor: str | None, current_user: int, db: AsyncSession):
     """
     The search_contacts function takes in a string of criteria and the current user's id,
-    and returns all contacts that match the search criteria. The search is case-insensitive.
+    and returns one ranked page of contacts that match the search criteria. The search is case-insensitive.
+    Contacts are ranked by their best matching name or contact value and paginated with a (score, id) cursor.
+    The total number of hits is computed with a window function in the same query.
 
     :param criteria: str: Search for the user's contacts
+    :param limit: int: Limit the number of results returned
+    :param cursor: str | None: The cursor returned with the previous page
     :param current_user: int: Filter the results to only return contacts that belong to the current user
     :param db: AsyncSession: Pass the database session to the function
-    :return: A list of contacts
+    :return: A tuple of the contacts of the page, the total number of hits and the cursor of the next page
     """
 
-    query = (
-        select(ABC)
-        .join(Contact)
-        .where(
-            and_(
-                ABC.user_id == current_user,
-                or_(
-                    ABC.first_name.ilike(f"%{criteria}%"),
-                    ABC.last_name.ilike(f"%{criteria}%"),
-                    Contact.contact_value.ilike(f"%{criteria}%"),
-                ),
-            )
-        )
-        .distinct()
+    dialect = db.get_bind().dialect.name
+    matches = search_matches(criteria, current_user, dialect)
+    ranked = (
+        select(matches.c.abc_id, func.min(matches.c.score).label("score"), func.count().over().label("total"))
+        .group_by(matches.c.abc_id)
+        .subquery()
     )
 
+    query = select(ABC, ranked.c.score, ranked.c.total).options(contacts_loader).join(ranked, ABC.id == ranked.c.abc_id)
+    if cursor:
+        score, contact_id = decode_cursor(cursor, float, int)
+        query = query.where(or_(ranked.c.score > score, and_(ranked.c.score == score, ranked.c.abc_id > contact_id)))
+    query = query.order_by(ranked.c.score, ranked.c.abc_id).limit(limit + 1)
+
     address_book = await db.execute(query)
-    result = address_book.scalars().all()
-    return result
+    rows = address_book.all()
+
+    if rows:
+        total = rows[0].total
+    else:
+        total = (await db.execute(select(func.count()).select_from(ranked))).scalar() or 0
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].score, rows[-1][0].id)
+    return [row[0] for row in rows], total, next_cursor
 
 
 async def get_contacts(skip: int, limit: int, current_user: int, db: AsyncSession):
@@ -52,6 +178,7 @@ async def get_contacts(skip: int, limit: int, current_user: int, db: AsyncSessio
         Skip is an integer that determines how many contacts to skip over before returning results.
         Limit is an integer that determines how many results to return after skipping over the specified number of contacts.
         Current_user is an integer representing the user whose address book we are querying.
+        This is the compatibility path of get_contacts_page, deep pages should be read with a cursor.
 
     :param skip: int: Skip the first n records
     :param limit: int: Limit the number of results returned
@@ -60,14 +187,71 @@ async def get_contacts(skip: int, limit: int, current_user: int, db: AsyncSessio
     :return: A list of contacts
     """
 
-    abc_alias = aliased(ABC)
-    contact_alias = aliased(Contact)
-    query = select(abc_alias).join(contact_alias).where(abc_alias.user_id == current_user).offset(skip).limit(limit)
+    query = (
+        select(ABC)
+        .options(contacts_loader)
+        .where(ABC.user_id == current_user)
+        .order_by(ABC.last_name, ABC.first_name, ABC.id)
+        .offset(skip)
+        .limit(limit)
+    )
     address_book = await db.execute(query)
     result = address_book.scalars().all()
     return result
 
 
+async def get_contacts_page(cursor: str | None, limit: int, current_user: int, db: AsyncSession):
+    """
+    The get_contacts_page function returns one page of contacts using keyset pagination.
+        Contacts are ordered by (last_name, first_name, id) and the page starts right after the key
+        stored in the cursor, so the cost of a page does not depend on how deep it is.
+
+    :param cursor: str | None: The cursor returned with the previous page, None or empty for the first page
+    :param limit: int: Limit the number of results returned
+    :param current_user: int: Filter the results to only return contacts that belong to the current user
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A tuple of the contacts of the page and the cursor of the next page
+    """
+
+    query = select(ABC).options(contacts_loader).where(ABC.user_id == current_user)
+    if cursor:
+        query = query.where(tuple_(ABC.last_name, ABC.first_name, ABC.id) > tuple_(*decode_cursor(cursor, str, str, int)))
+    query = query.order_by(ABC.last_name, ABC.first_name, ABC.id).limit(limit + 1)
+
+    address_book = await db.execute(query)
+    result = list(address_book.scalars().all())
+
+    next_cursor = None
+    if len(result) > limit:
+        result = result[:limit]
+        next_cursor = encode_cursor(result[-1].last_name, result[-1].first_name, result[-1].id)
+    return result, next_cursor
+
+
+async def stream_contacts(current_user: int, chunk_size: int, db: AsyncSession):
+    """
+    The stream_contacts function reads the whole address book of a user through a server-side cursor.
+        Rows are fetched chunk_size at a time and the contacts of every chunk are loaded with one batched query,
+        so memory use does not depend on the size of the address book.
+
+    :param current_user: int: Filter the results to only return contacts that belong to the current user
+    :param chunk_size: int: The number of contacts fetched per round trip
+    :param db: AsyncSession: Pass the database session to the function
+    :return: An async iterator of lists of contacts
+    """
+
+    query = (
+        select(ABC)
+        .options(contacts_loader)
+        .where(ABC.user_id == current_user)
+        .order_by(ABC.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    address_book = await db.stream(query)
+    async for partition in address_book.scalars().partitions():
+        yield partition
+
+
 async def get_contact(db: AsyncSession, contact_id: int, current_user: int) -> ABC | None:
     """
     The get_contact function is used to retrieve a single contact from the address book.
@@ -79,9 +263,7 @@ async def get_contact(db: AsyncSession, contact_id: int, current_user: int) -> A
     :return: A contact from the database
     """
 
-    abc_alias = aliased(ABC)
-    contact_alias = aliased(Contact)
-    query = select(abc_alias).join(contact_alias).where(and_(abc_alias.user_id == current_user, abc_alias.id == contact_id))
+    query = select(ABC).options(contacts_loader).where(and_(ABC.user_id == current_user, ABC.id == contact_id))
 
     address_book = await db.execute(query)
     result = address_book.scalars().one_or_none()
@@ -89,6 +271,46 @@ async def get_contact(db: AsyncSession, contact_id: int, current_user: int) -> A
     return result
 
 
+async def contact_conflict(
+    db: AsyncSession, error: IntegrityError, email_create: EmailCreate, phone_create: PhoneCreate, current_user: int
+) -> HTTPException:
+    """
+    The contact_conflict function maps an IntegrityError raised by the unique constraints of a new contact
+    to the 409 response of the constraint that was violated.
+    Names are recognized from the error message, emails and phones need one lookup because SQLite
+    reports the same columns for both of them. It only runs on the error path.
+
+    :param db: AsyncSession: Pass the database session to the function, after the rollback
+    :param error: IntegrityError: The error raised by the commit
+    :param email_create: EmailCreate: The email of the new contact
+    :param phone_create: PhoneCreate: The phone of the new contact
+    :param current_user: int: Get the current user's id
+    :return: An HTTPException to raise, the original error if no unique constraint was violated
+    """
+    message = str(error.orig)
+    if "uq_addressbook_user_id_name" in message or "UNIQUE constraint failed: addressbook." in message:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Contact with first_name and last_name already exists!",
+        )
+
+    query = select(Contact.contact_type).where(
+        Contact.user_id == current_user,
+        or_(
+            and_(Contact.contact_type == ContactType.email, Contact.contact_value == email_create.email),
+            and_(Contact.contact_type == ContactType.phone, Contact.contact_value == phone_create.phone),
+        ),
+    )
+    existing = await db.execute(query)
+    contact_types = set(existing.scalars().all())
+
+    if ContactType.email in contact_types:
+        return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email is exists!")
+    if ContactType.phone in contact_types:
+        return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Phone is exists!")
+    raise error
+
+
 async def create_contact(
     db: AsyncSession,
     contact_create: AddressbookCreate,
@@ -98,6 +320,9 @@ async def create_contact(
 ) -> ABC:
     """
     The create_contact function creates a new contact in the address book.
+        The contact, its email and its phone are inserted in one transaction with a single flush.
+        Duplicates are rejected by the unique constraints of the database, which also closes the race
+        between checking and inserting, and are reported with the same 409 messages as before.
 
     :param db: AsyncSession: Pass the database session to the function
     :param contact_create: AddressbookCreate: Create a new contact
@@ -107,91 +332,19 @@ async def create_contact(
     :return: A contact object
     """
 
-    db_contact = ABC(**contact_create.model_dump())
+    db_contact = ABC(**contact_create.model_dump(), user_id=current_user)
+    db_contact.contacts = [
+        Contact(contact_type=ContactType.email, contact_value=email_create.email, user_id=current_user),
+        Contact(contact_type=ContactType.phone, contact_value=phone_create.phone, user_id=current_user),
+    ]
+    db.add(db_contact)
 
-    db_contact.user_id = current_user
-    abc_alias = aliased(ABC)
-    contact_alias = aliased(Contact)
-
-    if db_contact:
-        query = (
-            select(abc_alias)
-            .join(contact_alias)
-            .where(
-                and_(
-                    abc_alias.user_id == current_user,
-                    abc_alias.first_name == db_contact.first_name,
-                    abc_alias.last_name == db_contact.last_name,
-                )
-            )
-        )
-
-        contact = await db.execute(query)
-        existing_contact = contact.fetchone()
-
-        if existing_contact and existing_contact[0] != db_contact.id:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Contact with first_name and last_name already exists!",
-            )
-
-        query = (
-            select(abc_alias)
-            .join(contact_alias)
-            .where(
-                and_(
-                    abc_alias.user_id == current_user,
-                    Contact.contact_type == ContactType.email,
-                    Contact.contact_value == email_create.email,
-                )
-            )
-        )
-        emails = await db.execute(query)
-        existing_email = emails.fetchone()
-
-        if existing_email:
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email is exists!")
-
-        query = (
-            select(abc_alias)
-            .join(contact_alias)
-            .where(
-                and_(
-                    abc_alias.user_id == current_user,
-                    Contact.contact_type == ContactType.phone,
-                    Contact.contact_value == phone_create.phone,
-                )
-            )
-        )
-        phones = await db.execute(query)
-        existing_phone = phones.fetchone()
-
-        if existing_phone:
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Phone is exists!")
-
-        db.add(db_contact)
-        await db.commit()
-        await db.refresh(db_contact)
-
-        email = Contact(
-            contact_type=ContactType.email,
-            contact_value=email_create.email,
-            contact_id=db_contact.id,
-        )
-
-        db.add(email)
-        await db.commit()
-        await db.refresh(email)
-
-        phone = Contact(
-            contact_type=ContactType.phone,
-            contact_value=phone_create.phone,
-            contact_id=db_contact.id,
-        )
-
-        db.add(phone)
+    try:
         await db.commit()
-        await db.refresh(phone)
+    except IntegrityError as error:
+        await db.rollback()
+        raise await contact_conflict(db, error, email_create, phone_create, current_user)
+    await contacts_changed(current_user)
 
     return db_contact
 
@@ -225,9 +378,15 @@ async def add_phone_to_contact(db: AsyncSession, phone_create: PhoneCreate, curr
         contact_type=ContactType.phone,
         contact_value=phone_create.phone,
         contact_id=contact_id,
+        user_id=current_user,
     )
     db.add(new_phone)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Phone is exists!")
+    await contacts_changed(current_user, contact_id)
     await db.refresh(new_phone)
 
     return new_phone
@@ -262,9 +421,15 @@ async def add_email_to_contact(db: AsyncSession, email_create: EmailCreate, curr
         contact_type=ContactType.email,
         contact_value=email_create.email,
         contact_id=contact_id,
+        user_id=current_user,
     )
     db.add(new_email)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email is exists!")
+    await contacts_changed(current_user, contact_id)
     await db.refresh(new_email)
 
     return new_email
@@ -301,7 +466,15 @@ async def update_contact_name(db: AsyncSession, body: AddressbookUpdateName, cur
 
     contact.first_name = body.first_name
     contact.last_name = body.last_name
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Contact with the same first and last name already exists",
+        )
+    await contacts_changed(current_user, contact_id)
     await db.refresh(contact)
 
     return contact
@@ -327,6 +500,7 @@ async def update_contact_birthday(db: AsyncSession, body: AddressbookUpdateBirth
 
     contact.birthday = body.birthday
     await db.commit()
+    await contacts_changed(current_user, contact_id)
     await db.refresh(contact)
 
     return contact
@@ -354,15 +528,20 @@ async def remove_contact(db: AsyncSession, current_user: int, contact_id: int) -
     try:
         await db.delete(contact)
         await db.commit()
-        return contact
     except Exception as error:
         await db.rollback()
         raise error
 
+    await contacts_changed(current_user, contact_id)
+    return contact
+
 
 async def read_contact_days_to_birthday(db: AsyncSession, days_to_birthday: int, current_user: int):
     """
     The read_contact_days_to_birthday function returns a list of contacts that have birthdays within the next X days.
+        The window is a range on the indexed birthday_key (month * 100 + day). When it crosses the new year
+        it is split into the end of this year and the beginning of the next one.
+        Contacts are ordered by the number of days left until their birthday.
 
     :param db: AsyncSession: Connect to the database
     :param days_to_birthday: int: Specify the number of days to look ahead for upcoming birthdays
@@ -371,24 +550,159 @@ async def read_contact_days_to_birthday(db: AsyncSession, days_to_birthday: int,
     """
     today = date.today()
     end_date = today + timedelta(days=days_to_birthday)
+    start_key = birthday_key(today)
+    end_key = birthday_key(end_date)
+
+    if end_date.year == today.year:
+        window = ABC.birthday_key.between(start_key, end_key)
+    else:
+        window = or_(ABC.birthday_key >= start_key, ABC.birthday_key <= end_key)
 
     upcoming_birthday_contacts_query = (
         select(ABC)
-        .where(
-            and_(
-                ABC.user_id == current_user,
-                ABC.birthday.isnot(None),
-                extract("month", ABC.birthday) == end_date.month,
-                extract("day", ABC.birthday) <= end_date.day,
-                extract("month", ABC.birthday) >= today.month,
-            )
-        )
-        .order_by(ABC.birthday)
+        .options(contacts_loader)
+        .where(and_(ABC.user_id == current_user, window))
+        .order_by(case((ABC.birthday_key >= start_key, 0), else_=1), ABC.birthday_key, ABC.id)
     )
 
     upcoming_birthday_contacts = await db.execute(upcoming_birthday_contacts_query)
     results = upcoming_birthday_contacts.scalars().all()
 
-    filtered_results = [contact for contact in results if (contact.birthday - today).days <= days_to_birthday]
+    return results
+
 
-    return filtered_results
+async def import_contacts(
+    db: AsyncSession, rows: list[tuple[int, AddressbookCreate, EmailCreate, PhoneCreate]], current_user: int
+) -> list[tuple[int, str]]:
+    """
+    The import_contacts function inserts one batch of validated import rows.
+        Duplicates of existing contacts, emails and phones (and of earlier rows of the same batch) are found
+        with two lookups for the whole batch and reported per row. The remaining rows are inserted with
+        multi-row statements, or with COPY on PostgreSQL, and committed once.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param rows: list[tuple[int, AddressbookCreate, EmailCreate, PhoneCreate]]: The line number and the schemas of every row
+    :param current_user: int: Get the current user's id
+    :return: A list of (line, detail) for the rows that were not imported
+    """
+
+    errors: list[tuple[int, str]] = []
+    if not rows:
+        return errors
+
+    names = [(contact.first_name, contact.last_name) for _, contact, _, _ in rows]
+    values = [email.email for _, _, email, _ in rows] + [phone.phone for _, _, _, phone in rows]
+    existing_names = await db.execute(
+        select(ABC.first_name, ABC.last_name).where(ABC.user_id == current_user, tuple_(ABC.first_name, ABC.last_name).in_(names))
+    )
+    existing_values = await db.execute(
+        select(Contact.contact_type, Contact.contact_value).where(Contact.user_id == current_user, Contact.contact_value.in_(values))
+    )
+    seen_names = {tuple(row) for row in existing_names.all()}
+    seen_values = {tuple(row) for row in existing_values.all()}
+
+    accepted = []
+    for line, contact, email, phone in rows:
+        if (contact.first_name, contact.last_name) in seen_names:
+            errors.append((line, "Contact with first_name and last_name already exists!"))
+        elif (ContactType.email, email.email) in seen_values:
+            errors.append((line, "Email is exists!"))
+        elif (ContactType.phone, phone.phone) in seen_values:
+            errors.append((line, "Phone is exists!"))
+        else:
+            seen_names.add((contact.first_name, contact.last_name))
+            seen_values.update({(ContactType.email, email.email), (ContactType.phone, phone.phone)})
+            accepted.append((line, contact, email, phone))
+
+    if not accepted:
+        return errors
+
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            await copy_contacts(db, accepted, current_user)
+        else:
+            await insert_contacts(db, accepted, current_user)
+        await db.commit()
+    except IntegrityError:
+        # A concurrent write took one of the names or values, retry the rows one by one.
+        await db.rollback()
+        for line, contact, email, phone in accepted:
+            try:
+                async with db.begin_nested():
+                    await insert_contacts(db, [(line, contact, email, phone)], current_user)
+            except IntegrityError:
+                errors.append((line, "Contact, email or phone already exists!"))
+        await db.commit()
+    await contacts_changed(current_user)
+
+    return errors
+
+
+async def insert_contacts(
+    db: AsyncSession, rows: list[tuple[int, AddressbookCreate, EmailCreate, PhoneCreate]], current_user: int
+) -> None:
+    """
+    The insert_contacts function inserts contacts with their email and phone using two multi-row INSERT statements.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param rows: list[tuple[int, AddressbookCreate, EmailCreate, PhoneCreate]]: The rows to insert
+    :param current_user: int: Get the current user's id
+    :return: None
+    """
+
+    inserted = await db.execute(
+        insert(ABC).returning(ABC.id, sort_by_parameter_order=True),
+        [dict(contact.model_dump(), user_id=current_user) for _, contact, _, _ in rows],
+    )
+    ids = inserted.scalars().all()
+    contacts = []
+    for contact_id, (_, _, email, phone) in zip(ids, rows):
+        contacts.append(dict(contact_type=ContactType.email, contact_value=email.email, contact_id=contact_id, user_id=current_user))
+        contacts.append(dict(contact_type=ContactType.phone, contact_value=phone.phone, contact_id=contact_id, user_id=current_user))
+    await db.execute(insert(Contact), contacts)
+
+
+async def copy_contacts(
+    db: AsyncSession, rows: list[tuple[int, AddressbookCreate, EmailCreate, PhoneCreate]], current_user: int
+) -> None:
+    """
+    The copy_contacts function loads contacts with their email and phone with COPY on PostgreSQL (asyncpg).
+    The ids of the new contacts are reserved from the sequence first, so the contacts rows can reference them.
+    COPY runs on the driver connection, its constraint violations are raised as IntegrityError like the ones of SQLAlchemy.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param rows: list[tuple[int, AddressbookCreate, EmailCreate, PhoneCreate]]: The rows to insert
+    :param current_user: int: Get the current user's id
+    :return: None
+    """
+
+    reserved = await db.execute(select(func.nextval("addressbook_id_seq")).select_from(func.generate_series(1, len(rows))))
+    ids = reserved.scalars().all()
+    now = datetime.utcnow()
+
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+
+    records = [
+        (contact_id, contact.first_name, contact.last_name, contact.birthday, birthday_key(contact.birthday), current_user, now, now)
+        for contact_id, (_, contact, _, _) in zip(ids, rows)
+    ]
+    contacts = []
+    for contact_id, (_, _, email, phone) in zip(ids, rows):
+        contacts.append((ContactType.email.name, email.email, contact_id, current_user, now, now))
+        contacts.append((ContactType.phone.name, phone.phone, contact_id, current_user, now, now))
+
+    try:
+        await driver_connection.copy_records_to_table(
+            ABC.__tablename__,
+            columns=["id", "first_name", "last_name", "birthday", "birthday_key", "user_id", "created_at", "updated_at"],
+            records=records,
+        )
+        await driver_connection.copy_records_to_table(
+            Contact.__tablename__,
+            columns=["contact_type", "contact_value", "contact_id", "user_id", "created_at", "updated_at"],
+            records=contacts,
+        )
+    except IntegrityConstraintViolationError as error:
+        raise IntegrityError("COPY", None, error) from error
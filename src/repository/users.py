@@ -4,6 +4,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas.user import UserModel
+from src.services.cache import user_cache
+from src.services.refresh_tokens import refresh_tokens
 
 
 async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
@@ -53,8 +55,10 @@ async def update_token(user: User, refresh_token: str | None, db: AsyncSession)
     :return: The updated user
     """
     if refresh_token:
+        email = user.email
         user.refresh_token = refresh_token
         await db.commit()
+        await user_cache.invalidate(email)
 
 
 async def confirmed_email(email: str, db: AsyncSession) -> None:
@@ -71,6 +75,7 @@ async def confirmed_email(email: str, db: AsyncSession) -> None:
     if user:
         user.confirmed = True
         await db.commit()
+        await user_cache.invalidate(email)
 
 
 async def update_avatar(email, url: str, db: AsyncSession) -> User | None:
@@ -90,10 +95,11 @@ async def update_avatar(email, url: str, db: AsyncSession) -> User | None:
         user.avatar = url
         try:
             await db.commit()
-            return user
         except Exception as e:
             await db.rollback()
             raise e
+        await user_cache.invalidate(email)
+        return user
     return None
 
 
@@ -102,6 +108,8 @@ async def change_password(user: User, password: str, db: AsyncSession) -> User:
     The change_password function takes in a user, body, and db.
     The function then sets the password of the user to be equal to the confirm_password field of body.
     It then adds this new information into our database and commits it.
+    The token version is incremented, so the access tokens issued before are revoked,
+    and the refresh token families of the user are revoked.
     Finally, we refresh our database with this new information.
 
     :param user: User: Get the user object from the database
@@ -109,10 +117,14 @@ async def change_password(user: User, password: str, db: AsyncSession) -> User:
     :param db: AsyncSession: Access the database
     :return: The user object with the new password
     """
+    email = user.email
     user.password = password
+    user.token_version = (user.token_version or 0) + 1
     try:
         await db.commit()
-        return user
     except Exception as e:
         await db.rollback()
         raise e
+    await user_cache.invalidate(email)
+    await refresh_tokens.revoke_user(email)
+    return user
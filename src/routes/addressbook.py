@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, status
+from datetime import date
+
+from fastapi import (APIRouter, Depends, File, HTTPException, Path, Query,
+                     Response, UploadFile, status)
 from fastapi.templating import Jinja2Templates
-from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
-from src.database.models import AddressBookContact as ABC
-from src.database.models import Role, User
+from src.database.db import get_db, read_your_writes_db
+from src.database.models import Role
 from src.repository import addressbook as repository_addressbook
-from src.schemas.addressbook import (AddressbookCreate, AddressbookResponse,
+from src.schemas.addressbook import (AddressbookCreate, AddressbookPage,
+                                     AddressbookResponse, AddressbookSearchPage,
                                      AddressbookUpdateBirthday,
                                      AddressbookUpdateName, EmailCreate,
-                                     PhoneCreate)
+                                     ImportReport, PhoneCreate)
+from src.schemas.user import UserClaims
+from src.services import contacts_export, contacts_import
 from src.services.auth import auth_service
+from src.services.cache import contact_cache
+from src.services.rate_limit import RateLimit
 from src.services.roles import RoleAccess
 
 allowed_operation_get = RoleAccess([Role.admin, Role.moderator, Role.user])
@@ -23,6 +29,8 @@ templates = Jinja2Templates(directory="src/templates")
 
 router = APIRouter(prefix="/contacts", tags=["contacts"])
 
+get_db_read = read_your_writes_db(auth_service.get_current_claims)
+
 
 @router.get(
     "/",
@@ -32,44 +40,96 @@ router = APIRouter(prefix="/contacts", tags=["contacts"])
 async def read_contacts(
     skip: int = 0,
     limit: int = 10,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_db_read),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
     The read_contacts function returns a list of contacts from the addressbook.
+        When a cursor is passed (an empty one for the first page) the contacts are read with keyset pagination
+        and the response is an AddressbookPage with the next_cursor to continue from.
+        Without a cursor the skip/limit list is returned as before.
+        Responses are cached per user until the next write to the address book.
 
     :param skip: int: Skip the first n records
     :param limit: int: Limit the number of contacts returned
+    :param cursor: str | None: The next_cursor of the previous page
     :param db: AsyncSession: Pass the database session to the function
-    :param current_user: User: Get the user id
-    :return: A list of contacts from the addressbook
+    :param current_user: UserClaims: Get the user id
+    :return: A list of contacts from the addressbook or a page of contacts
     """
 
-    addressbook = await repository_addressbook.get_contacts(skip, limit, current_user.id, db)
-    return addressbook
+    async def load():
+        if cursor is not None:
+            items, next_cursor = await repository_addressbook.get_contacts_page(cursor, limit, current_user.id, db)
+            return AddressbookPage.model_validate({"items": items, "next_cursor": next_cursor}, from_attributes=True)
+        return await repository_addressbook.get_contacts(skip, limit, current_user.id, db)
+
+    params = {"skip": skip, "limit": limit, "cursor": cursor}
+    return await contact_cache.list_response(current_user.id, "list", params, load)
 
 
 @router.get(
     "/search/{search}",
+    response_model=AddressbookSearchPage,
     dependencies=[Depends(allowed_operation_get)],
     description="User, moderators and admin",
 )
 async def search_by_criteria(
-    criteria: str, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)
+    criteria: str,
+    limit: int = Query(default=10, ge=1, le=100),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_db_read),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
     The search_by_criteria function searches for contacts in the addressbook by a given criteria.
-        The search is performed on the first name, last name and email fields of each contact.
-        If no matches are found, an empty list is returned.
+        The search is performed on the first name, last name, emails and phones of each contact.
+        Results are ranked by relevance and returned one page at a time, with the total number of hits.
+        If no matches are found, an empty page is returned.
+        Pages are cached per user until the next write to the address book.
 
     :param criteria: str: Search the database for a specific contact
+    :param limit: int: Limit the number of contacts returned
+    :param cursor: str | None: The next_cursor of the previous page
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the current user from the database
-    :return: A list of contacts
+    :param current_user: UserClaims: Get the current user from the database
+    :return: A page of contacts
     """
 
-    addressbook = await repository_addressbook.search_contacts(criteria, current_user.id, db)
-    return addressbook
+    async def load():
+        items, total, next_cursor = await repository_addressbook.search_contacts(criteria, limit, cursor, current_user.id, db)
+        return AddressbookSearchPage.model_validate(
+            {"items": items, "total": total, "next_cursor": next_cursor}, from_attributes=True
+        )
+
+    params = {"criteria": criteria, "limit": limit, "cursor": cursor}
+    return await contact_cache.list_response(current_user.id, "search", params, load)
+
+
+@router.get(
+    "/export",
+    dependencies=[Depends(allowed_operation_get)],
+    description="User, moderators and admin",
+)
+async def export_contacts(
+    file_format: str = Query(default="ndjson", alias="format"),
+    gzip: bool = False,
+    db: AsyncSession = Depends(get_db_read),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
+):
+    """
+    The export_contacts function streams the whole addressbook of the user with all phones and emails.
+        The contacts are read from a server-side cursor in fixed-size chunks and written to the response
+        as they arrive, so memory stays flat for address books of any size.
+
+    :param file_format: str: ndjson (default) or csv
+    :param gzip: bool: Compress the response with gzip
+    :param db: AsyncSession: Get the database session
+    :param current_user: UserClaims: Get the current user from the database
+    :return: A streaming response
+    """
+    return contacts_export.export_contacts(file_format, gzip, current_user.id, db)
 
 
 @router.get(
@@ -79,34 +139,40 @@ async def search_by_criteria(
     description="User, moderators and admin",
 )
 async def read_contact(
-    contact_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)
-) -> ABC:
+    contact_id: int, db: AsyncSession = Depends(get_db_read), current_user: UserClaims = Depends(auth_service.get_current_claims)
+) -> Response:
     """
     The read_contact function returns a contact by its id.
+        The serialized contact is read through the Redis cache, the repository functions that change
+        a contact drop its cache entry.
 
     :param contact_id: int: Get the contact id from the url
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the user who is currently logged in
-    :return: A contact object
+    :param current_user: UserClaims: Get the user who is currently logged in
+    :return: The contact as an AddressbookResponse document
     """
-    contact = await repository_addressbook.get_contact(db, contact_id, current_user.id)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+    payload, version = await contact_cache.get_contact(current_user.id, contact_id)
+    if payload is None:
+        contact = await repository_addressbook.get_contact(db, contact_id, current_user.id)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+        payload = AddressbookResponse.model_validate(contact, from_attributes=True).model_dump_json()
+        await contact_cache.set_contact(current_user.id, contact_id, payload, version)
+    return Response(content=payload, media_type="application/json")
 
 
 @router.post(
     "/",
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Depends(allowed_operation_get), Depends(RateLimiter(times=10, seconds=60))],
-    description="The User, moderator and administrator have access to this action! No more than 10 requests per minute",
+    dependencies=[Depends(allowed_operation_get), Depends(RateLimit("contacts:create"))],
+    description="The User, moderator and administrator have access to this action! No more than 10 requests per minute by default",
 )
 async def create_contact(
     email_create: EmailCreate,
     phone_create: PhoneCreate,
     contact_create: AddressbookCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
     The create_contact function creates a new contact in the addressbook.
@@ -118,7 +184,7 @@ async def create_contact(
     :param phone_create: PhoneCreate: Create a new phone number for the contact
     :param contact_create: AddressbookCreate: Create a contact
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the user who is logged in
+    :param current_user: UserClaims: Get the user who is logged in
     :return: The contact
     """
     contact = await repository_addressbook.create_contact(db, contact_create, email_create, phone_create, current_user.id)
@@ -127,17 +193,44 @@ async def create_contact(
     return contact
 
 
+@router.post(
+    "/import",
+    response_model=ImportReport,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(allowed_operation_get), Depends(RateLimit("contacts:import"))],
+    description="The User, moderator and administrator have access to this action! No more than 10 requests per minute by default",
+)
+async def import_contacts(
+    file: UploadFile = File(),
+    file_format: str | None = Query(default=None, alias="format"),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
+):
+    """
+    The import_contacts function creates contacts in bulk from an uploaded CSV or JSONL file.
+        Every row holds first_name, last_name, birthday, email and phone and is validated like a single create.
+        The file is processed as a stream in batches; rejected rows are reported and do not abort the import.
+
+    :param file: UploadFile: The CSV or JSONL file
+    :param file_format: str | None: csv or jsonl, taken from the file extension when omitted
+    :param db: AsyncSession: Get the database session
+    :param current_user: UserClaims: Get the user who is logged in
+    :return: The import report
+    """
+    return await contacts_import.import_contacts(file, file_format, current_user.id, db)
+
+
 @router.post(
     "/add_phone/{contact_id}",
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Depends(allowed_operation_get), Depends(RateLimiter(times=10, seconds=60))],
-    description="The User, moderator and administrator have access to this action! No more than 10 requests per minute",
+    dependencies=[Depends(allowed_operation_get), Depends(RateLimit("contacts:add_phone"))],
+    description="The User, moderator and administrator have access to this action! No more than 10 requests per minute by default",
 )
 async def add_phone_to_contact(
     contact_id: int,
     phone_create: PhoneCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
     The add_phone_to_contact function adds a phone to an existing contact.
@@ -150,7 +243,7 @@ async def add_phone_to_contact(
     :param contact_id: int: Identify the contact to which we want to add a phone number
     :param phone_create: PhoneCreate: Create a new phone object
     :param db: AsyncSession: Access the database
-    :param current_user: User: Get the current user
+    :param current_user: UserClaims: Get the current user
 
     :return: The contact with the added phone
     """
@@ -163,14 +256,14 @@ async def add_phone_to_contact(
 @router.post(
     "/add_email/{contact_id}",
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Depends(allowed_operation_get), Depends(RateLimiter(times=10, seconds=60))],
-    description="The User, moderator and administrator have access to this action! No more than 10 requests per minute",
+    dependencies=[Depends(allowed_operation_get), Depends(RateLimit("contacts:add_email"))],
+    description="The User, moderator and administrator have access to this action! No more than 10 requests per minute by default",
 )
 async def add_email_to_contact(
     contact_id: int,
     email_create: EmailCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
     The add_email_to_contact function adds an email to a contact.
@@ -182,7 +275,7 @@ async def add_email_to_contact(
     :param contact_id: int: Specify the contact to which we want to add an email
     :param email_create: EmailCreate: Create a new email object
     :param db: AsyncSession: Pass the database session to the function
-    :param current_user: User: Get the current user's id
+    :param current_user: UserClaims: Get the current user's id
     :return: The contact with the added email
     """
     contact = await repository_addressbook.add_email_to_contact(db, email_create, current_user.id, contact_id)
@@ -200,7 +293,7 @@ async def update_contact_name(
     contact_id: int,
     body: AddressbookUpdateName,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
     The update_contact_name function updates the name of a contact in the address book.
@@ -208,7 +301,7 @@ async def update_contact_name(
     :param contact_id: int: Find the contact to update
     :param body: AddressbookUpdateName: Pass the data to be updated in the contact
     :param db: AsyncSession: Pass the database session to the function
-    :param current_user: User: Get the current user from the database
+    :param current_user: UserClaims: Get the current user from the database
     :return: The updated contact
     """
     contact = await repository_addressbook.update_contact_name(db, body, current_user.id, contact_id)
@@ -226,7 +319,7 @@ async def update_contact_birthday(
     contact_id: int,
     body: AddressbookUpdateBirthday,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
     The update_contact_birthday function updates the birthday of a contact.
@@ -236,7 +329,7 @@ async def update_contact_birthday(
     :param contact_id: int: Get the contact id from the url
     :param body: AddressbookUpdateBirthday: Get the new birthday from the request body
     :param db: AsyncSession: Pass the database session to the function
-    :param current_user: User: Get the current user
+    :param current_user: UserClaims: Get the current user
     :return: The updated contact
     """
     contact = await repository_addressbook.update_contact_birthday(db, body, current_user.id, contact_id)
@@ -252,14 +345,14 @@ async def update_contact_birthday(
 async def remove_contact(
     contact_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
     The remove_contact function removes a contact from the addressbook.
 
     :param contact_id: int: Get the contact id from the url
     :param db: AsyncSession: Pass a database session to the function
-    :param current_user: User: Get the current user
+    :param current_user: UserClaims: Get the current user
     :return: The deleted contact
     """
     contact = await repository_addressbook.remove_contact(db, current_user.id, contact_id)
@@ -274,18 +367,24 @@ async def remove_contact(
     description="User, moderators and admin",
 )
 async def read_contact_days_to_birthday(
-    days_to_birthday: int = Path(ge=0, le=7),
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    days_to_birthday: int = Path(ge=0, le=365),
+    db: AsyncSession = Depends(get_db_read),
+    current_user: UserClaims = Depends(auth_service.get_current_claims),
 ):
     """
-    The read_contact_days_to_birthday function returns a list of contacts that have their birthday in the next 7 days.
+    The read_contact_days_to_birthday function returns a list of contacts that have their birthday in the next days_to_birthday days.
+        Any window up to 365 days is served by the same index range, including windows across the new year.
+        Results are cached per user and day until the next write to the address book.
 
     :param days_to_birthday: int: Filter the contacts by days to birthday
     :param le: Limit the number of days to birthday
     :param db: AsyncSession: Access the database
-    :param current_user: User: Get the current user from the database
-    :return: A list of contacts whose birthday is in the next 7 days
+    :param current_user: UserClaims: Get the current user from the database
+    :return: A list of contacts whose birthday is in the next days_to_birthday days
     """
-    contacts = await repository_addressbook.read_contact_days_to_birthday(db, days_to_birthday, current_user.id)
-    return contacts
+    async def load():
+        return await repository_addressbook.read_contact_days_to_birthday(db, days_to_birthday, current_user.id)
+
+    # The window moves every day, so the date is a part of the cache key.
+    params = {"days_to_birthday": days_to_birthday, "today": date.today().isoformat()}
+    return await contact_cache.list_response(current_user.id, "birthday", params, load)
@@ -10,6 +10,8 @@ from src.repository import users as repository_users
 from src.schemas.user import RequestEmail, TokenModel, UserModel, UserResponse
 from src.services.auth import auth_service
 from src.services.email import send_email
+from src.services.login_throttle import login_throttle
+from src.services.refresh_tokens import refresh_tokens
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 security = HTTPBearer()
@@ -35,7 +37,7 @@ async def signup(
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.hash_password(body.password)
     new_user = await repository_users.create_user(body, db)
     subject = "Confirm your email! "
     template = "email_template.html"
@@ -44,25 +46,42 @@ async def signup(
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)) -> dict:
+async def login(
+    request: Request, body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)
+) -> dict:
     """
     The login function is used to authenticate a user.
+    Failed attempts are counted per account and per IP, a locked account or IP is rejected with 429
+    before the user is looked up and the password is hashed.
 
+    :param request: Request: Get the address of the client
     :param body: OAuth2PasswordRequestForm: Validate the request body
     :param db: AsyncSession: Get the database connection
     :return: A dict with the access_token, refresh_token and token_type
     """
 
+    ip = request.client.host if request.client else None
+    await login_throttle.check(body.username, ip)
     user: User | None = await repository_users.get_user_by_email(body.username, db)
     if user is None:
+        await login_throttle.failed(body.username, ip)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    valid, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not valid:
+        await login_throttle.failed(body.username, ip)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
-
-    access_token: str = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token: str = await auth_service.create_refresh_token(data={"sub": user.email})
+    await login_throttle.succeeded(body.username)
+    if new_hash:
+        # The cost factor changed, the new hash is committed together with the refresh token.
+        user.password = new_hash
+
+    access_token: str = await auth_service.create_access_token(data=auth_service.access_token_data(user))
+    family = await refresh_tokens.start(user.email)
+    refresh_token: str = await auth_service.create_refresh_token(
+        data={"sub": user.email, "ver": user.token_version or 0, **family}
+    )
     await repository_users.update_token(user, refresh_token, db)
     return {
         "access_token": access_token,
@@ -79,6 +98,10 @@ async def refresh_token(
     The refresh_token function is used to refresh the access token.
     It takes in a refresh token and returns an access token, a new refresh
     token, and the type of bearer authorization.
+    Tokens of a family are rotated in the refresh token store without writing to the database,
+    tokens issued without a family are checked against the refresh_token column of the user.
+    A token whose version is not the current token version of the user was revoked by a password change,
+    even when the families of the user could not be revoked in the store.
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
     :param db: AsyncSession: Get the database session
@@ -86,15 +109,31 @@ async def refresh_token(
     """
 
     token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
+    payload = await auth_service.decode_refresh_claims(token)
+    email = payload["sub"]
+    if "fid" in payload:
+        user = await repository_users.get_user_by_email(email, db)
+        if user is None or payload.get("ver", 0) != (user.token_version or 0):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
+        family = await refresh_tokens.rotate(payload["fid"], payload.get("jti"))
+        return {
+            "access_token": await auth_service.create_access_token(data=auth_service.access_token_data(user)),
+            "refresh_token": await auth_service.create_refresh_token(
+                data={"sub": email, "ver": user.token_version or 0, **family}
+            ),
+            "token_type": "bearer",
+        }
+
     user = await repository_users.get_user_by_email(email, db)
     if user:
         if user.refresh_token != token:
             await repository_users.update_token(user, None, db)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
+    access_token = await auth_service.create_access_token(data=auth_service.access_token_data(user) if user else {"sub": email})
+    refresh_token = await auth_service.create_refresh_token(
+        data={"sub": email, "ver": user.token_version or 0} if user else {"sub": email}
+    )
     if user:
         await repository_users.update_token(user, refresh_token, db)
     return {
@@ -206,7 +245,7 @@ async def reset_password(new_password: str, token: str, db: AsyncSession = Depen
     if user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
 
-    confirm_password = auth_service.get_password_hash(new_password)
+    confirm_password = await auth_service.hash_password(new_password)
     user = await repository_users.change_password(user, confirm_password, db)
 
     return {"user": user, "detail": "Password reset complete!"}
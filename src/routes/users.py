@@ -1,14 +1,14 @@
-import cloudinary
-import cloudinary.uploader
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+import asyncio
+
+from fastapi import APIRouter, BackgroundTasks, Depends, File, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.conf.config import settings
 from src.database.db import get_db
 from src.database.models import User
-from src.repository import users as repository_users
 from src.schemas.user import UserDb
 from src.services.auth import auth_service
+from src.services.avatars import (AvatarStore, avatar_key, get_avatar_store,
+                                  make_avatar, read_upload, store_avatar)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -26,31 +26,32 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 @router.patch("/avatar", response_model=UserDb)
 async def update_avatar_user(
-    file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)
-) -> User:
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(),
+    current_user: User = Depends(auth_service.get_current_user),
+    db: AsyncSession = Depends(get_db),
+    store: AvatarStore = Depends(get_avatar_store),
+) -> UserDb:
     """
     The update_avatar_user function takes in a file, current_user and db as parameters.
-    The function then uploads the file to cloudinary using the username of the user as its public id.
-    It then builds a url for that image with specific dimensions and crops it to fill those dimensions.
-    Finally, it updates the avatar field in our database with this new url.
+    The file is read in chunks up to settings.avatar_max_bytes, checked, and cropped to a
+    settings.avatar_size square in a worker thread, so only the small avatar is uploaded.
+    The user gets the URL of the new avatar at once; the upload and the update of the avatar field
+    in our database run as a background task.
 
-    :param file: UploadFile: Upload the file to cloudinary
+    :param background_tasks: BackgroundTasks: Add the upload to the background tasks
+    :param file: UploadFile: The uploaded image
     :param current_user: User: Get the current user's email
     :param db: Session: Get the database session
+    :param store: AvatarStore: Where the avatar is uploaded to
     :return: A user object with the new avatar url
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True,
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f"ContactsApp/{current_user.username}", overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f"ContactsApp/{current_user.username}").build_url(
-        width=250, height=250, crop="fill", version=r.get("version")
+    data = await read_upload(file)
+    image = await asyncio.to_thread(make_avatar, data)
+    key = avatar_key(current_user.id, image)
+    url = store.url(key)
+    # The session is closed only after the background tasks ran.
+    background_tasks.add_task(store_avatar, store, key, image, current_user.email, url, db)
+    return UserDb(
+        id=current_user.id, username=current_user.username, email=current_user.email, avatar=url, roles=current_user.roles
     )
-    user = await repository_users.update_avatar(current_user.email, src_url, db)
-    if user is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not found for updating avatar")
-    return user
@@ -62,6 +62,30 @@ class AddressbookResponse(AddressbookBase):
         from_attributes = True
 
 
+class AddressbookPage(BaseModel):
+    """
+    Represents one page of address book entries read with keyset pagination.
+
+    Attributes:
+        items (List[AddressbookResponse]): The address book entries of the page.
+        next_cursor (str | None): Opaque cursor of the next page, None when the last page is reached.
+    """
+
+    items: List[AddressbookResponse]
+    next_cursor: str | None = None
+
+
+class AddressbookSearchPage(AddressbookPage):
+    """
+    Represents one page of ranked search results.
+
+    Attributes:
+        total (int): The number of address book entries matching the search criteria.
+    """
+
+    total: int
+
+
 class AddressbookUpdateName(AddressbookBase):
     """
     Represents a request to update the name in the address book.
@@ -90,14 +114,14 @@ class DayToBirthday(BaseModel):
     """
     Represents the number of days until a birthday.
 
-    This class validates the number of days until a birthday, ensuring it falls within the range of 0 to 7.
+    This class validates the number of days until a birthday, ensuring it falls within the range of 0 to 365.
 
     Attributes:
         day_to_birthday (int): The number of days until the birthday.
 
     Methods:
         validate_day_to_birthday(value: int) -> int:
-            Validates the number of days until a birthday, ensuring it is within the range of 0 to 7.
+            Validates the number of days until a birthday, ensuring it is within the range of 0 to 365.
             If the value is out of range, a ValueError is raised.
     """
 
@@ -107,16 +131,16 @@ class DayToBirthday(BaseModel):
     @classmethod
     def validate_day_to_birthday(cls, value):
         """
-        The validate_day_to_birthday function validates that the day_to_birthday field is between 0 and 7.
+        The validate_day_to_birthday function validates that the day_to_birthday field is between 0 and 365.
 
 
         :param cls: Pass the class that is being created
         :param value: Pass the value that is being validated
-        :return: The value if it is between 0 and 7
+        :return: The value if it is between 0 and 365
         """
 
-        if value < 0 or value > 7:
-            raise ValueError("day_to_birthday must be between 0 and 7")
+        if value < 0 or value > 365:
+            raise ValueError("day_to_birthday must be between 0 and 365")
         return value
 
 
@@ -196,3 +220,31 @@ class EmailCreate(BaseModel):
     """
 
     email: EmailStr
+
+
+class ImportRowError(BaseModel):
+    """
+    Represents a row of an import file that was not imported.
+
+    Attributes:
+        line (int): The line number of the row in the uploaded file.
+        detail (str): Why the row was rejected.
+    """
+
+    line: int
+    detail: str
+
+
+class ImportReport(BaseModel):
+    """
+    Represents the result of a bulk import.
+
+    Attributes:
+        imported (int): The number of contacts created.
+        failed (int): The number of rows that were rejected.
+        errors (List[ImportRowError]): The rejected rows, capped at settings.import_max_errors entries.
+    """
+
+    imported: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
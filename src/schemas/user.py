@@ -43,6 +43,23 @@ class UserDb(BaseModel):
         from_attributes = True
 
 
+class UserClaims(BaseModel):
+    """
+    Represents the user an access token was issued to, as far as authorization needs it.
+
+    Attributes:
+        id (int): The unique identifier for the user.
+        email (str): The email address of the user.
+        roles (Role): The role of the user.
+        token_version (int): The version of the access tokens of the user.
+    """
+
+    id: int
+    email: str
+    roles: Role
+    token_version: int = 0
+
+
 class UserResponse(BaseModel):
     """
     Represents a response containing user information.
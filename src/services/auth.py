@@ -1,32 +1,41 @@
-import pickle
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Union
 
-import redis
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.conf.config import settings, init_async_redis
+from src.conf.config import settings
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
+from src.schemas.user import UserClaims
+from src.services.cache import LocalCache, user_cache
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    # Hashes made with another cost factor are flagged by verify_and_update and rehashed on login.
+    pwd_context = CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=settings.bcrypt_rounds,
+        bcrypt__min_rounds=settings.bcrypt_rounds,
+        bcrypt__max_rounds=settings.bcrypt_rounds,
+    )
+    # bcrypt releases the GIL, so a few threads hash in parallel without blocking the event loop.
+    password_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
+    password_slots = asyncio.Semaphore(settings.password_hash_workers + settings.password_hash_max_pending)
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    
-    @property
-    async def redis_cache(self):
-
-        if self._redis_cache is None:
-            self._redis_cache = await init_async_redis()
-        return self._redis_cache
+    # Claims of verified access tokens by the SHA-256 of the token, every entry is dropped at the exp of its token.
+    token_cache = LocalCache(settings.token_cache_size, ttl=0)
 
     def verify_password(self, plain_password, hashed_password) -> bool:
         """
@@ -52,6 +61,50 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    async def run_password_task(self, func, *args):
+        """
+        The run_password_task function runs a password hashing function on the bcrypt thread pool.
+        At most settings.password_hash_workers hashes run at once and settings.password_hash_max_pending wait.
+        A request that can not get a slot within settings.password_hash_timeout seconds is rejected with 503,
+        so a burst of logins queues up instead of freezing the event loop of the worker.
+
+        :param self: Represent the instance of the class
+        :param func: The function to run
+        :param args: The arguments of the function
+        :return: The result of the function
+        """
+        try:
+            await asyncio.wait_for(self.password_slots.acquire(), timeout=settings.password_hash_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, try again later")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.password_executor, func, *args)
+        finally:
+            self.password_slots.release()
+
+    async def hash_password(self, password: str) -> str:
+        """
+        The hash_password function hashes a password on the bcrypt thread pool.
+
+        :param self: Represent the instance of the class
+        :param password: str: The plain-text password
+        :return: A hash of the password
+        """
+        return await self.run_password_task(self.pwd_context.hash, password)
+
+    async def verify_and_update_password(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """
+        The verify_and_update_password function verifies a password on the bcrypt thread pool.
+        When the hash was made with another cost factor than settings.bcrypt_rounds, a new hash is returned
+        to be stored instead of the old one.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: The password that was entered by the user
+        :param hashed_password: str: The stored hash
+        :return: If the password is valid and the new hash or None
+        """
+        return await self.run_password_task(self.pwd_context.verify_and_update, plain_password, hashed_password)
+
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None) -> str:
         """
         The create_access_token function creates a new access token.
@@ -87,7 +140,7 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=settings.refresh_token_ttl)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
@@ -103,27 +156,56 @@ class Auth:
         :param refresh_token: str: Pass the refresh token to the function
         :return: The email address of the user
         """
+        payload = await self.decode_refresh_claims(refresh_token)
+        return payload["sub"]
+
+    async def decode_refresh_claims(self, refresh_token: str) -> dict:
+        """
+        The decode_refresh_claims function verifies a refresh token and returns its claims,
+        including the token family (fid) and the token id (jti) of tokens issued with a family.
+
+        :param self: Represent the instance of a class
+        :param refresh_token: str: Pass the refresh token to the function
+        :return: The claims of the token
+        """
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload["scope"] == "refresh_token":
-                email: str = payload["sub"]
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid scope for token")
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
 
-    async def get_current_user(
-        self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
-    ) -> Union[User, None]:
+    def access_token_data(self, user: User) -> dict:
         """
-        The get_current_user function is a dependency that can be used to get the current user.
-        It will check if the token is valid and return an object of type User or None.
+        The access_token_data function builds the claims of an access token for a user.
+        When settings.auth_claims_tokens is on, the token also carries the user id (uid), the role
+        and the token version (ver), so routes can be authorized without loading the user.
 
-        :param self: Access the class attributes
-        :param token: str: Get the token from the authorization header
-        :param db: AsyncSession: Get the database session
-        :return: The user object if the token is valid
+        :param self: Represent the instance of the class
+        :param user: User: The user the token is issued to
+        :return: The data to pass to create_access_token
+        """
+        data = {"sub": user.email}
+        if settings.auth_claims_tokens:
+            data.update({"uid": user.id, "role": user.roles.value, "ver": user.token_version or 0})
+        return data
+
+    def decode_access_token(self, token: str) -> dict:
         """
+        The decode_access_token function verifies an access token and returns its claims.
+        Verified tokens are kept in a bounded in-process cache until they expire, so a client that
+        sends the same token again skips the parsing and the signature check. Revoked tokens are still
+        rejected by the token version check of the callers.
+
+        :param self: Represent the instance of the class
+        :param token: str: The access token
+        :return: The claims of the token
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        payload = self.token_cache.get(key)
+        if payload is not None:
+            return payload
 
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -133,26 +215,85 @@ class Auth:
 
         try:
             payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload.get("scope") == "access_token":
-                email = payload.get("sub")
-                if email is None:
-                    raise credentials_exception
-
-            else:
-                raise credentials_exception
         except JWTError:
             raise credentials_exception
+        if payload.get("scope") != "access_token" or payload.get("sub") is None:
+            raise credentials_exception
+
+        ttl = payload.get("exp", 0) - time.time()
+        if ttl > 0:
+            self.token_cache.set(key, payload, ttl=ttl)
+        return payload
+
+    async def get_user(self, email: str, db: AsyncSession) -> User:
+        """
+        The get_user function reads a user through the two-tier user cache, the database is only queried on a miss.
 
-        user_r = await (await self.redis_cache).get(f"user:{email}")
-        if user_r is None:
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :param db: AsyncSession: Get the database session
+        :return: The user
+        """
+        user = await user_cache.get(email)
+        if user is None:
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
-                raise credentials_exception
-            user_r = pickle.dumps(user)
-            await (await self.redis_cache).set(f"user:{email}", user_r)
-            await (await self.redis_cache).expire(f"user:{email}", 900)
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+            await user_cache.set(user)
+        return user
+
+    async def get_current_user(
+        self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
+    ) -> Union[User, None]:
+        """
+        The get_current_user function is a dependency that can be used to get the current user.
+        It will check if the token is valid and return an object of type User or None.
+        Users are read through the two-tier user cache, the database is only queried on a miss.
+        The miss is read from the primary, a lagging replica could fill the cache with a revoked token version.
+
+        :param self: Access the class attributes
+        :param token: str: Get the token from the authorization header
+        :param db: AsyncSession: Get the database session
+        :return: The user object if the token is valid
+        """
+
+        payload = self.decode_access_token(token)
+        user = await self.get_user(payload["sub"], db)
+
+        if "ver" in payload and payload["ver"] != (user.token_version or 0):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
+        return user
+
+    async def get_current_claims(
+        self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
+    ) -> UserClaims:
+        """
+        The get_current_claims function is a dependency that returns who is calling, for authorization.
+        Tokens with uid, role and ver claims are trusted as they are: only the token version is compared
+        with the cached version of the user, so revoked tokens are rejected. Other tokens load the user
+        like get_current_user.
+
+        :param self: Access the class attributes
+        :param token: str: Get the token from the authorization header
+        :param db: AsyncSession: Get the database session, it is only used on a cache miss
+        :return: The claims of the user
+        """
+        payload = self.decode_access_token(token)
+        if "uid" not in payload or "role" not in payload:
+            user = await self.get_current_user(token, db)
+            return UserClaims(id=user.id, email=user.email, roles=user.roles, token_version=user.token_version or 0)
+
+        version = await user_cache.token_version(payload["sub"])
+        if version is None:
+            user = await repository_users.get_user_by_email(payload["sub"], db)
+            if user is None:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+            await user_cache.set(user)
+            version = user.token_version or 0
 
-        return pickle.loads(user_r)
+        if payload.get("ver") != version:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
+        return UserClaims(id=payload["uid"], email=payload["sub"], roles=payload["role"], token_version=version)
 
     def get_email_from_token(self, token: str) -> str:
         """
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import io
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import cloudinary
+import cloudinary.uploader
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.repository import users as repository_users
+
+logger = logging.getLogger(__name__)
+
+AVATAR_TYPES = {"image/jpeg": "JPEG", "image/png": "PNG", "image/webp": "WEBP", "image/gif": "GIF"}
+READ_CHUNK = 64 * 1024
+
+
+class AvatarStore(ABC):
+    """
+    Where avatars are uploaded to.
+
+    The URL of an avatar is known before it is uploaded, so it can be returned to the client at once.
+    Keys change with the content of the image, so caches never serve an old avatar under a new URL.
+    """
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """
+        The url function returns the public URL of an avatar.
+
+        :param self: Represent the instance of the class
+        :param key: str: The key of the avatar
+        :return: The URL
+        """
+
+    @abstractmethod
+    async def save(self, key: str, image: bytes) -> None:
+        """
+        The save function uploads an avatar without blocking the event loop.
+
+        :param self: Represent the instance of the class
+        :param key: str: The key of the avatar
+        :param image: bytes: The JPEG image
+        :return: None
+        """
+
+
+class CloudinaryStore(AvatarStore):
+    """
+    Avatars kept in Cloudinary, the client is configured once.
+    """
+
+    def __init__(self):
+        cloudinary.config(
+            cloud_name=settings.cloudinary_name,
+            api_key=settings.cloudinary_api_key,
+            api_secret=settings.cloudinary_api_secret,
+            secure=True,
+        )
+
+    def url(self, key: str) -> str:
+        return cloudinary.CloudinaryImage(key).build_url(
+            width=settings.avatar_size, height=settings.avatar_size, crop="fill", format="jpg"
+        )
+
+    async def save(self, key: str, image: bytes) -> None:
+        await asyncio.to_thread(cloudinary.uploader.upload, image, public_id=key, overwrite=True)
+
+
+class LocalStore(AvatarStore):
+    """
+    Avatars kept in a local directory, served by the application under settings.avatar_local_url.
+
+    Attributes:
+        root (Path): The directory of the avatars.
+        base_url (str): The URL the directory is served under.
+    """
+
+    def __init__(self, root: str | Path, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}.jpg"
+
+    async def save(self, key: str, image: bytes) -> None:
+        root = self.root.resolve()
+        path = (root / f"{key}.jpg").resolve()
+        if not path.is_relative_to(root):
+            raise ValueError(f"Avatar key {key!r} leaves the avatar directory")
+
+        def write() -> None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(image)
+
+        await asyncio.to_thread(write)
+
+
+def create_store() -> AvatarStore:
+    """
+    The create_store function creates the avatar store chosen by settings.avatar_store.
+
+    :return: The store
+    """
+    if settings.avatar_store == "local":
+        return LocalStore(settings.avatar_local_dir, settings.avatar_local_url)
+    return CloudinaryStore()
+
+
+avatar_store = create_store()
+
+
+def get_avatar_store() -> AvatarStore:
+    """
+    The get_avatar_store function is a dependency that returns the avatar store, tests override it.
+
+    :return: The store
+    """
+    return avatar_store
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    The read_upload function reads an uploaded image in chunks, up to settings.avatar_max_bytes.
+
+    :param file: UploadFile: The uploaded file
+    :return: The content of the file
+    """
+    if file.content_type not in AVATAR_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Avatar must be a JPEG, PNG, WEBP or GIF image"
+        )
+    buffer = bytearray()
+    while chunk := await file.read(READ_CHUNK):
+        buffer += chunk
+        if len(buffer) > settings.avatar_max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Avatar is too large")
+    return bytes(buffer)
+
+
+def make_avatar(data: bytes) -> bytes:
+    """
+    The make_avatar function checks an image, crops it to a square of settings.avatar_size pixels
+    around the center and encodes it as JPEG. It is CPU bound and runs in a thread.
+
+    :param data: bytes: The uploaded image
+    :return: The JPEG avatar
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in AVATAR_TYPES.values():
+                raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image format")
+            if image.width * image.height > settings.avatar_max_pixels:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Avatar is too large")
+            image.draft("RGB", (settings.avatar_size, settings.avatar_size))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            avatar = ImageOps.fit(image, (settings.avatar_size, settings.avatar_size), Image.LANCZOS)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Avatar is not a valid image")
+    output = io.BytesIO()
+    avatar.save(output, format="JPEG", quality=85, optimize=True)
+    return output.getvalue()
+
+
+def avatar_key(user_id: int, image: bytes) -> str:
+    """
+    The avatar_key function builds the key of an avatar from the id of the user and the content of the image.
+    Usernames are chosen freely by the users and never become part of a key or a path.
+
+    :param user_id: int: The id of the user
+    :param image: bytes: The avatar
+    :return: The key
+    """
+    return f"ContactsApp/{int(user_id)}/{hashlib.sha1(image).hexdigest()[:16]}"
+
+
+async def store_avatar(store: AvatarStore, key: str, image: bytes, email: str, url: str, db: AsyncSession) -> None:
+    """
+    The store_avatar function uploads an avatar, then saves its URL on the user and drops the cached user.
+    It runs as a background task after the response was sent; when the upload fails the old avatar is kept.
+
+    :param store: AvatarStore: Where the avatar is uploaded to
+    :param key: str: The key of the avatar
+    :param image: bytes: The avatar
+    :param email: str: The email of the user
+    :param url: str: The URL of the avatar
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    try:
+        await store.save(key, image)
+    except Exception as error:
+        logger.error("Avatar upload of %s failed: %s", email, error)
+        return
+    await repository_users.update_avatar(email, url, db)
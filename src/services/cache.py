@@ -0,0 +1,600 @@
+import asyncio
+import enum
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+
+import redis
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+from src.conf.config import settings
+from src.database.redis import redis_manager
+from src.database.models import User
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] - the contact key, KEYS[2] - the version key, ARGV - the payload, the version read before the database and the TTL.
+# The contact is stored only when the address book did not change since it was read, "" stands for a missing version.
+SET_IF_VERSION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+# KEYS[1] - the version key, ARGV[1] - the current time in nanoseconds.
+# A missing version is started from the current time like ContactCache.version does, a plain INCR would restart it at 1
+# and could bring back a version under which lists were cached before.
+BUMP_VERSION_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+
+class ContactCache:
+    """
+    A Redis read-through cache of serialized address book responses.
+
+    Every entry is scoped to its user, so one user never sees the contacts of another one.
+    Single contacts are cached under their own key and dropped when they change.
+    List-shaped responses are cached under a key that includes the version of the user's address book;
+    every write increments the version, so old entries are never read again and expire with their TTL.
+    A single contact is only stored when the version did not change since it was read from the database,
+    so a slow read can not put back a contact that a concurrent write just dropped.
+    Redis is optional for reads: when it is not reachable the cache reports a miss and
+    the request is served from the database. Invalidations that fail stay pending and are sent again
+    before the next cache access; until then the cache is not used for the users concerned.
+
+    Attributes:
+        pending (dict[int, set[int]]): The users whose invalidation failed, with the ids of their changed contacts.
+        hits (int): The number of single contact reads served from the cache.
+        misses (int): The number of single contact reads that went to the database.
+        list_hits (int): The number of list reads served from the cache.
+        list_misses (int): The number of list reads that went to the database.
+        errors (int): The number of Redis calls that failed.
+    """
+
+    def __init__(self):
+        self.pending: dict[int, set[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.list_hits = 0
+        self.list_misses = 0
+        self.errors = 0
+        self._set_script = None
+        self._bump_script = None
+
+    @staticmethod
+    def contact_key(current_user: int, contact_id: int) -> str:
+        """
+        The contact_key function builds the key of one cached contact.
+
+        :param current_user: int: The id of the owner of the contact
+        :param contact_id: int: The id of the contact
+        :return: The Redis key
+        """
+        return f"contacts:{current_user}:contact:{contact_id}"
+
+    @staticmethod
+    def version_key(current_user: int) -> str:
+        """
+        The version_key function builds the key of the address book version of a user.
+
+        :param current_user: int: The id of the user
+        :return: The Redis key
+        """
+        return f"contacts:{current_user}:version"
+
+    @staticmethod
+    def list_key(current_user: int, endpoint: str, params: dict, version: int) -> str:
+        """
+        The list_key function builds the key of a cached list response.
+
+        :param current_user: int: The id of the user
+        :param endpoint: str: The name of the endpoint
+        :param params: dict: The parameters the response depends on
+        :param version: int: The address book version of the user
+        :return: The Redis key
+        """
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f"contacts:{current_user}:{endpoint}:v{version}:{digest}"
+
+    async def get_contact(self, current_user: int, contact_id: int) -> tuple[bytes | None, bytes | None]:
+        """
+        The get_contact function reads a serialized AddressbookResponse from the cache,
+        together with the address book version that set_contact compares on a miss.
+
+        :param self: Represent the instance of the class
+        :param current_user: int: The id of the owner of the contact
+        :param contact_id: int: The id of the contact
+        :return: The JSON document or None on a miss, and the version
+        """
+        payload = version = None
+        if await self.flush_pending() or current_user not in self.pending:
+            try:
+                async with redis_manager.guard() as client:
+                    payload, version = await client.mget(
+                        self.contact_key(current_user, contact_id), self.version_key(current_user)
+                    )
+            except (redis.RedisError, OSError) as error:
+                self.errors += 1
+                logger.warning("Contact cache read failed: %s", error)
+
+        if payload is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return payload, version
+
+    async def set_contact(self, current_user: int, contact_id: int, payload: str, version: bytes | None) -> None:
+        """
+        The set_contact function stores a serialized AddressbookResponse for settings.contact_cache_ttl seconds,
+        unless the address book of the user changed since version was read.
+
+        :param self: Represent the instance of the class
+        :param current_user: int: The id of the owner of the contact
+        :param contact_id: int: The id of the contact
+        :param payload: str: The JSON document
+        :param version: bytes | None: The version returned by get_contact
+        :return: None
+        """
+        if current_user in self.pending:
+            return
+        try:
+            async with redis_manager.guard() as client:
+                if self._set_script is None:
+                    self._set_script = client.register_script(SET_IF_VERSION_SCRIPT)
+                await self._set_script(
+                    keys=[self.contact_key(current_user, contact_id), self.version_key(current_user)],
+                    args=[payload, version or "", settings.contact_cache_ttl],
+                    client=client,
+                )
+        except (redis.RedisError, OSError) as error:
+            self.errors += 1
+            logger.warning("Contact cache write failed: %s", error)
+
+    async def invalidate(self, current_user: int, contact_id: int | None = None) -> None:
+        """
+        The invalidate function is called by every write to the address book of a user.
+        It increments the address book version, which invalidates all cached lists of the user at once,
+        and drops the cached contact that was changed or removed, in one round trip.
+        When Redis is not reachable the invalidation stays pending.
+
+        :param self: Represent the instance of the class
+        :param current_user: int: The id of the user
+        :param contact_id: int | None: The id of the changed contact, None when contacts were only added
+        :return: None
+        """
+        contacts = self.pending.setdefault(current_user, set())
+        if contact_id is not None:
+            contacts.add(contact_id)
+        await self.flush_pending()
+
+    async def flush_pending(self) -> bool:
+        """
+        The flush_pending function sends the pending invalidations in one pipeline.
+        Versions are incremented by BUMP_VERSION_SCRIPT, which starts a missing version from the current time.
+
+        :param self: Represent the instance of the class
+        :return: True when no invalidation is pending any more
+        """
+        if not self.pending:
+            return True
+        batch, self.pending = self.pending, {}
+        try:
+            async with redis_manager.guard() as client, client.pipeline(transaction=False) as pipe:
+                if self._bump_script is None:
+                    self._bump_script = client.register_script(BUMP_VERSION_SCRIPT)
+                for current_user, contacts in batch.items():
+                    await self._bump_script(keys=[self.version_key(current_user)], args=[time.time_ns()], client=pipe)
+                    if contacts:
+                        pipe.delete(*[self.contact_key(current_user, contact_id) for contact_id in contacts])
+                await pipe.execute()
+        except (redis.RedisError, OSError) as error:
+            self.errors += 1
+            logger.warning("Contact cache invalidation failed, %d users pending: %s", len(batch), error)
+            for current_user, contacts in batch.items():
+                self.pending.setdefault(current_user, set()).update(contacts)
+            return False
+        return not self.pending
+
+    async def version(self, current_user: int) -> int | None:
+        """
+        The version function reads the address book version of a user.
+        A missing version is started from the current time, so it never goes back to a value used before.
+
+        :param self: Represent the instance of the class
+        :param current_user: int: The id of the user
+        :return: The version or None when Redis is not available or an invalidation of the user is pending
+        """
+        if not await self.flush_pending() and current_user in self.pending:
+            return None
+        try:
+            async with redis_manager.guard() as client:
+                version = await client.get(self.version_key(current_user))
+                if version is None:
+                    await client.set(self.version_key(current_user), time.time_ns(), nx=True)
+                    version = await client.get(self.version_key(current_user))
+                return int(version)
+        except (redis.RedisError, OSError, TypeError, ValueError) as error:
+            self.errors += 1
+            logger.warning("Contact cache version read failed: %s", error)
+            return None
+
+    async def list_response(
+        self, current_user: int, endpoint: str, params: dict, load: Callable[[], Awaitable[Any]]
+    ) -> Response:
+        """
+        The list_response function serves a list-shaped response through the versioned cache.
+        On a miss the result of load is encoded like FastAPI would encode it and stored for settings.list_cache_ttl seconds.
+
+        :param self: Represent the instance of the class
+        :param current_user: int: The id of the user
+        :param endpoint: str: The name of the endpoint
+        :param params: dict: The parameters the response depends on
+        :param load: Callable[[], Awaitable[Any]]: Reads the response from the database
+        :return: A JSON response
+        """
+        version = await self.version(current_user)
+        key = self.list_key(current_user, endpoint, params, version) if version is not None else None
+
+        payload = None
+        if key is not None:
+            try:
+                async with redis_manager.guard() as client:
+                    payload = await client.get(key)
+            except (redis.RedisError, OSError) as error:
+                self.errors += 1
+                logger.warning("List cache read failed: %s", error)
+
+        if payload is not None:
+            self.list_hits += 1
+            return Response(content=payload, media_type="application/json")
+
+        self.list_misses += 1
+        payload = json.dumps(jsonable_encoder(await load()))
+        if key is not None:
+            try:
+                async with redis_manager.guard() as client:
+                    await client.set(key, payload, ex=settings.list_cache_ttl)
+            except (redis.RedisError, OSError) as error:
+                self.errors += 1
+                logger.warning("List cache write failed: %s", error)
+        return Response(content=payload, media_type="application/json")
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the counters of the cache.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary with hits, misses, errors and the hit ratios
+        """
+        reads = self.hits + self.misses
+        list_reads = self.list_hits + self.list_misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / reads if reads else 0.0,
+            "list_hits": self.list_hits,
+            "list_misses": self.list_misses,
+            "list_hit_ratio": self.list_hits / list_reads if list_reads else 0.0,
+            "errors": self.errors,
+        }
+
+
+contact_cache = ContactCache()
+
+
+class LocalCache:
+    """
+    An in-process LRU cache with a TTL for every entry.
+
+    Attributes:
+        maxsize (int): The number of entries kept, the least recently used entry is dropped first.
+        ttl (float): How long an entry is served, in seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        """
+        The get function returns a fresh entry and marks it as recently used.
+
+        :param self: Represent the instance of the class
+        :param key: str: The key of the entry
+        :return: The value or None when it is missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """
+        The set function stores an entry for ttl seconds.
+
+        :param self: Represent the instance of the class
+        :param key: str: The key of the entry
+        :param value: Any: The value
+        :param ttl: float | None: How long this entry is served, the ttl of the cache when None
+        :return: None
+        """
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        """
+        The pop function drops an entry.
+
+        :param self: Represent the instance of the class
+        :param key: str: The key of the entry
+        :return: None
+        """
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        The clear function drops all entries.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self._entries.clear()
+
+
+def dump_user(user: User) -> str:
+    """
+    The dump_user function serializes the columns of a user as a JSON document.
+
+    :param user: User: The user
+    :return: The JSON document
+    """
+    return json.dumps(jsonable_encoder({column.key: getattr(user, column.key) for column in User.__table__.columns}))
+
+
+def load_user(data: dict) -> User:
+    """
+    The load_user function restores a detached User from the decoded document written by dump_user.
+    Keys of removed columns are ignored and new columns stay unset, so entries written by an older
+    or a newer release of the application can still be read.
+
+    :param data: dict: The decoded JSON document
+    :return: The user
+    """
+    columns = User.__table__.columns
+    values = {}
+    for key, value in data.items():
+        if key not in columns:
+            continue
+        python_type = columns[key].type.python_type
+        if value is not None and python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif value is not None and issubclass(python_type, enum.Enum):
+            value = python_type(value)
+        values[key] = value
+    return User(**values)
+
+
+class UserCache:
+    """
+    A two-tier cache of the users looked up by get_current_user.
+
+    Users are kept in an in-process LRU for settings.user_cache_local_ttl seconds in front of Redis,
+    where they are stored as JSON for settings.user_cache_ttl seconds. When a user changes, the Redis
+    entry is dropped and the email is published on the invalidation channel, so every worker
+    evicts its local copy at once.
+
+    Attributes:
+        local (LocalCache): The in-process tier.
+        pending (set[str]): The emails whose invalidation could not be sent to Redis yet.
+        channel (str): The Redis pub/sub channel of invalidations.
+        local_hits (int): The number of reads served from the local tier.
+        hits (int): The number of reads served from Redis.
+        misses (int): The number of reads that went to the database.
+    """
+
+    channel = "user-cache:invalidate"
+
+    def __init__(self):
+        self.local = LocalCache(settings.user_cache_local_size, settings.user_cache_local_ttl)
+        self.pending: set[str] = set()
+        self.local_hits = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def user_key(email: str) -> str:
+        """
+        The user_key function builds the Redis key of a user.
+
+        :param email: str: The email of the user
+        :return: The Redis key
+        """
+        return f"user:{email}"
+
+    async def get_data(self, email: str) -> dict | None:
+        """
+        The get_data function reads the decoded document of a user from the local tier, then from Redis.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: The columns of the user or None on a miss
+        """
+        data = self.local.get(email)
+        if data is not None:
+            self.local_hits += 1
+            return data
+        try:
+            async with redis_manager.guard() as client:
+                payload = await client.get(self.user_key(email))
+        except (redis.RedisError, OSError) as error:
+            logger.warning("User cache read failed: %s", error)
+            payload = None
+        if payload is None:
+            self.misses += 1
+            return None
+        try:
+            data = json.loads(payload)
+        except ValueError as error:
+            logger.warning("User cache entry of %s is not readable: %s", email, error)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.local.set(email, data)
+        return data
+
+    async def get(self, email: str) -> User | None:
+        """
+        The get function reads a user from the local tier, then from Redis.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: A detached user or None on a miss
+        """
+        data = await self.get_data(email)
+        if data is None:
+            return None
+        try:
+            return load_user(data)
+        except (ValueError, TypeError) as error:
+            logger.warning("User cache entry of %s is not readable: %s", email, error)
+            self.local.pop(email)
+            return None
+
+    async def token_version(self, email: str) -> int | None:
+        """
+        The token_version function reads the version of the access tokens of a user from the cache.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: The token version or None on a miss
+        """
+        data = await self.get_data(email)
+        if data is None:
+            return None
+        return data.get("token_version") or 0
+
+    async def set(self, user: User) -> None:
+        """
+        The set function stores a user in both tiers, Redis is written with a single SET ... EX.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user loaded from the database
+        :return: None
+        """
+        payload = dump_user(user)
+        self.local.set(user.email, json.loads(payload))
+        try:
+            async with redis_manager.guard() as client:
+                await client.set(self.user_key(user.email), payload, ex=settings.user_cache_ttl)
+        except (redis.RedisError, OSError) as error:
+            logger.warning("User cache write failed: %s", error)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function is called after a user was changed.
+        It drops the local and the Redis entry and tells the other workers to drop their local entry.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: None
+        """
+        self.local.pop(email)
+        self.pending.add(email)
+        await self.flush_pending()
+
+    async def flush_pending(self) -> None:
+        """
+        The flush_pending function drops the Redis entries of the changed users and publishes their emails.
+        Emails stay pending when Redis is not reachable, they are sent with the next invalidation
+        or when the listener is connected again, so no stale user outlives an outage in Redis.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if not self.pending:
+            return
+        emails = list(self.pending)
+        try:
+            async with redis_manager.guard() as client, client.pipeline(transaction=False) as pipe:
+                pipe.delete(*[self.user_key(email) for email in emails])
+                for email in emails:
+                    pipe.publish(self.channel, email)
+                await pipe.execute()
+        except (redis.RedisError, OSError) as error:
+            logger.warning("User cache invalidation failed: %s", error)
+            return
+        self.pending.difference_update(emails)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the counters of the cache, a hit of either tier counts as a hit.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary with hits, misses and the hit ratio
+        """
+        hits = self.local_hits + self.hits
+        reads = hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.hits,
+            "hits": hits,
+            "misses": self.misses,
+            "hit_ratio": hits / reads if reads else 0.0,
+        }
+
+    async def listen(self) -> None:
+        """
+        The listen function evicts the local entries of the users changed by other workers.
+        It runs for the lifetime of the application and reconnects when the connection to Redis is lost.
+        While Redis is down the local tier keeps serving users for settings.user_cache_local_ttl seconds;
+        once the listener is subscribed again the local tier is cleared, since invalidations may have been
+        missed, and the invalidations that failed on this worker are sent again.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        reconnect = False
+        while True:
+            try:
+                pubsub = redis_manager.client.pubsub(ignore_subscribe_messages=True)
+                async with pubsub:
+                    await pubsub.subscribe(self.channel)
+                    if reconnect:
+                        self.local.clear()
+                        reconnect = False
+                    await self.flush_pending()
+                    while True:
+                        # A bounded wait, a blocking read would time out after the socket timeout of the pool.
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None:
+                            email = message["data"]
+                            self.local.pop(email.decode() if isinstance(email, bytes) else email)
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, OSError) as error:
+                if not reconnect:
+                    logger.warning("User cache invalidation listener failed: %s", error)
+                reconnect = True
+                await asyncio.sleep(1)
+
+
+user_cache = UserCache()
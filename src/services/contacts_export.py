@@ -0,0 +1,95 @@
+import csv
+import io
+import zlib
+from typing import AsyncIterator, Iterable
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import AddressBookContact as ABC
+from src.database.models import ContactType
+from src.repository import addressbook as repository_addressbook
+from src.schemas.addressbook import AddressbookResponse
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_COLUMNS = ["id", "first_name", "last_name", "birthday", "emails", "phones"]
+
+
+def ndjson_chunk(contacts: Iterable[ABC]) -> bytes:
+    """
+    The ndjson_chunk function serializes contacts as AddressbookResponse objects, one JSON document per line.
+
+    :param contacts: Iterable[ABC]: The contacts of one chunk
+    :return: The encoded lines
+    """
+    lines = [AddressbookResponse.model_validate(contact, from_attributes=True).model_dump_json() for contact in contacts]
+    return ("\n".join(lines) + "\n").encode() if lines else b""
+
+
+def csv_chunk(contacts: Iterable[ABC], header: bool = False) -> bytes:
+    """
+    The csv_chunk function serializes contacts as CSV rows. Several emails or phones are joined with ";".
+
+    :param contacts: Iterable[ABC]: The contacts of one chunk
+    :param header: bool: Write the header row first
+    :return: The encoded rows
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for contact in contacts:
+        emails = ";".join(item.contact_value for item in contact.contacts if item.contact_type == ContactType.email)
+        phones = ";".join(item.contact_value for item in contact.contacts if item.contact_type == ContactType.phone)
+        writer.writerow([contact.id, contact.first_name, contact.last_name, contact.birthday, emails, phones])
+    return buffer.getvalue().encode()
+
+
+async def export_chunks(file_format: str, compress: bool, current_user: int, db: AsyncSession) -> AsyncIterator[bytes]:
+    """
+    The export_chunks function encodes the address book of a user chunk by chunk, optionally gzip compressed.
+
+    :param file_format: str: "ndjson" or "csv"
+    :param compress: bool: Compress the output with gzip
+    :param current_user: int: Get the current user's id
+    :param db: AsyncSession: Pass the database session to the function
+    :return: An async iterator of encoded chunks
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    header = file_format == "csv"
+
+    async for contacts in repository_addressbook.stream_contacts(current_user, settings.export_chunk_size, db):
+        chunk = csv_chunk(contacts, header) if file_format == "csv" else ndjson_chunk(contacts)
+        header = False
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+    if header:
+        chunk = csv_chunk([], header=True)
+        yield compressor.compress(chunk) if compressor is not None else chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def export_contacts(file_format: str, compress: bool, current_user: int, db: AsyncSession) -> StreamingResponse:
+    """
+    The export_contacts function builds a streaming response with the whole address book of a user.
+
+    :param file_format: str: "ndjson" or "csv"
+    :param compress: bool: Compress the output with gzip (Content-Encoding: gzip)
+    :param current_user: int: Get the current user's id
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A StreamingResponse
+    """
+    media_type = EXPORT_MEDIA_TYPES.get(file_format)
+    if media_type is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported export format, use ndjson or csv")
+
+    headers = {"Content-Disposition": f'attachment; filename="contacts.{file_format}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_chunks(file_format, compress, current_user, db), media_type=media_type, headers=headers)
@@ -0,0 +1,126 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import IO, Iterator
+
+from fastapi import HTTPException, UploadFile, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from src.conf.config import settings
+from src.repository import addressbook as repository_addressbook
+from src.schemas.addressbook import (AddressbookCreate, EmailCreate,
+                                     ImportReport, ImportRowError, PhoneCreate)
+
+IMPORT_FORMATS = {"csv": "csv", "jsonl": "jsonl", "ndjson": "jsonl", "json": "jsonl"}
+
+
+def import_format(file: UploadFile, file_format: str | None) -> str:
+    """
+    The import_format function decides how an uploaded file is parsed.
+    An explicit format wins, otherwise the extension of the file name is used.
+
+    :param file: UploadFile: The uploaded file
+    :param file_format: str | None: The format requested by the client (csv or jsonl)
+    :return: "csv" or "jsonl"
+    """
+    name = file_format or (file.filename or "").rsplit(".", 1)[-1]
+    parsed = IMPORT_FORMATS.get(name.lower())
+    if parsed is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported import format, use csv or jsonl")
+    return parsed
+
+
+def read_rows(stream: IO[bytes], file_format: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+    The read_rows function lazily reads an import file row by row, so memory does not depend on the file size.
+    CSV files need a header with first_name, last_name, birthday, email and phone columns,
+    JSONL files hold one object with the same keys per line.
+
+    :param stream: IO[bytes]: The binary stream of the uploaded file
+    :param file_format: str: "csv" or "jsonl"
+    :return: An iterator of (line, row, error) tuples, error is set when the line can not be parsed
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if file_format == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row, None
+        else:
+            for line, raw in enumerate(text, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    row = json.loads(raw)
+                except ValueError as err:
+                    yield line, None, f"Invalid JSON: {err}"
+                    continue
+                if isinstance(row, dict):
+                    yield line, row, None
+                else:
+                    yield line, None, "Invalid JSON: expected an object"
+    except UnicodeDecodeError:
+        yield 0, None, "The file is not UTF-8 encoded"
+    finally:
+        text.detach()
+
+
+def validate_row(row: dict) -> tuple[AddressbookCreate, EmailCreate, PhoneCreate]:
+    """
+    The validate_row function validates one import row with the schemas used by POST /api/contacts/.
+
+    :param row: dict: The parsed row
+    :return: The AddressbookCreate, EmailCreate and PhoneCreate of the row
+    """
+    contact = AddressbookCreate(first_name=row.get("first_name"), last_name=row.get("last_name"), birthday=row.get("birthday"))
+    email = EmailCreate(email=row.get("email"))
+    phone = PhoneCreate(phone=row.get("phone"))
+    return contact, email, phone
+
+
+async def import_contacts(file: UploadFile, file_format: str | None, current_user: int, db: AsyncSession) -> ImportReport:
+    """
+    The import_contacts function streams an uploaded CSV or JSONL file into the address book of the user.
+        The file is parsed in batches of settings.import_batch_size rows in a worker thread, every row is validated,
+        and every batch is inserted with repository_addressbook.import_contacts. Invalid or duplicated rows are
+        reported and skipped without aborting the import.
+
+    :param file: UploadFile: The uploaded file
+    :param file_format: str | None: The format requested by the client (csv or jsonl)
+    :param current_user: int: Get the current user's id
+    :param db: AsyncSession: Pass the database session to the function
+    :return: An ImportReport with the number of imported rows and the rejected rows
+    """
+    parsed_format = import_format(file, file_format)
+    rows = read_rows(file.file, parsed_format)
+    report = ImportReport()
+
+    def reject(line: int, detail: str) -> None:
+        report.failed += 1
+        if len(report.errors) < settings.import_max_errors:
+            report.errors.append(ImportRowError(line=line, detail=detail))
+
+    while True:
+        batch = await run_in_threadpool(lambda: list(islice(rows, settings.import_batch_size)))
+        if not batch:
+            break
+
+        valid = []
+        for line, row, error in batch:
+            if error is not None:
+                reject(line, error)
+                continue
+            try:
+                valid.append((line, *validate_row(row)))
+            except ValidationError as err:
+                reject(line, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors()))
+
+        errors = await repository_addressbook.import_contacts(db, valid, current_user)
+        report.imported += len(valid) - len(errors)
+        for line, detail in errors:
+            reject(line, detail)
+
+    return report
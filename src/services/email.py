@@ -1,12 +1,24 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+import redis
+from fastapi_mail import ConnectionConfig
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 
 from src.conf.config import settings
+from src.database.redis import redis_manager
 from src.services.auth import auth_service
 
+logger = logging.getLogger(__name__)
+
 conf = ConnectionConfig(
     MAIL_USERNAME=settings.mail_username,
     MAIL_PASSWORD=settings.mail_password,
@@ -14,40 +26,224 @@ conf = ConnectionConfig(
     MAIL_PORT=settings.mail_port,
     MAIL_SERVER=settings.mail_server,
     MAIL_FROM_NAME="Desired Name",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
+    MAIL_STARTTLS=settings.mail_starttls,
+    MAIL_SSL_TLS=settings.mail_ssl_tls,
     USE_CREDENTIALS=True,
     VALIDATE_CERTS=True,
     TEMPLATE_FOLDER=Path(__file__).parent / "templates",
 )
 
+templates = Environment(
+    loader=FileSystemLoader(conf.TEMPLATE_FOLDER), autoescape=select_autoescape(["html"]), auto_reload=False
+)
+# Every template is compiled once at import, rendering a message only runs the compiled code.
+compiled_templates = {name: templates.get_template(name) for name in templates.list_templates()}
+
+
+def build_message(job: dict) -> EmailMessage:
+    """
+    The build_message function renders the email of a job with its pre-compiled template.
+    The verification token is created here, when the email is sent, so no token is kept in the queue.
+
+    :param job: dict: The recipient (email), username, host, subject and template of the email
+    :return: The message to send
+    """
+    token = auth_service.create_email_token({"sub": job["email"]})
+    body = compiled_templates[job["template"]].render(host=job["host"], username=job["username"], token=token)
+    message = EmailMessage()
+    message["Subject"] = job["subject"]
+    message["From"] = formataddr((conf.MAIL_FROM_NAME, conf.MAIL_FROM))
+    message["To"] = job["email"]
+    message.set_content(body, subtype="html")
+    return message
+
+
+class SMTPPool:
+    """
+    A pool of persistent SMTP connections.
+
+    Connections are opened on demand up to size, kept open between messages and opened again
+    when the server closed them.
+
+    Attributes:
+        size (int): The most connections open at once.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: list[aiosmtplib.SMTP] = []
+        self._created = 0
+        self._released = asyncio.Condition()
+
+    def new_connection(self) -> aiosmtplib.SMTP:
+        """
+        The new_connection function creates an SMTP client with the mail settings, it is connected on first use.
+
+        :param self: Represent the instance of the class
+        :return: The SMTP client
+        """
+        return aiosmtplib.SMTP(
+            hostname=settings.mail_server,
+            port=settings.mail_port,
+            username=settings.mail_username or None,
+            password=settings.mail_password if settings.mail_username else None,
+            use_tls=settings.mail_ssl_tls,
+            start_tls=settings.mail_starttls,
+            timeout=settings.email_smtp_timeout,
+        )
+
+    async def acquire(self) -> aiosmtplib.SMTP:
+        """
+        The acquire function takes an idle connection, creates one below the size or waits for one.
+
+        :param self: Represent the instance of the class
+        :return: A connected SMTP client
+        """
+        async with self._released:
+            while not self._idle and self._created >= self.size:
+                await self._released.wait()
+            if self._idle:
+                smtp = self._idle.pop()
+            else:
+                smtp = self.new_connection()
+                self._created += 1
+        if not smtp.is_connected:
+            try:
+                await smtp.connect()
+            except BaseException:
+                await self.release(smtp, broken=True)
+                raise
+        return smtp
+
+    async def release(self, smtp: aiosmtplib.SMTP, broken: bool = False) -> None:
+        """
+        The release function gives a connection back to the pool, a broken connection is closed and dropped.
+
+        :param self: Represent the instance of the class
+        :param smtp: aiosmtplib.SMTP: The connection
+        :param broken: bool: The connection failed and must not be used again
+        :return: None
+        """
+        if broken:
+            smtp.close()
+            self._created -= 1
+        else:
+            self._idle.append(smtp)
+        async with self._released:
+            self._released.notify()
+
+    async def send(self, message: EmailMessage) -> None:
+        """
+        The send function sends a message over a pooled connection.
+        A connection closed by the server since its last use is opened again and the message is sent once more.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message
+        :return: None
+        """
+        smtp = await self.acquire()
+        broken = False
+        try:
+            try:
+                await smtp.send_message(message)
+            except aiosmtplib.SMTPServerDisconnected:
+                smtp.close()
+                await smtp.connect()
+                await smtp.send_message(message)
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPTimeoutError, OSError):
+            broken = True
+            raise
+        finally:
+            await self.release(smtp, broken)
+
+    async def close(self) -> None:
+        """
+        The close function ends the idle connections with QUIT.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while self._idle:
+            smtp = self._idle.pop()
+            self._created -= 1
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+
+
+class EmailQueue:
+    """
+    The durable queue of outbound emails, a Redis stream drained by the email workers (src.services.email_worker).
+
+    Jobs are deduplicated: the same email to the same recipient is queued once per settings.email_dedupe_ttl
+    seconds, and every recipient gets at most settings.email_recipient_limit emails per
+    settings.email_recipient_window seconds.
+
+    Attributes:
+        stream (str): The stream of the jobs.
+        group (str): The consumer group of the workers.
+        retry (str): The sorted set of the jobs waiting for a retry, scored by when they are due.
+        dead (str): The stream of the jobs that were given up.
+    """
+
+    stream = "mail:outbound"
+    group = "mailers"
+    retry = "mail:retry"
+    dead = "mail:dead"
+
+    async def enqueue(self, job: dict) -> bool:
+        """
+        The enqueue function adds an email job to the stream.
+
+        :param self: Represent the instance of the class
+        :param job: dict: The recipient (email), username, host, subject and template of the email
+        :return: False when the job was dropped as a duplicate or over the limit of the recipient
+        """
+        recipient = job["email"].lower()
+        digest = hashlib.sha1(f"{recipient}:{job['template']}".encode()).hexdigest()
+        async with redis_manager.guard() as client:
+            if not await client.set(f"mail:dedupe:{digest}", 1, nx=True, ex=settings.email_dedupe_ttl):
+                logger.info("Duplicate %s email to %s dropped", job["template"], recipient)
+                return False
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.set(f"mail:rate:{recipient}", 0, nx=True, ex=settings.email_recipient_window)
+                pipe.incr(f"mail:rate:{recipient}")
+                _, sent = await pipe.execute()
+            if sent > settings.email_recipient_limit:
+                logger.warning("Email limit of %s reached, %s email dropped", recipient, job["template"])
+                return False
+            await client.xadd(self.stream, {"job": json.dumps({**job, "queued_at": time.time()})})
+            return True
+
+
+email_queue = EmailQueue()
+
 
 async def send_email(email: EmailStr, username: str, host: str, subject: str, template: str):
     """
-    The send_email function sends an email to the user with a link to verify their account.
-        The function takes in four arguments:
-            1) email - the user's email address, which is used as both the recipient and sender of this message.
-            2) username - the username that was chosen by this user when they signed up for an account. This will be displayed in
-                a greeting at the top of their verification page, so it should be personalized for each individual user.
-            3) host - The domain name where our website is hosted (e.g., &quot;localhost&quot; or &quot;127.0.
+    The send_email function queues an email to the user with a link to verify their account or reset the password.
+    The email is rendered and sent by the email workers. When the queue is not reachable the email is sent at once,
+    so it is not lost.
 
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the template
     :param host: str: Create the link for the user to verify their email address
     :param subject: str: Set the subject of the email
     :param template: str: Specify the template to use for sending the email
-    :return: A coroutine that is not awaited
+    :return: None
     """
+    job = {"email": str(email), "username": username, "host": host, "subject": subject, "template": template}
     try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject=subject,
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html,
-        )
+        await email_queue.enqueue(job)
+        return
+    except (redis.RedisError, OSError) as error:
+        logger.warning("Email queue is not reachable, sending %s directly: %s", template, error)
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name=template)
-    except ConnectionErrors as err:
-        print(err)
+    pool = SMTPPool(1)
+    try:
+        await pool.send(build_message(job))
+    except (aiosmtplib.SMTPException, OSError) as error:
+        logger.error("Email to %s was not sent: %s", email, error)
+    finally:
+        await pool.close()
@@ -0,0 +1,218 @@
+"""
+The email worker drains the outbound email queue, it runs in its own process:
+
+    python -m src.services.email_worker
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+
+import aiosmtplib
+import redis
+
+from src.conf.config import settings
+from src.database.redis import redis_manager
+from src.services.email import SMTPPool, build_message, email_queue
+
+logger = logging.getLogger(__name__)
+
+# Shorter than the socket timeout of the Redis pool, so a blocking read on an idle stream does not time out.
+BLOCK_MS = 1000
+
+
+class EmailWorker:
+    """
+    A consumer of the outbound email stream.
+
+    Every worker reads new jobs as a member of the consumer group and also claims the jobs that another
+    worker read but did not acknowledge for settings.email_claim_idle seconds, e.g. because it crashed.
+    Failed jobs are retried with exponential backoff, jobs that failed settings.email_max_attempts times
+    or were refused by the server are moved to the dead-letter stream.
+
+    Attributes:
+        pool (SMTPPool): The SMTP connections of the worker.
+        consumer (str): The name of the worker in the consumer group.
+    """
+
+    def __init__(self, pool: SMTPPool, consumer: str | None = None):
+        self.pool = pool
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+
+    async def setup(self) -> None:
+        """
+        The setup function creates the stream and the consumer group when they do not exist yet.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        try:
+            await redis_manager.client.xgroup_create(email_queue.stream, email_queue.group, id="0", mkstream=True)
+        except redis.ResponseError as error:
+            if "BUSYGROUP" not in str(error):
+                raise
+
+    async def requeue_due(self) -> None:
+        """
+        The requeue_due function moves the jobs whose retry is due back to the stream.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        client = redis_manager.client
+        due = await client.zrangebyscore(email_queue.retry, "-inf", time.time(), start=0, num=settings.email_batch_size)
+        for payload in due:
+            # Only the worker that removed the job requeues it.
+            if await client.zrem(email_queue.retry, payload):
+                await client.xadd(email_queue.stream, {"job": payload})
+
+    async def read(self, block: int | None = BLOCK_MS) -> list:
+        """
+        The read function claims the stale jobs of other workers, then reads new jobs.
+
+        :param self: Represent the instance of the class
+        :param block: int | None: How long to wait for new jobs in milliseconds, None to return at once
+        :return: The entries, (id, fields) pairs
+        """
+        client = redis_manager.client
+        _, entries, *_ = await client.xautoclaim(
+            email_queue.stream,
+            email_queue.group,
+            self.consumer,
+            min_idle_time=settings.email_claim_idle * 1000,
+            count=settings.email_batch_size,
+        )
+        # Entries deleted while they were pending are returned without fields.
+        entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+        if entries:
+            return entries
+        response = await client.xreadgroup(
+            email_queue.group, self.consumer, {email_queue.stream: ">"}, count=settings.email_batch_size, block=block
+        )
+        return response[0][1] if response else []
+
+    async def handle(self, entry_id, fields: dict) -> None:
+        """
+        The handle function sends the email of a job and acknowledges it, a failed job is scheduled for a retry.
+        A job that can not be read or rendered is moved to the dead-letter stream, so it is not claimed again
+        by every worker.
+
+        :param self: Represent the instance of the class
+        :param entry_id: The id of the stream entry
+        :param fields: dict: The fields of the entry
+        :return: None
+        """
+        job = None
+        try:
+            job = json.loads(fields[b"job"])
+            message = build_message(job)
+        except Exception as error:
+            if not isinstance(job, dict):
+                payload = fields.get(b"job", b"")
+                job = {"raw": payload.decode(errors="replace") if isinstance(payload, bytes) else str(payload)}
+            await self.give_up(job, error)
+        else:
+            try:
+                await self.pool.send(message)
+            except aiosmtplib.SMTPRecipientsRefused as error:
+                await self.give_up(job, error)
+            except aiosmtplib.SMTPResponseException as error:
+                if error.code >= 500:
+                    await self.give_up(job, error)
+                else:
+                    await self.retry(job, error)
+            except (aiosmtplib.SMTPException, OSError) as error:
+                await self.retry(job, error)
+            except Exception as error:
+                await self.give_up(job, error)
+
+        async with redis_manager.client.pipeline(transaction=True) as pipe:
+            pipe.xack(email_queue.stream, email_queue.group, entry_id)
+            pipe.xdel(email_queue.stream, entry_id)
+            await pipe.execute()
+
+    async def retry(self, job: dict, error: Exception) -> None:
+        """
+        The retry function schedules a failed job again after settings.email_retry_base * 2 ** (attempts - 1) seconds.
+
+        :param self: Represent the instance of the class
+        :param job: dict: The job
+        :param error: Exception: Why it failed
+        :return: None
+        """
+        job["attempts"] = job.get("attempts", 0) + 1
+        if job["attempts"] >= settings.email_max_attempts:
+            await self.give_up(job, error)
+            return
+        delay = settings.email_retry_base * 2 ** (job["attempts"] - 1)
+        logger.warning("Email to %s failed (%s), retry %d in %.0f s", job["email"], error, job["attempts"], delay)
+        await redis_manager.client.zadd(email_queue.retry, {json.dumps(job): time.time() + delay})
+
+    async def give_up(self, job: dict, error: Exception) -> None:
+        """
+        The give_up function moves a job to the dead-letter stream.
+
+        :param self: Represent the instance of the class
+        :param job: dict: The job
+        :param error: Exception: Why it failed
+        :return: None
+        """
+        logger.error("Email to %s was not sent: %r", job.get("email", "an unknown recipient"), error)
+        await redis_manager.client.xadd(email_queue.dead, {"job": json.dumps(job), "error": repr(error)})
+
+    async def run_once(self, block: int | None = BLOCK_MS) -> int:
+        """
+        The run_once function handles one batch of jobs.
+
+        :param self: Represent the instance of the class
+        :param block: int | None: How long to wait for new jobs in milliseconds, None to return at once
+        :return: The number of jobs handled
+        """
+        await self.requeue_due()
+        entries = await self.read(block)
+        # Sent concurrently, as many at once as the SMTP pool has connections.
+        # A job that fails stays pending and is claimed again, it does not stop the other jobs of the batch.
+        results = await asyncio.gather(*(self.handle(entry_id, fields) for entry_id, fields in entries), return_exceptions=True)
+        for (entry_id, _), result in zip(entries, results):
+            if isinstance(result, BaseException):
+                logger.error("Email job %s was not handled: %r", entry_id, result)
+        return len(entries)
+
+    async def run(self) -> None:
+        """
+        The run function drains the queue until the worker is stopped, Redis outages are waited out.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while True:
+            try:
+                await self.setup()
+                while True:
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, OSError) as error:
+                logger.warning("Email worker lost Redis: %s", error)
+                await asyncio.sleep(1)
+
+
+async def main() -> None:
+    """
+    The main function runs an email worker until it is stopped.
+
+    :return: None
+    """
+    pool = SMTPPool(settings.email_smtp_pool_size)
+    try:
+        await EmailWorker(pool).run()
+    finally:
+        await pool.close()
+        await redis_manager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
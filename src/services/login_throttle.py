@@ -0,0 +1,180 @@
+import logging
+import math
+import time
+
+import redis
+from fastapi import HTTPException, status
+
+from src.conf.config import settings
+from src.database.redis import redis_manager
+from src.services.cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+
+class LoginThrottle:
+    """
+    Failed login counters with progressive backoff, checked before the user lookup and bcrypt.
+
+    Failures are counted per account and per client IP for settings.login_fail_window seconds.
+    Past the free attempts every failure locks the account or the IP for
+    settings.login_backoff_base * 2 ** (extra failures - 1) seconds, up to settings.login_backoff_max.
+    Locks are kept in Redis, so every worker sees them, and in a local cache, so a client
+    hammering a locked account is rejected without a round trip. When Redis is unavailable
+    the failures are counted by every worker on its own, so a worker still throttles the attempts it serves.
+
+    Attributes:
+        locks (LocalCache): The locks seen by this worker, until they expire.
+        failures (LocalCache): The failures counted by this worker while Redis was unavailable,
+            with the end of the lock they caused.
+    """
+
+    def __init__(self):
+        self.locks = LocalCache(settings.login_lock_cache_size, ttl=0)
+        self.failures = LocalCache(settings.login_lock_cache_size, ttl=settings.login_fail_window)
+
+    @staticmethod
+    def subjects(email: str, ip: str | None) -> list[str]:
+        """
+        The subjects function lists what a login attempt is counted against.
+
+        :param email: str: The email sent in the login form
+        :param ip: str | None: The address of the client
+        :return: The subjects, the account first
+        """
+        subjects = [f"acct:{email.strip().lower()}"]
+        if ip:
+            subjects.append(f"ip:{ip}")
+        return subjects
+
+    @staticmethod
+    def backoff(failures: int, free_attempts: int) -> float:
+        """
+        The backoff function calculates how long a subject is locked after a failure.
+
+        :param failures: int: The failures in the current window
+        :param free_attempts: int: The failures allowed without a lock
+        :return: The lock in seconds, 0 when the subject is not locked
+        """
+        extra = failures - free_attempts
+        if extra <= 0:
+            return 0.0
+        return min(settings.login_backoff_base * 2 ** min(extra - 1, 32), settings.login_backoff_max)
+
+    @staticmethod
+    def too_many_attempts(retry_after: float) -> HTTPException:
+        """
+        The too_many_attempts function builds the 429 error of a locked login.
+
+        :param retry_after: float: Seconds until the lock expires
+        :return: The HTTPException to raise
+        """
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    async def check(self, email: str, ip: str | None) -> None:
+        """
+        The check function rejects a login attempt while the account or the IP is locked,
+        by a lock seen in Redis or by the failures this worker counted while Redis was unavailable.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email sent in the login form
+        :param ip: str | None: The address of the client
+        :return: None
+        """
+        subjects = self.subjects(email, ip)
+        now = time.monotonic()
+        for subject in subjects:
+            until = self.locks.get(subject)
+            if until is not None:
+                raise self.too_many_attempts(until - now)
+            _, until = self.failures.get(subject) or (0, 0.0)
+            if until > now:
+                raise self.too_many_attempts(until - now)
+
+        try:
+            async with redis_manager.guard() as client, client.pipeline(transaction=False) as pipe:
+                for subject in subjects:
+                    pipe.pttl(f"login:lock:{subject}")
+                ttls = await pipe.execute()
+        except (redis.RedisError, OSError) as error:
+            logger.warning("Login throttle check failed: %s", error)
+            return
+
+        retry_after = max(ttls) / 1000
+        if retry_after > 0:
+            for subject, ttl in zip(subjects, ttls):
+                if ttl > 0:
+                    self.locks.set(subject, now + ttl / 1000, ttl=ttl / 1000)
+            raise self.too_many_attempts(retry_after)
+
+    async def failed(self, email: str, ip: str | None) -> None:
+        """
+        The failed function counts a failed login and locks the account or the IP past the free attempts.
+        When Redis is unavailable the failure is counted in this worker.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email sent in the login form
+        :param ip: str | None: The address of the client
+        :return: None
+        """
+        subjects = self.subjects(email, ip)
+        free_attempts = [settings.login_account_free_attempts, settings.login_ip_free_attempts]
+        try:
+            async with redis_manager.guard() as client:
+                async with client.pipeline(transaction=False) as pipe:
+                    for subject in subjects:
+                        pipe.incr(f"login:fail:{subject}")
+                        pipe.expire(f"login:fail:{subject}", settings.login_fail_window)
+                    results = await pipe.execute()
+
+                now = time.monotonic()
+                async with client.pipeline(transaction=False) as pipe:
+                    for subject, failures, free in zip(subjects, results[::2], free_attempts):
+                        delay = self.backoff(failures, free)
+                        if delay:
+                            pipe.set(f"login:lock:{subject}", failures, px=int(delay * 1000))
+                            self.locks.set(subject, now + delay, ttl=delay)
+                    await pipe.execute()
+        except (redis.RedisError, OSError) as error:
+            logger.warning("Login throttle update failed, counting the failure locally: %s", error)
+            self.failed_locally(subjects, free_attempts)
+
+    def failed_locally(self, subjects: list[str], free_attempts: list[int]) -> None:
+        """
+        The failed_locally function counts a failed login in this worker, like failed does in Redis.
+        The counters expire settings.login_fail_window seconds after the last failure.
+
+        :param self: Represent the instance of the class
+        :param subjects: list[str]: The account and the IP of the attempt
+        :param free_attempts: list[int]: The failures allowed without a lock for every subject
+        :return: None
+        """
+        now = time.monotonic()
+        for subject, free in zip(subjects, free_attempts):
+            failures, until = self.failures.get(subject) or (0, 0.0)
+            delay = self.backoff(failures + 1, free)
+            self.failures.set(subject, (failures + 1, max(until, now + delay)))
+
+    async def succeeded(self, email: str) -> None:
+        """
+        The succeeded function resets the failures of an account after a successful login.
+        The failures of the IP are kept, a client guessing many accounts stays throttled.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: None
+        """
+        subject = self.subjects(email, None)[0]
+        self.failures.pop(subject)
+        try:
+            async with redis_manager.guard() as client:
+                await client.delete(f"login:fail:{subject}")
+        except (redis.RedisError, OSError) as error:
+            logger.warning("Login throttle reset failed: %s", error)
+
+
+login_throttle = LoginThrottle()
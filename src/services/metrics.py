@@ -0,0 +1,375 @@
+import contextvars
+import hmac
+import logging
+import os
+import re
+import time
+from ipaddress import ip_address, ip_network
+from typing import Callable, Iterable, Mapping
+
+from fastapi import HTTPException, Request, status
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the HTTP requests until the response is sent.",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being served.", ["method"], multiprocess_mode="livesum")
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Duration of the SQL statements.",
+    ["database", "operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements run while serving one HTTP request.",
+    ["route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+DB_REPEATED_QUERY_REQUESTS = Counter(
+    "db_repeated_query_requests_total",
+    "HTTP requests that ran the same statement more than settings.db_repeated_query_limit times.",
+    ["route"],
+)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "SQL statements that raised an error.", ["database"])
+REDIS_CALL_DURATION = Histogram(
+    "redis_call_duration_seconds",
+    "Duration of the guarded Redis calls.",
+    ["outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5),
+)
+
+UNMATCHED_ROUTE = "unmatched"
+# With several workers every worker writes its metrics to this directory and /metrics adds them up.
+# It has to be set, and emptied, before the workers start: prometheus_client reads it when it is imported.
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+# Expanded IN lists, (?, ?, ?) or ($1, $2), have the same shape whatever their length.
+PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|\$\d+|%\(\w+\)s)\s*,)+\s*(?:\?|%s|\$\d+|%\(\w+\)s)\s*\)")
+
+
+class QueryStats:
+    """
+    The SQL statements run while serving one request, collected by the hooks of instrument_engine.
+
+    Attributes:
+        count (int): The number of statements.
+        duration (float): The time spent in the statements, in seconds.
+        shapes (dict[str, int]): How many times every statement was run, with its parameters left out.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: dict[str, int] = {}
+
+    def record(self, statement: str, duration: float) -> None:
+        """
+        The record function adds one statement to the totals of the request.
+
+        :param self: Represent the instance of the class
+        :param statement: str: The SQL sent to the database, with placeholders for the parameters
+        :param duration: float: How long the statement ran, in seconds
+        :return: None
+        """
+        self.count += 1
+        self.duration += duration
+        shape = PLACEHOLDER_LIST.sub("(?)", statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self, limit: int) -> list[tuple[str, int]]:
+        """
+        The repeated function finds the statements run more than limit times, the sign of an N+1 query.
+
+        :param self: Represent the instance of the class
+        :param limit: int: How many runs of one statement are expected at most
+        :return: The statements and their runs, the most repeated first
+        """
+        return sorted(((shape, runs) for shape, runs in self.shapes.items() if runs > limit), key=lambda item: -item[1])
+
+
+query_stats: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar("query_stats", default=None)
+
+
+class MetricsMiddleware:
+    """
+    An ASGI middleware that records the latency of every HTTP request in REQUEST_DURATION.
+
+    Requests are labelled with the path template of the route (/api/contacts/{contact_id}), never with the raw path,
+    so the number of series stays bounded. The duration is measured with a monotonic clock until the response starts
+    and is also sent in the standard Server-Timing header.
+
+    The SQL statements of the request are collected in a QueryStats, available as request.state.query_stats.
+    Requests that repeat one statement more than settings.db_repeated_query_limit times are logged as possible N+1 queries.
+    With settings.db_query_header the totals are sent in the X-Query-Count and X-Query-Time headers, for development.
+
+    Attributes:
+        app (ASGIApp): The wrapped application.
+        routes (dict): The path templates of the routes by their endpoint, built on the first request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.routes: dict | None = None
+
+    def route_name(self, scope: Scope) -> str:
+        """
+        The route_name function finds the path template of the route that served a request.
+        The router stores the endpoint it matched in the scope, there is no need to match the path again.
+
+        :param self: Represent the instance of the class
+        :param scope: Scope: The ASGI scope of the request after it was served
+        :return: The path template of the route
+        """
+        if self.routes is None:
+            self.routes = {}
+            for route in getattr(scope.get("app"), "routes", ()):
+                endpoint = getattr(route, "endpoint", None) or getattr(route, "app", None)
+                if endpoint is not None:
+                    self.routes.setdefault(endpoint, route.path)
+        return self.routes.get(scope.get("endpoint"), UNMATCHED_ROUTE)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        start = time.perf_counter()
+        duration = None
+        status_code = 500
+        stats = QueryStats()
+        scope.setdefault("state", {})["query_stats"] = stats
+        token = query_stats.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal duration, status_code
+            if message["type"] == "http.response.start":
+                duration = time.perf_counter() - start
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f"app;dur={duration * 1000:.1f}, db;dur={stats.duration * 1000:.1f}".encode()))
+                if settings.db_query_header:
+                    headers.append((b"x-query-count", str(stats.count).encode()))
+                    headers.append((b"x-query-time", f"{stats.duration * 1000:.1f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            query_stats.reset(token)
+            if duration is None:
+                duration = time.perf_counter() - start
+            route = self.route_name(scope)
+            REQUEST_DURATION.labels(method, route, str(status_code)).observe(duration)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+            repeated = stats.repeated(settings.db_repeated_query_limit)
+            if repeated:
+                DB_REPEATED_QUERY_REQUESTS.labels(route).inc()
+                shape, runs = repeated[0]
+                logger.warning("Possible N+1 query in %s %s: %d statements, %d runs of %s", method, route, stats.count, runs, shape)
+
+
+def instrument_engine(engine: AsyncEngine, database: str) -> None:
+    """
+    The instrument_engine function records the duration of every SQL statement of an engine in DB_QUERY_DURATION,
+    labelled with the database and the first keyword of the statement (SELECT, INSERT, ...).
+    The statement is also added to the QueryStats of the current request, and statements slower than
+    settings.db_slow_query seconds are logged without the values of their parameters.
+
+    :param engine: AsyncEngine: The engine to instrument
+    :param database: str: The label of the database, "primary" or "replica"
+    :return: None
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_DURATION.labels(database, operation).observe(duration)
+        stats = query_stats.get()
+        if stats is not None:
+            stats.record(statement, duration)
+        if duration >= settings.db_slow_query:
+            rows = f"{len(parameters)} rows" if executemany else "1 row"
+            logger.warning("Slow query on %s (%.1f ms, parameters of %s redacted): %s", database, duration * 1000, rows, statement)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+        DB_QUERY_ERRORS.labels(database).inc()
+
+
+class StatsCollector(Collector):
+    """
+    A collector that turns the stats of the pools and of the caches into metrics when /metrics is scraped,
+    so they cost nothing while requests are served.
+
+    Attributes:
+        db_pools (Callable[[], dict]): Returns the metrics of the database pools, DatabaseSessionManager.pool_stats.
+        redis_pool (Callable[[], dict]): Returns the state of the Redis pool, RedisManager.stats.
+        caches (Mapping[str, Callable[[], dict]]): Return the hits and the misses of every cache by its name.
+    """
+
+    def __init__(self, db_pools: Callable[[], dict], redis_pool: Callable[[], dict], caches: Mapping[str, Callable[[], dict]]):
+        self.db_pools = db_pools
+        self.redis_pool = redis_pool
+        self.caches = caches
+
+    def collect_db_pools(self) -> Iterable:
+        """
+        The collect_db_pools function yields the metrics of the database pools that keep connections.
+
+        :param self: Represent the instance of the class
+        :return: The metric families
+        """
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections handed out by the pool.", labels=["database"])
+        size = GaugeMetricFamily("db_pool_size", "Connections kept by the pool.", labels=["database"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections opened over the pool size.", labels=["database"])
+        wait_max = GaugeMetricFamily("db_pool_wait_max_seconds", "Longest wait for a connection.", labels=["database"])
+        checkouts = CounterMetricFamily("db_pool_checkouts", "Connections handed out.", labels=["database"])
+        timeouts = CounterMetricFamily("db_pool_timeouts", "Checkouts that timed out.", labels=["database"])
+
+        stats = self.db_pools()
+        pools = [("primary", stats["primary"])] + [(f"replica{index}", pool) for index, pool in enumerate(stats["replicas"])]
+        for database, pool in pools:
+            if "checkouts" not in pool:
+                continue
+            checked_out.add_metric([database], pool["checked_out"])
+            size.add_metric([database], pool["size"])
+            overflow.add_metric([database], pool["overflow"])
+            wait_max.add_metric([database], pool["wait_max_ms"] / 1000)
+            checkouts.add_metric([database], pool["checkouts"])
+            timeouts.add_metric([database], pool["timeouts"])
+        yield from (checked_out, size, overflow, wait_max, checkouts, timeouts)
+
+    def collect_redis_pool(self) -> Iterable:
+        """
+        The collect_redis_pool function yields the metrics of the Redis pool and of its circuit breaker.
+
+        :param self: Represent the instance of the class
+        :return: The metric families
+        """
+        stats = self.redis_pool()
+        circuit = GaugeMetricFamily("redis_circuit_state", "State of the Redis circuit breaker.", labels=["state"])
+        for state in ("closed", "open", "half-open"):
+            circuit.add_metric([state], 1 if stats["circuit"] == state else 0)
+        yield circuit
+        yield CounterMetricFamily("redis_circuit_trips", "Times the Redis circuit opened.", value=stats["circuit_trips"])
+        if "max_connections" in stats:
+            yield GaugeMetricFamily("redis_pool_max_connections", "Size limit of the Redis pool.", value=stats["max_connections"])
+            yield GaugeMetricFamily("redis_pool_in_use", "Redis connections in use.", value=stats["in_use_connections"])
+            yield GaugeMetricFamily("redis_pool_available", "Idle Redis connections.", value=stats["available_connections"])
+
+    def collect_caches(self) -> Iterable:
+        """
+        The collect_caches function yields the reads and the hit ratio of every cache.
+
+        :param self: Represent the instance of the class
+        :return: The metric families
+        """
+        reads = CounterMetricFamily("cache_reads", "Cache reads by result.", labels=["cache", "result"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Share of the cache reads that were hits.", labels=["cache"])
+        for name, stats in self.caches.items():
+            counters = stats()
+            reads.add_metric([name, "hit"], counters["hits"])
+            reads.add_metric([name, "miss"], counters["misses"])
+            ratio.add_metric([name], counters["hit_ratio"])
+        yield reads
+        yield ratio
+
+    def collect(self) -> Iterable:
+        yield from self.collect_db_pools()
+        yield from self.collect_redis_pool()
+        yield from self.collect_caches()
+
+
+def metrics_response(collectors: Iterable[Collector] = ()) -> Response:
+    """
+    The metrics_response function renders the metrics in the Prometheus text format.
+    With a single worker these are the metrics of the default registry. When PROMETHEUS_MULTIPROC_DIR is set
+    the counters, histograms and gauges of all the workers are read from that directory and added up,
+    the collectors only report the pools and the caches of the worker that serves the scrape.
+
+    :param collectors: Iterable[Collector]: The collectors of this worker, used in multiprocess mode
+    :return: A Response with the metrics
+    """
+    registry = REGISTRY
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROCESS_DIR)
+        for collector in collectors:
+            registry.register(collector)
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead() -> None:
+    """
+    The mark_worker_dead function drops the live gauges of this worker from the multiprocess directory
+    when the worker stops, so http_requests_in_progress does not keep the requests of a dead worker.
+
+    :return: None
+    """
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(os.getpid(), MULTIPROCESS_DIR)
+
+
+async def scrape_access(request: Request) -> None:
+    """
+    The scrape_access function lets the Prometheus scraper read /metrics without a user account.
+    The request is allowed from the networks of settings.metrics_allowed_ips, or with the static
+    settings.metrics_token sent as a bearer token. Nothing is served when neither is configured.
+
+    :param request: Request: The scrape request
+    :return: None
+    """
+    allowed = [network.strip() for network in settings.metrics_allowed_ips.split(",") if network.strip()]
+    networks = [ip_network(network, strict=False) for network in allowed]
+    if networks and request.client:
+        try:
+            address = ip_address(request.client.host)
+        except ValueError:
+            address = None
+        if address is not None and any(address in network for network in networks):
+            return
+    if settings.metrics_token:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), settings.metrics_token.encode()):
+            return
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid scrape token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed IP address")
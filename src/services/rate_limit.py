@@ -0,0 +1,244 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+import redis
+from fastapi import Depends, HTTPException, Response, status
+
+from src.conf.config import settings
+from src.database.redis import redis_manager
+from src.schemas.user import UserClaims
+from src.services.auth import auth_service
+from src.services.cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+# GCRA (generic cell rate algorithm): the key holds the theoretical arrival time (TAT) in milliseconds.
+# KEYS[1] - the key, ARGV - the emission interval and the limit in milliseconds and requests, the tokens asked for.
+# Up to the tokens asked for are granted at once, the worker serves them without calling Redis again.
+# Returns the granted tokens, the tokens left, the milliseconds until a token is free and until the limit is full again.
+GCRA_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or 0)
+if tat < now then
+    tat = now
+end
+local available = math.floor((interval * limit - (tat - now)) / interval)
+local granted = math.max(0, math.min(wanted, available))
+if granted == 0 then
+    return {0, 0, tat - now - interval * (limit - 1), tat - now}
+end
+tat = tat + interval * granted
+redis.call('SET', KEYS[1], tat, 'PX', math.ceil(tat - now))
+return {granted, available - granted, 0, tat - now}
+"""
+
+
+@dataclass
+class Policy:
+    """
+    A rate limit: times requests per seconds.
+
+    Attributes:
+        times (int): The requests allowed in the window.
+        seconds (int): The window in seconds.
+    """
+
+    times: int
+    seconds: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Policy":
+        """
+        The parse function reads a policy written as "times/seconds", e.g. "10/60".
+
+        :param value: str: The policy
+        :return: The policy
+        """
+        times, seconds = value.split("/")
+        return cls(int(times), int(seconds))
+
+    @property
+    def interval(self) -> float:
+        """
+        The interval function returns the milliseconds between two requests at the steady rate.
+
+        :return: The emission interval in milliseconds
+        """
+        return self.seconds * 1000 / self.times
+
+
+@dataclass
+class Decision:
+    """
+    The outcome of a rate limit check.
+
+    Attributes:
+        allowed (bool): If the request may be served.
+        limit (int): The requests allowed in the window.
+        remaining (int): The requests left in the window.
+        reset (float): Seconds until the whole limit is available again.
+        retry_after (float): Seconds until the next request is allowed, 0 when it is allowed now.
+    """
+
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float
+    retry_after: float = 0.0
+
+    def headers(self) -> dict:
+        """
+        The headers function returns the RateLimit-* headers of the decision, and Retry-After for a rejection.
+
+        :return: The headers
+        """
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class RateLimiter:
+    """
+    A GCRA rate limiter shared by all workers through Redis.
+
+    Every worker leases up to settings.rate_limit_batch tokens of a key at once, at most a tenth of the limit,
+    and serves them from memory, so a burst costs one Redis call per lease instead of one per request.
+    A lease of n tokens moves the theoretical arrival time in Redis n emission intervals ahead, so it is kept for
+    n emission intervals: by then Redis has earned the tokens back, whether they were used or not, and a client
+    below its limit is never throttled by tokens that expired unused. Limits under 20 requests per window
+    lease one token at a time, every request of them is counted in Redis.
+    While Redis is not reachable every worker limits on its own with a local token bucket of the same rate.
+
+    Attributes:
+        leases (LocalCache): The tokens leased from Redis by key, [tokens, remaining in Redis, reset at].
+        buckets (LocalCache): The local token buckets by key, [tokens, last refill time].
+    """
+
+    def __init__(self):
+        self.leases = LocalCache(settings.rate_limit_local_size, ttl=0)
+        self.buckets = LocalCache(settings.rate_limit_local_size, ttl=0)
+        self._script = None
+
+    def batch(self, policy: Policy) -> int:
+        """
+        The batch function returns how many tokens are leased at once, at most a tenth of the limit.
+
+        :param self: Represent the instance of the class
+        :param policy: Policy: The rate limit
+        :return: The tokens to ask for
+        """
+        return max(1, min(settings.rate_limit_batch, policy.times // 10))
+
+    async def hit(self, key: str, policy: Policy) -> Decision:
+        """
+        The hit function counts a request against the limit of a key.
+
+        :param self: Represent the instance of the class
+        :param key: str: The key of the client and the policy
+        :param policy: Policy: The rate limit
+        :return: The decision
+        """
+        now = time.monotonic()
+        lease = self.leases.get(key)
+        if lease is not None and lease[0] > 0:
+            lease[0] -= 1
+            return Decision(True, policy.times, lease[0] + lease[1], max(0.0, lease[2] - now))
+
+        try:
+            async with redis_manager.guard() as client:
+                if self._script is None:
+                    self._script = client.register_script(GCRA_SCRIPT)
+                granted, remaining, retry_after, reset = await self._script(
+                    keys=[f"ratelimit:{key}"], args=[policy.interval, policy.times, self.batch(policy)], client=client
+                )
+        except (redis.RedisError, OSError) as error:
+            logger.debug("Rate limit check falls back to the local bucket: %s", error)
+            return self.local_hit(key, policy)
+
+        if granted == 0:
+            return Decision(False, policy.times, 0, int(reset) / 1000, int(retry_after) / 1000)
+        if granted > 1:
+            self.leases.set(key, [granted - 1, remaining, now + int(reset) / 1000], ttl=granted * policy.interval / 1000)
+        return Decision(True, policy.times, granted - 1 + remaining, int(reset) / 1000)
+
+    def local_hit(self, key: str, policy: Policy) -> Decision:
+        """
+        The local_hit function counts a request in the in-process token bucket of a key.
+        The bucket holds policy.times tokens and refills at policy.times tokens per window.
+
+        :param self: Represent the instance of the class
+        :param key: str: The key of the client and the policy
+        :param policy: Policy: The rate limit
+        :return: The decision
+        """
+        now = time.monotonic()
+        rate = 1000 / policy.interval
+        bucket = self.buckets.get(key) or [float(policy.times), now]
+        tokens = min(float(policy.times), bucket[0] + (now - bucket[1]) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets.set(key, [tokens, now], ttl=policy.seconds)
+        reset = (policy.times - tokens) / rate
+        retry_after = 0.0 if allowed else (1 - tokens) / rate
+        return Decision(allowed, policy.times, int(tokens), reset, retry_after)
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimit:
+    """
+    A dependency that applies the rate limit policy of a route to the current user.
+
+    Policies come from settings.rate_limits: the entry "<name>:<role>" applies to the users of a role,
+    otherwise the entry "<name>" applies; a route without a policy is not limited.
+    Every response carries the RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset headers,
+    a rejected request gets 429 with Retry-After.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def policy(self, role: str) -> Policy | None:
+        """
+        The policy function finds the policy of the route for a role.
+
+        :param self: Represent the instance of the class
+        :param role: str: The role of the user
+        :return: The policy or None when the route is not limited
+        """
+        value = settings.rate_limits.get(f"{self.name}:{role}") or settings.rate_limits.get(self.name)
+        return Policy.parse(value) if value else None
+
+    async def __call__(self, response: Response, current_user: UserClaims = Depends(auth_service.get_current_claims)):
+        """
+        The __call__ function counts the request of the current user against the policy of the route.
+
+        :param self: Access the class attributes
+        :param response: Response: Add the RateLimit-* headers
+        :param current_user: UserClaims: Get the current user
+        :return: None
+        """
+        role = getattr(current_user.roles, "value", current_user.roles)
+        policy = self.policy(role)
+        if policy is None:
+            return
+        decision = await rate_limiter.hit(f"{self.name}:{current_user.id}", policy)
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests", headers=decision.headers()
+            )
+        response.headers.update(decision.headers())
@@ -0,0 +1,136 @@
+import logging
+import uuid
+
+import redis
+from fastapi import HTTPException, status
+
+from src.conf.config import settings
+from src.database.redis import redis_manager
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] - the family, ARGV - the presented jti, the next jti and the TTL in seconds.
+# Returns 1 when the token was rotated, 0 when an already used token was presented
+# (the family is revoked) and -1 when the family expired or was revoked before.
+ROTATE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'jti')
+if not current then
+    return -1
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class RefreshTokenStore:
+    """
+    Refresh tokens kept in Redis as rotation families.
+
+    A login starts a family, every refresh token carries the id of its family (fid) and its own id (jti).
+    Only the last issued jti of a family is accepted, it is swapped for the next one atomically.
+    When a token that was already used is presented again, it was stolen or replayed, and the
+    whole family is revoked. Families expire settings.refresh_token_ttl seconds after the last refresh.
+    """
+
+    def __init__(self):
+        self._rotate = None
+
+    @staticmethod
+    def family_key(family: str) -> str:
+        """
+        The family_key function builds the Redis key of a token family.
+
+        :param family: str: The id of the family
+        :return: The Redis key
+        """
+        return f"refresh:family:{family}"
+
+    @staticmethod
+    def user_key(email: str) -> str:
+        """
+        The user_key function builds the Redis key of the set of the token families of a user.
+
+        :param email: str: The email of the user
+        :return: The Redis key
+        """
+        return f"refresh:user:{email}"
+
+    @staticmethod
+    def new_id() -> str:
+        """
+        The new_id function generates the id of a family or a token.
+
+        :return: A random hex string
+        """
+        return uuid.uuid4().hex
+
+    async def start(self, email: str) -> dict:
+        """
+        The start function starts a token family at login.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: The claims to add to the refresh token, empty when Redis is unavailable
+        """
+        family, jti = self.new_id(), self.new_id()
+        try:
+            async with redis_manager.guard() as client, client.pipeline(transaction=False) as pipe:
+                pipe.hset(self.family_key(family), mapping={"sub": email, "jti": jti})
+                pipe.expire(self.family_key(family), settings.refresh_token_ttl)
+                pipe.sadd(self.user_key(email), family)
+                pipe.expire(self.user_key(email), settings.refresh_token_ttl)
+                await pipe.execute()
+        except (redis.RedisError, OSError) as error:
+            logger.warning("Refresh token family was not stored: %s", error)
+            return {}
+        return {"fid": family, "jti": jti}
+
+    async def rotate(self, family: str, jti: str | None) -> dict:
+        """
+        The rotate function accepts a refresh token of a family and issues the id of the next one.
+
+        :param self: Represent the instance of the class
+        :param family: str: The id of the family
+        :param jti: str | None: The id of the presented token
+        :return: The claims to add to the next refresh token
+        """
+        next_jti = self.new_id()
+        try:
+            async with redis_manager.guard() as client:
+                if self._rotate is None:
+                    self._rotate = client.register_script(ROTATE_SCRIPT)
+                result = await self._rotate(
+                    keys=[self.family_key(family)], args=[jti or "", next_jti, settings.refresh_token_ttl], client=client
+                )
+        except (redis.RedisError, OSError) as error:
+            logger.warning("Refresh token rotation failed: %s", error)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Token store is unavailable")
+        if result == 0:
+            logger.warning("Refresh token reuse detected, family %s revoked", family)
+        if result != 1:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        return {"fid": family, "jti": next_jti}
+
+    async def revoke_user(self, email: str) -> None:
+        """
+        The revoke_user function revokes all token families of a user, e.g. after a password change.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: None
+        """
+        try:
+            async with redis_manager.guard() as client:
+                families = await client.smembers(self.user_key(email))
+                keys = [self.family_key(family.decode() if isinstance(family, bytes) else family) for family in families]
+                await client.delete(self.user_key(email), *keys)
+        except (redis.RedisError, OSError) as error:
+            logger.warning("Refresh token families of %s were not revoked: %s", email, error)
+
+
+refresh_tokens = RefreshTokenStore()
@@ -2,7 +2,8 @@ from typing import List
 
 from fastapi import Depends, HTTPException, Request, status
 
-from src.database.models import Role, User
+from src.database.models import Role
+from src.schemas.user import UserClaims
 from src.services.auth import auth_service
 
 
@@ -13,12 +14,13 @@ class RoleAccess:
     async def __call__(
         self,
         request: Request,
-        current_user: User = Depends(auth_service.get_current_user),
+        current_user: UserClaims = Depends(auth_service.get_current_claims),
     ):
         """
         The __call__ function is a decorator that allows us to use the class as a function.
         It takes in the request and current_user, which are passed by FastAPI automatically.
         The __call__ function then checks if the user's role is allowed for this endpoint.
+        The role is taken from the access token when it carries one, without loading the user.
 
         :param self: Access the class attributes
         :param request: Request: Access the request object
@@ -2,6 +2,7 @@ import os
 
 import pytest
 import pytest_asyncio
+from fakeredis import aioredis
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
                                     create_async_engine)
@@ -9,6 +10,10 @@ from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
 from main import app
 from src.database.db import get_db
 from src.database.models import Base
+from src.database.redis import CircuitBreaker, redis_manager
+from src.services.cache import contact_cache, user_cache
+from src.services.login_throttle import login_throttle
+from src.services.refresh_tokens import refresh_tokens
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///" + os.path.join(os.getcwd(), "test.sqlite")
 
@@ -29,6 +34,20 @@ async def session():
         await conn.run_sync(Base.metadata.drop_all)
 
 
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    redis = aioredis.FakeRedis()
+    monkeypatch.setattr(redis_manager, "_client", redis)
+    monkeypatch.setattr(redis_manager, "breaker", CircuitBreaker(threshold=5, reset_timeout=5.0))
+    monkeypatch.setattr(refresh_tokens, "_rotate", None)
+    user_cache.local.clear()
+    user_cache.pending.clear()
+    contact_cache.pending.clear()
+    login_throttle.locks.clear()
+    login_throttle.failures.clear()
+    return redis
+
+
 @pytest_asyncio.fixture(scope="function")
 async def client(session):
     async def override_get_db():
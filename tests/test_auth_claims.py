@@ -0,0 +1,94 @@
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from src.conf.config import settings
+from src.database.models import Role, User
+from src.services.auth import auth_service
+from src.services.cache import user_cache
+
+
+def make_user(token_version: int = 0) -> User:
+    return User(id=7, username="writer", email="writer@example.com", password="secret", roles=Role.moderator, token_version=token_version)
+
+
+@pytest.mark.asyncio
+async def test_access_token_claims(monkeypatch):
+    monkeypatch.setattr(settings, "auth_claims_tokens", True)
+
+    token = await auth_service.create_access_token(data=auth_service.access_token_data(make_user(3)))
+    payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+
+    assert (payload["sub"], payload["uid"], payload["role"], payload["ver"]) == ("writer@example.com", 7, "moderator", 3)
+
+    monkeypatch.setattr(settings, "auth_claims_tokens", False)
+    assert auth_service.access_token_data(make_user(3)) == {"sub": "writer@example.com"}
+
+
+@pytest.mark.asyncio
+async def test_get_current_claims_from_token(monkeypatch):
+    monkeypatch.setattr(settings, "auth_claims_tokens", True)
+    await user_cache.set(make_user())
+    token = await auth_service.create_access_token(data=auth_service.access_token_data(make_user()))
+
+    with patch("src.services.auth.repository_users.get_user_by_email", AsyncMock()) as lookup:
+        claims = await auth_service.get_current_claims(token, AsyncMock())
+
+    lookup.assert_not_awaited()
+    assert (claims.id, claims.email, claims.roles) == (7, "writer@example.com", Role.moderator)
+
+
+@pytest.mark.asyncio
+async def test_get_current_claims_revoked(monkeypatch):
+    monkeypatch.setattr(settings, "auth_claims_tokens", True)
+    token = await auth_service.create_access_token(data=auth_service.access_token_data(make_user()))
+
+    with patch("src.services.auth.repository_users.get_user_by_email", AsyncMock(return_value=make_user(1))):
+        with pytest.raises(HTTPException) as error:
+            await auth_service.get_current_claims(token, AsyncMock())
+        assert error.value.status_code == 401
+
+        with pytest.raises(HTTPException):
+            await auth_service.get_current_user(token, AsyncMock())
+
+
+@pytest.mark.asyncio
+async def test_get_current_claims_legacy_token():
+    token = await auth_service.create_access_token(data={"sub": "writer@example.com"})
+
+    with patch("src.services.auth.repository_users.get_user_by_email", AsyncMock(return_value=make_user())) as lookup:
+        claims = await auth_service.get_current_claims(token, AsyncMock())
+
+    lookup.assert_awaited_once()
+    assert claims.roles is Role.moderator
+
+
+@pytest.mark.asyncio
+async def test_decode_access_token_cached():
+    auth_service.token_cache.clear()
+    token = await auth_service.create_access_token(data={"sub": "writer@example.com"})
+
+    with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as decode:
+        first = auth_service.decode_access_token(token)
+        second = auth_service.decode_access_token(token)
+
+        assert decode.call_count == 1
+        assert first == second
+
+        # The entry expires with the token, after that the token is verified again.
+        with patch("src.services.cache.time.monotonic", return_value=time.monotonic() + 16 * 60):
+            auth_service.decode_access_token(token)
+        assert decode.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_decode_access_token_rejects_invalid():
+    auth_service.token_cache.clear()
+    token = await auth_service.create_access_token(data={"sub": "writer@example.com"})
+
+    with pytest.raises(HTTPException):
+        auth_service.decode_access_token(token[:-2] + "xx")
+    assert len(auth_service.token_cache._entries) == 0
@@ -0,0 +1,85 @@
+import io
+
+import pytest
+from httpx import AsyncClient
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from src.conf.config import settings
+from src.database.models import Role, User
+from src.services.auth import auth_service
+from src.services.avatars import AvatarStore, LocalStore, avatar_key, get_avatar_store
+
+
+def png(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGBA", (width, height), (200, 10, 10, 255)).save(output, format="PNG")
+    return output.getvalue()
+
+
+@pytest.fixture()
+def avatar_user(tmp_path):
+    user = User(id=1, username="reader", email="reader@example.com", password="secret", confirmed=True, roles=Role.user)
+    app.dependency_overrides[auth_service.get_current_user] = lambda: user
+    app.dependency_overrides[get_avatar_store] = lambda: LocalStore(tmp_path, "/static/avatars")
+    yield user
+    app.dependency_overrides.pop(auth_service.get_current_user)
+    app.dependency_overrides.pop(get_avatar_store)
+
+
+@pytest.mark.asyncio
+async def test_avatar_cropped_and_stored_locally(client: AsyncClient, session: AsyncSession, avatar_user, tmp_path):
+    session.add(User(id=1, username="reader", email="reader@example.com", password="secret", confirmed=True))
+    await session.commit()
+
+    files = {"file": ("me.png", png(800, 400), "image/png")}
+    response = await client.patch("/api/users/avatar", files=files)
+
+    assert response.status_code == 200, response.text
+    url = response.json()["avatar"]
+    assert url.startswith("/static/avatars/ContactsApp/1/") and url.endswith(".jpg")
+
+    stored = tmp_path / url.removeprefix("/static/avatars/")
+    with Image.open(stored) as image:
+        assert image.format == "JPEG"
+        assert image.size == (settings.avatar_size, settings.avatar_size)
+
+    session.expire_all()
+    user = (await session.execute(select(User).filter_by(email="reader@example.com"))).scalar_one()
+    assert user.avatar == url
+
+
+@pytest.mark.asyncio
+async def test_avatar_limits(client: AsyncClient, avatar_user, monkeypatch, tmp_path):
+    response = await client.patch("/api/users/avatar", files={"file": ("me.txt", b"hello", "text/plain")})
+    assert response.status_code == 415, response.text
+
+    response = await client.patch("/api/users/avatar", files={"file": ("me.png", b"not an image", "image/png")})
+    assert response.status_code == 400, response.text
+
+    monkeypatch.setattr(settings, "avatar_max_bytes", 1024)
+    response = await client.patch("/api/users/avatar", files={"file": ("me.png", png(2000, 2000) + b"0" * 2048, "image/png")})
+    assert response.status_code == 413, response.text
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_incomplete_store_fails_when_created():
+    class UrlOnlyStore(AvatarStore):
+        def url(self, key: str) -> str:
+            return key
+
+    with pytest.raises(TypeError):
+        UrlOnlyStore()
+
+
+@pytest.mark.asyncio
+async def test_local_store_stays_in_its_directory(tmp_path):
+    store = LocalStore(tmp_path / "avatars", "/static/avatars")
+
+    with pytest.raises(ValueError):
+        await store.save("../../outside", b"image")
+
+    assert list(tmp_path.iterdir()) == []
+    assert avatar_key(7, b"image").startswith("ContactsApp/7/")
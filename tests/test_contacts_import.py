@@ -0,0 +1,125 @@
+import io
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import func, select
+from asyncpg.exceptions import UniqueViolationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import AddressBookContact, Contact, User
+from src.repository import addressbook as repository_addressbook
+from src.services.contacts_import import import_contacts
+
+
+@pytest_asyncio.fixture()
+async def owner(session: AsyncSession):
+    session.add(User(id=1, username="owner", email="owner@example.com", password="secret", confirmed=True))
+    await session.commit()
+    return 1
+
+
+def upload(content: str, filename: str) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content.encode()), filename=filename)
+
+
+@pytest.mark.asyncio
+async def test_import_csv(session: AsyncSession, owner, monkeypatch):
+    monkeypatch.setattr(settings, "import_batch_size", 2)
+    content = "\n".join(
+        [
+            "first_name,last_name,birthday,email,phone",
+            "Alex,Tester,2000-10-06,alex@example.com,380991112233",
+            "Olena,Tester,1999-01-02,olena@example.com,380991112244",
+            "Alex,Tester,2000-10-06,other@example.com,380991112255",
+            "Ivan,Tester,not-a-date,ivan@example.com,380991112266",
+            "Petro,Tester,1998-03-04,alex@example.com,380991112277",
+        ]
+    )
+
+    report = await import_contacts(upload(content, "book.csv"), None, owner, session)
+
+    assert report.imported == 2
+    assert report.failed == 3
+    errors = {error.line: error.detail for error in report.errors}
+    assert errors[4] == "Contact with first_name and last_name already exists!"
+    assert errors[5].startswith("birthday:")
+    assert errors[6] == "Email is exists!"
+    assert (await session.execute(select(func.count()).select_from(AddressBookContact))).scalar() == 2
+    assert (await session.execute(select(func.count()).select_from(Contact))).scalar() == 4
+
+
+@pytest.mark.asyncio
+async def test_import_jsonl(session: AsyncSession, owner):
+    lines = [
+        json.dumps({"first_name": "Alex", "last_name": "Tester", "birthday": "2000-10-06", "email": "a@example.com", "phone": "380991112233"}),
+        "",
+        "{broken",
+        json.dumps({"first_name": "Olena", "last_name": "Tester", "birthday": "1999-01-02", "email": "o@example.com", "phone": "380991112244"}),
+    ]
+
+    report = await import_contacts(upload("\n".join(lines), "book.data"), "jsonl", owner, session)
+
+    assert report.imported == 2
+    assert report.failed == 1
+    assert report.errors[0].line == 3
+
+
+@pytest.mark.asyncio
+async def test_import_unknown_format(session: AsyncSession, owner):
+    with pytest.raises(HTTPException) as error:
+        await import_contacts(upload("", "book.xlsx"), None, owner, session)
+
+    assert error.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_import_batch_conflict_falls_back_to_rows(session: AsyncSession, owner, monkeypatch):
+    insert_contacts = repository_addressbook.insert_contacts
+
+    async def conflicting_batch(db, rows, current_user):
+        if len(rows) > 1:
+            # A concurrent import took the same names between the lookups and the batch insert.
+            await insert_contacts(db, rows, current_user)
+        await insert_contacts(db, rows, current_user)
+
+    monkeypatch.setattr(repository_addressbook, "insert_contacts", conflicting_batch)
+    content = "\n".join(
+        [
+            "first_name,last_name,birthday,email,phone",
+            "Alex,Tester,2000-10-06,alex@example.com,380991112233",
+            "Olena,Tester,1999-01-02,olena@example.com,380991112244",
+        ]
+    )
+
+    report = await import_contacts(upload(content, "book.csv"), None, owner, session)
+
+    assert report.imported == 2
+    assert report.failed == 0
+    assert (await session.execute(select(func.count()).select_from(AddressBookContact))).scalar() == 2
+
+
+@pytest.mark.asyncio
+async def test_copy_conflict_is_an_integrity_error():
+    driver_connection = MagicMock()
+    driver_connection.copy_records_to_table = AsyncMock(side_effect=UniqueViolationError("duplicate key value"))
+    connection = MagicMock()
+    connection.get_raw_connection = AsyncMock(return_value=MagicMock(driver_connection=driver_connection))
+    db = AsyncMock()
+    db.connection.return_value = connection
+    reserved = MagicMock()
+    reserved.scalars().all.return_value = [10]
+    db.execute.return_value = reserved
+    row = (
+        2,
+        repository_addressbook.AddressbookCreate(first_name="Alex", last_name="Tester", birthday="2000-10-06"),
+        repository_addressbook.EmailCreate(email="alex@example.com"),
+        repository_addressbook.PhoneCreate(phone="380991112233"),
+    )
+
+    with pytest.raises(IntegrityError):
+        await repository_addressbook.copy_contacts(db, [row], 1)
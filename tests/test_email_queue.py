@@ -0,0 +1,138 @@
+import json
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from src.conf.config import settings
+from src.database.redis import redis_manager
+from src.services.email import SMTPPool, email_queue, send_email
+from src.services.email_worker import EmailWorker
+
+
+class Mailbox:
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.content.decode()))
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture()
+def smtp_server(monkeypatch):
+    mailbox = Mailbox()
+    controller = Controller(mailbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    for name, value in {
+        "mail_server": "127.0.0.1",
+        "mail_port": controller.port,
+        "mail_username": "",
+        "mail_ssl_tls": False,
+        "mail_starttls": False,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    yield mailbox
+    controller.stop()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_dedupes_and_limits(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "email_recipient_limit", 2)
+
+    await send_email("reader@example.com", "reader", "http://testserver/", "Confirm", "email_template.html")
+    await send_email("reader@example.com", "reader", "http://testserver/", "Confirm", "email_template.html")
+    await send_email("Reader@example.com", "reader", "http://testserver/", "Reset", "password_template.html")
+    await fake_redis.delete(*await fake_redis.keys("mail:dedupe:*"))
+    await send_email("reader@example.com", "reader", "http://testserver/", "Confirm", "email_template.html")
+
+    entries = await fake_redis.xrange(email_queue.stream)
+    assert [json.loads(fields[b"job"])["template"] for _, fields in entries] == [
+        "email_template.html",
+        "password_template.html",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_worker_delivers_over_one_connection(fake_redis, smtp_server):
+    for number in range(3):
+        await send_email(f"user{number}@example.com", f"user{number}", "http://testserver/", "Confirm", "email_template.html")
+
+    pool = SMTPPool(1)
+    worker = EmailWorker(pool, consumer="test")
+    await worker.setup()
+    assert await worker.run_once(block=None) == 3
+    await pool.close()
+
+    assert [rcpt for rcpt, _ in smtp_server.messages] == [[f"user{number}@example.com"] for number in range(3)]
+    assert "http://testserver/api/auth/confirmed_email/" in smtp_server.messages[0][1]
+    assert smtp_server.connections == 1
+    assert await fake_redis.xlen(email_queue.stream) == 0
+
+
+@pytest.mark.asyncio
+async def test_worker_retries_then_gives_up(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "mail_server", "127.0.0.1")
+    monkeypatch.setattr(settings, "mail_port", free_port())
+    monkeypatch.setattr(settings, "mail_ssl_tls", False)
+    monkeypatch.setattr(settings, "email_max_attempts", 2)
+    monkeypatch.setattr(settings, "email_retry_base", 0)
+    await send_email("reader@example.com", "reader", "http://testserver/", "Confirm", "email_template.html")
+
+    worker = EmailWorker(SMTPPool(1), consumer="test")
+    await worker.setup()
+    await worker.run_once(block=None)
+    retries = await fake_redis.zrange(email_queue.retry, 0, -1)
+    assert [json.loads(job)["attempts"] for job in retries] == [1]
+
+    await worker.run_once(block=None)
+    assert await fake_redis.zcard(email_queue.retry) == 0
+    assert await fake_redis.xlen(email_queue.dead) == 1
+    assert await fake_redis.xlen(email_queue.stream) == 0
+
+
+@pytest.mark.asyncio
+async def test_send_directly_without_queue(smtp_server, monkeypatch):
+    class BrokenRedis:
+        async def set(self, *args, **kwargs):
+            raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(redis_manager, "_client", BrokenRedis())
+
+    await send_email("reader@example.com", "reader", "http://testserver/", "Reset", "password_template.html")
+
+    assert [rcpt for rcpt, _ in smtp_server.messages] == [["reader@example.com"]]
+
+
+@pytest.mark.asyncio
+async def test_poison_jobs_are_dead_lettered(fake_redis, smtp_server):
+    await fake_redis.xadd(email_queue.stream, {"job": "{broken"})
+    await fake_redis.xadd(email_queue.stream, {"job": json.dumps({"email": "x@example.com", "template": "missing.html"})})
+    await send_email("reader@example.com", "reader", "http://testserver/", "Confirm", "email_template.html")
+
+    pool = SMTPPool(1)
+    worker = EmailWorker(pool, consumer="test")
+    await worker.setup()
+    assert await worker.run_once(block=None) == 3
+    await pool.close()
+
+    assert [rcpt for rcpt, _ in smtp_server.messages] == [["reader@example.com"]]
+    dead = await fake_redis.xrange(email_queue.dead)
+    assert [json.loads(fields[b"job"]) for _, fields in dead] == [
+        {"raw": "{broken"},
+        {"email": "x@example.com", "template": "missing.html"},
+    ]
+    assert await fake_redis.xlen(email_queue.stream) == 0
+    assert (await fake_redis.xpending(email_queue.stream, email_queue.group))["pending"] == 0
@@ -0,0 +1,77 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient
+
+from src.database.redis import redis_manager
+from src.services.login_throttle import LoginThrottle, login_throttle
+
+
+def test_backoff_doubles_up_to_the_cap():
+    delays = [LoginThrottle.backoff(failures, 5) for failures in range(1, 10)]
+
+    assert delays[:5] == [0, 0, 0, 0, 0]
+    assert delays[5:] == [1, 2, 4, 8]
+    assert LoginThrottle.backoff(100, 5) == 900
+
+
+@pytest.mark.asyncio
+async def test_lock_shared_through_redis(fake_redis):
+    for _ in range(6):
+        await login_throttle.failed("Reader@Example.com", "10.0.0.1")
+
+    assert await fake_redis.get("login:fail:acct:reader@example.com") == b"6"
+    assert 0 < await fake_redis.pttl("login:lock:acct:reader@example.com") <= 1000
+
+    login_throttle.locks.clear()
+    with pytest.raises(HTTPException) as error:
+        await login_throttle.check("reader@example.com", "10.0.0.2")
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "1"
+
+    with patch.object(redis_manager, "_client", MagicMock()) as redis:
+        with pytest.raises(HTTPException):
+            await login_throttle.check("reader@example.com", "10.0.0.3")
+    redis.pipeline.assert_not_called()
+
+    await login_throttle.check("other@example.com", "10.0.0.1")
+
+
+@pytest.mark.asyncio
+async def test_failures_counted_locally_without_redis(monkeypatch):
+    monkeypatch.setattr("src.services.login_throttle.settings.login_account_free_attempts", 2)
+    redis = MagicMock()
+    redis.pipeline.side_effect = ConnectionError("Redis is down")
+
+    with patch.object(redis_manager, "_client", redis):
+        for _ in range(3):
+            await login_throttle.check("reader@example.com", "10.0.0.1")
+            await login_throttle.failed("reader@example.com", "10.0.0.1")
+
+        with pytest.raises(HTTPException) as error:
+            await login_throttle.check("Reader@Example.com", "10.0.0.2")
+        assert error.value.status_code == 429
+        await login_throttle.check("other@example.com", "10.0.0.1")
+
+        await login_throttle.succeeded("reader@example.com")
+        await login_throttle.check("reader@example.com", "10.0.0.1")
+
+
+@pytest.mark.asyncio
+async def test_login_throttled_before_user_lookup(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr("src.services.login_throttle.settings.login_account_free_attempts", 2)
+    form = {"username": "nobody@example.com", "password": "1234567890"}
+
+    for _ in range(2):
+        response = await client.post("/api/auth/login", data=form)
+        assert response.status_code == 401, response.text
+
+    with patch("src.routes.auth.repository_users.get_user_by_email", AsyncMock(return_value=None)) as lookup:
+        response = await client.post("/api/auth/login", data=form)
+        assert response.status_code == 401, response.text
+        response = await client.post("/api/auth/login", data=form)
+
+    assert response.status_code == 429, response.text
+    assert "Retry-After" in response.headers
+    assert lookup.await_count == 1
@@ -0,0 +1,129 @@
+import logging
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.conf.config import settings
+from src.database.redis import redis_manager
+from src.services import metrics
+from src.services.metrics import QueryStats, instrument_engine, query_stats
+from tests.conftest import async_engine
+
+
+@pytest.fixture(scope="module", autouse=True)
+def instrumented_test_engine():
+    instrument_engine(async_engine, "test-session")
+
+
+def sample(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_requests_by_route_template(client):
+    labels = {"method": "GET", "route": "/api/healthchecker", "status": "200"}
+    before = sample("http_request_duration_seconds_count", labels)
+    unmatched = sample("http_request_duration_seconds_count", {"method": "GET", "route": "unmatched", "status": "404"})
+
+    response = await client.get("/api/healthchecker")
+    await client.get("/api/no/such/path")
+
+    assert response.headers["server-timing"].startswith("app;dur=")
+    assert sample("http_request_duration_seconds_count", labels) == before + 1
+    assert sample("http_request_duration_seconds_count", {"method": "GET", "route": "unmatched", "status": "404"}) == unmatched + 1
+    assert sample("http_requests_in_progress", {"method": "GET"}) == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client, monkeypatch):
+    async with redis_manager.guard() as redis:
+        await redis.get("metrics:probe")
+    monkeypatch.setattr(settings, "metrics_token", "")
+    monkeypatch.setattr(settings, "metrics_allowed_ips", "")
+    assert (await client.get("/metrics")).status_code == 403
+
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+    assert (await client.get("/metrics")).status_code == 401
+    assert (await client.get("/metrics", headers={"Authorization": "Bearer other-token"})).status_code == 401
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'redis_call_duration_seconds_count{outcome="ok"}' in body
+    assert 'redis_circuit_state{state="closed"} 1.0' in body
+    assert 'cache_hit_ratio{cache="user"}' in body
+    assert 'cache_reads_total{cache="contact",result="miss"}' in body
+
+
+@pytest.mark.asyncio
+async def test_metrics_allowed_ips(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+    monkeypatch.setattr(settings, "metrics_allowed_ips", "10.0.0.0/8, 127.0.0.1")
+    assert (await client.get("/metrics")).status_code == 200
+
+    monkeypatch.setattr(settings, "metrics_allowed_ips", "10.0.0.0/8")
+    assert (await client.get("/metrics")).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_metrics_of_all_workers(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "MULTIPROCESS_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+
+    assert response.status_code == 200
+    assert 'redis_circuit_state{state="closed"} 1.0' in response.text
+    assert "http_request_duration_seconds_count" not in response.text
+
+
+@pytest.mark.asyncio
+async def test_sql_statements_are_timed():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    instrument_engine(engine, "test")
+    stats = QueryStats()
+    token = query_stats.set(stats)
+
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        with pytest.raises(Exception):
+            await conn.execute(text("SELECT * FROM missing_table"))
+    await engine.dispose()
+    query_stats.reset(token)
+
+    assert sample("db_query_duration_seconds_count", {"database": "test", "operation": "SELECT"}) == 1
+    assert sample("db_query_errors_total", {"database": "test"}) == 1
+    assert stats.count == 1
+    assert stats.shapes == {"SELECT 1": 1}
+
+
+def test_query_shapes():
+    stats = QueryStats()
+    stats.record("SELECT contacts.id FROM contacts WHERE contacts.book_id IN (?, ?, ?)", 0.001)
+    stats.record("SELECT contacts.id FROM contacts WHERE contacts.book_id IN ($1, $2)", 0.001)
+    stats.record("SELECT contacts.id FROM contacts WHERE contacts.book_id IN ($1)", 0.001)
+    stats.record("SELECT users.id FROM users WHERE users.email = ?", 0.001)
+
+    assert stats.repeated(1) == [("SELECT contacts.id FROM contacts WHERE contacts.book_id IN (?)", 2)]
+    assert stats.count == 4
+
+
+@pytest.mark.asyncio
+async def test_queries_of_a_request(client, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "db_query_header", True)
+    monkeypatch.setattr(settings, "db_repeated_query_limit", 0)
+    monkeypatch.setattr(settings, "db_slow_query", 0.0)
+
+    with caplog.at_level(logging.WARNING, logger="src.services.metrics"):
+        response = await client.get("/api/healthchecker")
+
+    assert response.headers["x-query-count"] == "1"
+    assert float(response.headers["x-query-time"]) >= 0
+    assert "db;dur=" in response.headers["server-timing"]
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Slow query on test-session") and "redacted" in message for message in messages)
+    assert any(message.startswith("Possible N+1 query in GET /api/healthchecker") for message in messages)
+    assert query_stats.get() is None
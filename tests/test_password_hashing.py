@@ -0,0 +1,39 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from src.services.auth import auth_service
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_off_loop():
+    hashed = await auth_service.hash_password("password")
+
+    assert await auth_service.verify_and_update_password("password", hashed) == (True, None)
+    assert (await auth_service.verify_and_update_password("wrong", hashed))[0] is False
+
+
+@pytest.mark.asyncio
+async def test_rehash_when_cost_changes():
+    old_context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4)
+    hashed = old_context.hash("password")
+
+    valid, new_hash = await auth_service.verify_and_update_password("password", hashed)
+
+    assert valid is True
+    assert new_hash is not None and auth_service.pwd_context.verify("password", new_hash)
+    assert auth_service.pwd_context.identify(new_hash) == "bcrypt"
+
+
+@pytest.mark.asyncio
+async def test_busy_when_no_slot_frees_up():
+    with patch.object(auth_service, "password_slots", asyncio.Semaphore(0)), patch(
+        "src.services.auth.settings.password_hash_timeout", 0.01
+    ):
+        with pytest.raises(HTTPException) as error:
+            await auth_service.hash_password("password")
+
+    assert error.value.status_code == 503
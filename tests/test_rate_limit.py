@@ -0,0 +1,98 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException, Response
+
+from src.conf.config import settings
+from src.database.models import Role
+from src.database.redis import redis_manager
+from src.schemas.user import UserClaims
+from src.services.rate_limit import Policy, RateLimit, RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_gcra_allows_the_limit_then_rejects(fake_redis):
+    limiter = RateLimiter()
+    policy = Policy.parse("3/60")
+
+    decisions = [await limiter.hit("route:1", policy) for _ in range(4)]
+
+    assert [decision.allowed for decision in decisions] == [True, True, True, False]
+    assert [decision.remaining for decision in decisions[:3]] == [2, 1, 0]
+    assert 19 < decisions[3].retry_after <= 20
+    assert decisions[3].headers()["Retry-After"] == "20"
+    assert (await limiter.hit("route:2", policy)).allowed
+
+
+@pytest.mark.asyncio
+async def test_batched_leases_skip_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_batch", 5)
+    limiter = RateLimiter()
+    policy = Policy.parse("100/60")
+    await limiter.hit("warm-up", policy)
+
+    with patch.object(fake_redis, "evalsha", wraps=fake_redis.evalsha) as evalsha:
+        decisions = [await limiter.hit("route:1", policy) for _ in range(10)]
+
+    assert all(decision.allowed for decision in decisions)
+    assert evalsha.call_count == 2
+    assert [decision.remaining for decision in decisions[:5]] == [99, 98, 97, 96, 95]
+
+
+@pytest.mark.asyncio
+async def test_steady_client_under_its_limit(fake_redis):
+    limiter = RateLimiter()
+    # 5 ms between tokens, leases of 10 tokens are kept for 50 ms.
+    policy = Policy.parse("200/1")
+
+    decisions = []
+    for _ in range(8):
+        decisions.append(await limiter.hit("route:1", policy))
+        await asyncio.sleep(0.06)
+
+    assert all(decision.allowed for decision in decisions)
+    # The tokens of every expired lease were earned back, the client always has its whole limit.
+    assert [decision.remaining for decision in decisions] == [199] * 8
+
+
+@pytest.mark.asyncio
+async def test_local_bucket_while_redis_is_down(fake_redis, monkeypatch):
+    limiter = RateLimiter()
+    monkeypatch.setattr(redis_manager.breaker, "opened_at", time.monotonic())
+
+    decisions = [await limiter.hit("route:1", Policy.parse("2/60")) for _ in range(3)]
+
+    assert [decision.allowed for decision in decisions] == [True, True, False]
+    assert 29 < decisions[2].retry_after <= 30
+
+
+@pytest.mark.asyncio
+async def test_policies_by_role(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limits", {"contacts:create": "1/60", "contacts:create:admin": "2/60"})
+    limit = RateLimit("contacts:create")
+    user = UserClaims(id=1, email="user@example.com", roles=Role.user)
+    admin = UserClaims(id=2, email="admin@example.com", roles=Role.admin)
+
+    response = Response()
+    await limit(response, user)
+    assert response.headers["RateLimit-Limit"] == "1"
+    assert response.headers["RateLimit-Remaining"] == "0"
+    with pytest.raises(HTTPException) as error:
+        await limit(Response(), user)
+    assert error.value.status_code == 429
+    assert "Retry-After" in error.value.headers
+
+    await limit(Response(), admin)
+    await limit(Response(), admin)
+    await RateLimit("not-limited")(Response(), user)
+
+
+@pytest.mark.asyncio
+async def test_routes_have_their_own_buckets(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limits", {"contacts:create": "1/60", "contacts:add_phone": "1/60"})
+    user = UserClaims(id=1, email="user@example.com", roles=Role.user)
+
+    await RateLimit("contacts:create")(Response(), user)
+    await RateLimit("contacts:add_phone")(Response(), user)
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from main import app, lifespan
+from src.database.redis import CircuitOpenError, RedisManager, redis_manager
+from src.services.cache import user_cache
+
+
+class SlowRedis:
+    async def get(self, *args, **kwargs):
+        await asyncio.sleep(1)
+
+    async def set(self, *args, **kwargs):
+        await asyncio.sleep(1)
+
+    def pipeline(self, *args, **kwargs):
+        raise ConnectionError("redis is down")
+
+
+@pytest.mark.asyncio
+async def test_pool_from_settings():
+    manager = RedisManager()
+    with patch("src.database.redis.settings.redis_max_connections", 7), patch(
+        "src.database.redis.settings.redis_socket_timeout", 1.5
+    ):
+        client = manager.init()
+
+    assert manager.client is client
+    assert manager.init() is client
+    stats = manager.stats()
+    assert stats["max_connections"] == 7
+    assert stats["created_connections"] == 0
+    assert client.connection_pool.connection_kwargs["socket_timeout"] == 1.5
+
+    await manager.close()
+    assert manager.stats()["open"] is False
+
+
+@pytest.mark.asyncio
+async def test_lifespan_closes_the_pool(fake_redis):
+    async with lifespan(app):
+        assert redis_manager.client is fake_redis
+
+    assert redis_manager._client is None
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_recovers(fake_redis, monkeypatch):
+    monkeypatch.setattr("src.database.redis.settings.redis_command_timeout", 0.01)
+    monkeypatch.setattr(redis_manager.breaker, "threshold", 2)
+    monkeypatch.setattr(redis_manager, "_client", SlowRedis())
+
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            async with redis_manager.guard() as client:
+                await client.get("key")
+    assert redis_manager.breaker.state == "open"
+
+    start = time.perf_counter()
+    with pytest.raises(CircuitOpenError):
+        async with redis_manager.guard():
+            pass
+    assert time.perf_counter() - start < 0.01
+
+    monkeypatch.setattr(redis_manager, "_client", fake_redis)
+    monkeypatch.setattr(redis_manager.breaker, "opened_at", time.monotonic() - 60)
+    assert redis_manager.breaker.state == "half-open"
+    async with redis_manager.guard() as client:
+        await client.ping()
+    assert redis_manager.breaker.state == "closed"
+    assert redis_manager.stats()["circuit_trips"] == 1
+
+
+@pytest.mark.asyncio
+async def test_user_cache_during_outage(fake_redis, monkeypatch):
+    await fake_redis.set("user:reader@example.com", "{}")
+    user_cache.local.set("reader@example.com", {"email": "reader@example.com"})
+    monkeypatch.setattr(redis_manager, "_client", SlowRedis())
+    monkeypatch.setattr(redis_manager.breaker, "opened_at", time.monotonic())
+
+    assert await user_cache.get_data("reader@example.com") == {"email": "reader@example.com"}
+    await user_cache.invalidate("reader@example.com")
+    assert user_cache.pending == {"reader@example.com"}
+
+    monkeypatch.setattr(redis_manager, "_client", fake_redis)
+    monkeypatch.setattr(redis_manager.breaker, "opened_at", None)
+    await user_cache.flush_pending()
+
+    assert user_cache.pending == set()
+    assert await fake_redis.get("user:reader@example.com") is None
@@ -0,0 +1,83 @@
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+from src.services.refresh_tokens import refresh_tokens
+
+
+@pytest.mark.asyncio
+async def test_rotation_and_reuse_detection(fake_redis):
+    first = await refresh_tokens.start("reader@example.com")
+    second = await refresh_tokens.rotate(first["fid"], first["jti"])
+
+    assert second["fid"] == first["fid"] and second["jti"] != first["jti"]
+    assert 0 < await fake_redis.ttl(refresh_tokens.family_key(first["fid"])) <= 7 * 24 * 3600
+
+    with pytest.raises(HTTPException) as error:
+        await refresh_tokens.rotate(first["fid"], first["jti"])
+    assert error.value.status_code == 401
+
+    with pytest.raises(HTTPException):
+        await refresh_tokens.rotate(second["fid"], second["jti"])
+
+
+@pytest.mark.asyncio
+async def test_revoke_user(fake_redis):
+    families = [await refresh_tokens.start("reader@example.com") for _ in range(2)]
+
+    await refresh_tokens.revoke_user("reader@example.com")
+
+    for family in families:
+        with pytest.raises(HTTPException):
+            await refresh_tokens.rotate(family["fid"], family["jti"])
+    assert await fake_redis.exists(refresh_tokens.user_key("reader@example.com")) == 0
+
+
+@pytest.mark.asyncio
+async def test_refresh_route_skips_the_database(client: AsyncClient, session: AsyncSession, monkeypatch):
+    password = auth_service.get_password_hash("1234567890")
+    session.add(User(id=1, username="reader", email="reader@example.com", password=password, confirmed=True))
+    await session.commit()
+
+    response = await client.post("/api/auth/login", data={"username": "reader@example.com", "password": "1234567890"})
+    assert response.status_code == 200, response.text
+    login_token = response.json()["refresh_token"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("update_token must not be called on refresh")
+
+    monkeypatch.setattr(repository_users, "update_token", fail)
+    headers = {"Authorization": f"Bearer {login_token}"}
+    response = await client.get("/api/auth/refresh_token", headers=headers)
+    assert response.status_code == 200, response.text
+    rotated = response.json()["refresh_token"]
+
+    response = await client.get("/api/auth/refresh_token", headers=headers)
+    assert response.status_code == 401, response.text
+    response = await client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {rotated}"})
+    assert response.status_code == 401, response.text
+
+
+@pytest.mark.asyncio
+async def test_refresh_route_rejects_an_old_token_version(client: AsyncClient, session: AsyncSession, monkeypatch):
+    password = auth_service.get_password_hash("1234567890")
+    session.add(User(id=1, username="reader", email="reader@example.com", password=password, confirmed=True))
+    await session.commit()
+
+    response = await client.post("/api/auth/login", data={"username": "reader@example.com", "password": "1234567890"})
+    assert response.status_code == 200, response.text
+    login_token = response.json()["refresh_token"]
+
+    async def unavailable(email):
+        return None
+
+    monkeypatch.setattr(refresh_tokens, "revoke_user", unavailable)
+    user = await repository_users.get_user_by_email("reader@example.com", session)
+    await repository_users.change_password(user, auth_service.get_password_hash("0987654321"), session)
+
+    response = await client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {login_token}"})
+    assert response.status_code == 401, response.text
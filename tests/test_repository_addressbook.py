@@ -1,14 +1,17 @@
 import unittest
+from collections import namedtuple
 from datetime import date, timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import AddressBookContact, Contact, ContactType
 from src.repository.addressbook import (add_email_to_contact,
                                         add_phone_to_contact, create_contact,
-                                        get_contact, get_contacts,
+                                        decode_cursor, get_contact,
+                                        get_contacts, get_contacts_page,
                                         read_contact_days_to_birthday,
                                         remove_contact, search_contacts,
                                         update_contact_birthday,
@@ -55,6 +58,32 @@ class TestAddressBook(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_page(self):
+        contacts = [AddressBookContact(id=i, first_name="Alex", last_name=f"Tester{i}") for i in range(1, 4)]
+        mock_result = MagicMock()
+        mock_result.scalars().all.return_value = contacts
+        self.session.execute.return_value = mock_result
+        result, next_cursor = await get_contacts_page(cursor=None, limit=2, current_user=self.current_user, db=self.session)
+
+        self.assertEqual(result, contacts[:2])
+        self.assertEqual(decode_cursor(next_cursor, str, str, int), ("Tester2", "Alex", 2))
+
+    async def test_get_contacts_page_last_page(self):
+        contacts = [AddressBookContact(id=1, first_name="Alex", last_name="Tester")]
+        mock_result = MagicMock()
+        mock_result.scalars().all.return_value = contacts
+        self.session.execute.return_value = mock_result
+        result, next_cursor = await get_contacts_page(cursor=None, limit=2, current_user=self.current_user, db=self.session)
+
+        self.assertEqual(result, contacts)
+        self.assertIsNone(next_cursor)
+
+    async def test_get_contacts_page_invalid_cursor(self):
+        with self.assertRaises(HTTPException) as context:
+            await get_contacts_page(cursor="not-a-cursor", limit=2, current_user=self.current_user, db=self.session)
+
+        self.assertEqual(context.exception.status_code, status.HTTP_400_BAD_REQUEST)
+
     async def test_get_contact_found(self):
         contact = AddressBookContact()
         mock_result = MagicMock()
@@ -73,13 +102,31 @@ class TestAddressBook(unittest.IsolatedAsyncioTestCase):
         self.assertIsNone(result)
 
     async def test_search_contacts(self):
-        criteria = "Alex"
+        Row = namedtuple("Row", ["AddressBookContact", "score", "total"])
+        contacts = [AddressBookContact(id=i, first_name="Alex", last_name="Tester") for i in range(1, 4)]
+        mock_result = MagicMock()
+        mock_result.all.return_value = [Row(contact, 0.0, 3) for contact in contacts]
+        self.session.execute.return_value = mock_result
+        result, total, next_cursor = await search_contacts(
+            "Alex", limit=2, cursor=None, current_user=self.current_user, db=self.session
+        )
+
+        self.assertEqual(result, contacts[:2])
+        self.assertEqual(total, 3)
+        self.assertEqual(decode_cursor(next_cursor, float, int), (0.0, 2))
+
+    async def test_search_contacts_not_found(self):
         mock_result = MagicMock()
-        mock_result.scalars().all.return_value = criteria
+        mock_result.all.return_value = []
+        mock_result.scalar.return_value = 0
         self.session.execute.return_value = mock_result
-        result = await search_contacts(criteria, current_user=self.current_user, db=self.session)
+        result, total, next_cursor = await search_contacts(
+            "Alex", limit=2, cursor=None, current_user=self.current_user, db=self.session
+        )
 
-        self.assertEqual(result, criteria)
+        self.assertEqual(result, [])
+        self.assertEqual(total, 0)
+        self.assertIsNone(next_cursor)
 
     async def test_create_contact(self):
         contact_create = AddressbookCreate(birthday="2000-10-06", first_name="Alex", last_name="Tester")
@@ -102,50 +149,115 @@ class TestAddressBook(unittest.IsolatedAsyncioTestCase):
 
             self.assertIsInstance(result, AddressBookContact)
 
+    async def test_create_contact_single_commit(self):
+        contact_create = AddressbookCreate(birthday="2000-10-06", first_name="Alex", last_name="Tester")
+        email_create = EmailCreate(email="alex@gmail.com")
+        phone_create = PhoneCreate(phone="380991112233")
+
+        result = await create_contact(
+            db=self.session,
+            contact_create=contact_create,
+            email_create=email_create,
+            phone_create=phone_create,
+            current_user=self.current_user,
+        )
+
+        self.session.execute.assert_not_called()
+        self.session.commit.assert_awaited_once()
+        self.assertEqual([contact.contact_type for contact in result.contacts], [ContactType.email, ContactType.phone])
+        self.assertTrue(all(contact.user_id == self.current_user for contact in result.contacts))
+
     async def test_create_contact_existing_contact(self):
         contact_create = AddressbookCreate(birthday="2000-10-06", first_name="Alex", last_name="Tester")
         email_create = EmailCreate(email="alex@gmail.com")
         phone_create = PhoneCreate(phone="380991112233")
 
-        self.session.execute.return_value = MagicMock(fetchone=MagicMock(return_value=(1, self.mock_contact)))
+        self.session.commit.side_effect = IntegrityError(
+            "INSERT", {}, Exception("UNIQUE constraint failed: addressbook.user_id, addressbook.first_name, addressbook.last_name")
+        )
 
-        with patch("src.database.models.AddressBookContact") as abc_mock:
-            abc_instance_mock = MagicMock()
-            abc_mock.return_value = abc_instance_mock
+        with self.assertRaises(HTTPException) as context:
+            await create_contact(
+                db=self.session,
+                contact_create=contact_create,
+                email_create=email_create,
+                phone_create=phone_create,
+                current_user=self.current_user,
+            )
+
+        self.session.rollback.assert_awaited_once()
+        self.assertEqual(context.exception.detail, "Contact with first_name and last_name already exists!")
+        self.assertEqual(context.exception.status_code, 409)
+
+    async def test_create_contact_not_null_violation_is_not_a_conflict(self):
+        contact_create = AddressbookCreate(birthday="2000-10-06", first_name="Alex", last_name="Tester")
+        email_create = EmailCreate(email="alex@gmail.com")
+        phone_create = PhoneCreate(phone="380991112233")
+
+        error = IntegrityError("INSERT", {}, Exception("NOT NULL constraint failed: addressbook.user_id"))
+        self.session.commit.side_effect = error
+        mock_result = MagicMock()
+        mock_result.scalars().all.return_value = []
+        self.session.execute.return_value = mock_result
 
-            try:
-                await create_contact(
-                    db=self.session,
-                    contact_create=contact_create,
-                    email_create=email_create,
-                    phone_create=phone_create,
-                    current_user=self.current_user,
-                )
-            except HTTPException as e:
-                self.assertEqual(e.detail, "Contact with first_name and last_name already exists!")
-                self.assertEqual(e.status_code, 409)
+        with self.assertRaises(IntegrityError) as context:
+            await create_contact(
+                db=self.session,
+                contact_create=contact_create,
+                email_create=email_create,
+                phone_create=phone_create,
+                current_user=self.current_user,
+            )
+
+        self.assertIs(context.exception, error)
 
     async def test_create_contact_existing_email(self):
         contact_create = AddressbookCreate(birthday="2000-10-06", first_name="Alex", last_name="Tester")
         email_create = EmailCreate(email="alex@gmail.com")
         phone_create = PhoneCreate(phone="380991112233")
 
-        self.session.execute.return_value = MagicMock(fetchone=MagicMock(return_value=(1, "alex@gmail.com")))
+        self.session.commit.side_effect = IntegrityError(
+            "INSERT", {}, Exception("UNIQUE constraint failed: contacts.user_id, contacts.contact_type, contacts.contact_value")
+        )
+        mock_result = MagicMock()
+        mock_result.scalars().all.return_value = [ContactType.email]
+        self.session.execute.return_value = mock_result
 
-        with patch("src.database.models.AddressBookContact") as abc_mock:
-            abc_instance_mock = MagicMock()
-            abc_mock.return_value = abc_instance_mock
+        with self.assertRaises(HTTPException) as context:
+            await create_contact(
+                db=self.session,
+                contact_create=contact_create,
+                email_create=email_create,
+                phone_create=phone_create,
+                current_user=self.current_user,
+            )
+
+        self.assertEqual(context.exception.status_code, 409)
+        self.assertEqual(context.exception.detail, "Email is exists!")
+
+    async def test_create_contact_existing_phone(self):
+        contact_create = AddressbookCreate(birthday="2000-10-06", first_name="Alex", last_name="Tester")
+        email_create = EmailCreate(email="alex@gmail.com")
+        phone_create = PhoneCreate(phone="380991112233")
+
+        self.session.commit.side_effect = IntegrityError(
+            "INSERT", {}, Exception('duplicate key value violates unique constraint "uq_contacts_user_id_type_value"')
+        )
+        mock_result = MagicMock()
+        mock_result.scalars().all.return_value = [ContactType.phone]
+        self.session.execute.return_value = mock_result
 
-            with self.assertRaises(HTTPException) as context:
-                await create_contact(
-                    db=self.session,
-                    contact_create=contact_create,
-                    email_create=email_create,
-                    phone_create=phone_create,
-                    current_user=self.current_user,
-                )
+        with self.assertRaises(HTTPException) as context:
+            await create_contact(
+                db=self.session,
+                contact_create=contact_create,
+                email_create=email_create,
+                phone_create=phone_create,
+                current_user=self.current_user,
+            )
 
-            self.assertEqual(context.exception.status_code, 409)
+        self.assertEqual(context.exception.status_code, 409)
+        self.assertEqual(context.exception.detail, "Phone is exists!")
 
     async def test_add_phone_to_contact(self):
         phone_create = PhoneCreate(phone="380991112233")
@@ -0,0 +1,315 @@
+import csv
+import io
+import json
+import time
+from datetime import date
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from src.database.models import AddressBookContact, Contact, ContactType, Role, User
+from src.database.redis import redis_manager
+from src.conf.config import settings
+from src.schemas.user import UserClaims
+from src.services.auth import auth_service
+from src.services.cache import contact_cache
+from tests.conftest import async_engine
+
+
+@pytest_asyncio.fixture()
+async def current_user(session: AsyncSession):
+    session.add(User(id=1, username="reader", email="reader@example.com", password="secret", confirmed=True))
+    await session.commit()
+
+    user = User(id=1, username="reader", email="reader@example.com", roles=Role.user)
+    claims = UserClaims(id=1, email="reader@example.com", roles=Role.user)
+    app.dependency_overrides[auth_service.get_current_user] = lambda: user
+    app.dependency_overrides[auth_service.get_current_claims] = lambda: claims
+    yield user
+    app.dependency_overrides.pop(auth_service.get_current_user, None)
+    app.dependency_overrides.pop(auth_service.get_current_claims, None)
+
+
+@pytest_asyncio.fixture()
+async def contacts(session: AsyncSession, current_user: User):
+    today = date.today()
+    for i in range(5):
+        contact = AddressBookContact(
+            first_name=f"Name{i}", last_name="Tester", birthday=date(1990, today.month, today.day), user_id=current_user.id
+        )
+        contact.contacts = [
+            Contact(contact_type=ContactType.email, contact_value=f"tester{i}@example.com", user_id=current_user.id),
+            Contact(contact_type=ContactType.phone, contact_value=f"+38099111220{i}", user_id=current_user.id),
+        ]
+        session.add(contact)
+    await session.commit()
+
+
+@pytest.fixture()
+def statements():
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/api/contacts/",
+        "/api/contacts/?cursor=",
+        "/api/contacts/search/Tester?criteria=Tester&limit=10",
+        "/api/contacts/birthday/0",
+    ],
+)
+async def test_read_contacts_query_count(client: AsyncClient, contacts, statements, url):
+    response = await client.get(url)
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    items = data["items"] if isinstance(data, dict) else data
+    assert len(items) == 5
+    assert all(len(item["contacts"]) == 2 for item in items)
+    assert len(statements) == 2, statements
+
+
+@pytest.mark.asyncio
+async def test_read_contact_query_count(client: AsyncClient, contacts, statements):
+    response = await client.get("/api/contacts/1")
+
+    assert response.status_code == 200, response.text
+    assert len(response.json()["contacts"]) == 2
+    assert len(statements) == 2, statements
+
+
+@pytest.mark.asyncio
+async def test_read_contact_cached(client: AsyncClient, contacts, statements, monkeypatch):
+    monkeypatch.setattr(contact_cache, "hits", 0)
+    monkeypatch.setattr(contact_cache, "misses", 0)
+    first = await client.get("/api/contacts/1")
+    statements.clear()
+
+    second = await client.get("/api/contacts/1")
+
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert statements == []
+    assert contact_cache.stats()["hits"] == 1
+    assert contact_cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_read_contact_cache_invalidated_on_update(client: AsyncClient, contacts):
+    await client.get("/api/contacts/1")
+
+    response = await client.put("/api/contacts/1", json={"first_name": "Renamed", "last_name": "Tester"})
+    assert response.status_code == 200, response.text
+
+    response = await client.get("/api/contacts/1")
+    assert response.json()["first_name"] == "Renamed"
+
+
+@pytest.mark.asyncio
+async def test_read_contact_without_redis(client: AsyncClient, contacts, monkeypatch):
+    class BrokenRedis:
+        async def get(self, *args, **kwargs):
+            raise ConnectionError("redis is down")
+
+        async def mget(self, *args, **kwargs):
+            raise ConnectionError("redis is down")
+
+        async def set(self, *args, **kwargs):
+            raise ConnectionError("redis is down")
+
+        async def evalsha(self, *args, **kwargs):
+            raise ConnectionError("redis is down")
+
+        def register_script(self, *args, **kwargs):
+            raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(redis_manager, "_client", BrokenRedis())
+
+    response = await client.get("/api/contacts/1")
+
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "Name0"
+
+
+@pytest.mark.asyncio
+async def test_failed_invalidation_is_sent_again(client: AsyncClient, contacts, fake_redis, monkeypatch):
+    await client.get("/api/contacts/1")
+    monkeypatch.setattr(redis_manager.breaker, "opened_at", time.monotonic())
+
+    response = await client.put("/api/contacts/1", json={"first_name": "Renamed", "last_name": "Tester"})
+    assert response.status_code == 200, response.text
+    assert 1 in contact_cache.pending
+
+    monkeypatch.setattr(redis_manager.breaker, "opened_at", None)
+    monkeypatch.setattr(redis_manager.breaker, "failures", 0)
+    response = await client.get("/api/contacts/1")
+
+    assert response.json()["first_name"] == "Renamed"
+    assert contact_cache.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_slow_read_does_not_restore_a_dropped_contact(contacts, fake_redis):
+    payload, version = await contact_cache.get_contact(1, 1)
+    assert payload is None
+    await contact_cache.invalidate(1, 1)
+
+    await contact_cache.set_contact(1, 1, "{}", version)
+
+    assert await fake_redis.get(contact_cache.contact_key(1, 1)) is None
+
+
+@pytest.mark.asyncio
+async def test_invalidation_does_not_restart_a_lost_version(fake_redis):
+    before = time.time_ns()
+    await contact_cache.invalidate(1)
+    seeded = int(await fake_redis.get(contact_cache.version_key(1)))
+    await contact_cache.invalidate(1)
+
+    assert seeded > before
+    assert await contact_cache.version(1) == seeded + 1
+
+
+@pytest.mark.asyncio
+async def test_search_contacts_ranked_pages(client: AsyncClient, contacts):
+    seen = []
+    cursor = None
+    while True:
+        url = "/api/contacts/search/tester?criteria=tester&limit=2"
+        response = await client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["total"] == 5
+        seen.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert sorted(seen) == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("criteria, expected", [("Name3", [4]), ("112203", [4]), ("e3", [4]), ("50%", []), ("nobody", [])])
+async def test_search_contacts_by_name_and_value(client: AsyncClient, contacts, criteria, expected):
+    response = await client.get("/api/contacts/search/find", params={"criteria": criteria})
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [item["id"] for item in data["items"]] == expected
+    assert data["total"] == len(expected)
+
+
+@pytest.mark.asyncio
+async def test_search_contacts_follows_updates(client: AsyncClient, contacts, session: AsyncSession):
+    contact = await session.get(AddressBookContact, 2)
+    contact.last_name = "Renamed"
+    await session.commit()
+
+    response = await client.get("/api/contacts/search/find", params={"criteria": "renamed"})
+
+    assert [item["id"] for item in response.json()["items"]] == [2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "url", ["/api/contacts/", "/api/contacts/search/find?criteria=Tester", "/api/contacts/birthday/0"]
+)
+async def test_list_responses_cached_until_write(client: AsyncClient, contacts, statements, url):
+    first = await client.get(url)
+    statements.clear()
+
+    second = await client.get(url)
+
+    assert second.json() == first.json()
+    assert statements == []
+
+    response = await client.put("/api/contacts/2", json={"first_name": "Renamed", "last_name": "Tester"})
+    assert response.status_code == 200, response.text
+    statements.clear()
+
+    third = await client.get(url)
+
+    assert len(statements) == 2
+    data = third.json()
+    items = data["items"] if isinstance(data, dict) else data
+    assert "Renamed" in [item["first_name"] for item in items]
+
+
+@pytest.mark.asyncio
+async def test_list_cache_scoped_by_user_and_params(client: AsyncClient, contacts, fake_redis):
+    await client.get("/api/contacts/", params={"limit": 2})
+    await client.get("/api/contacts/", params={"limit": 3})
+    await contact_cache.invalidate(2)
+
+    keys = sorted(key.decode() for key in await fake_redis.keys("contacts:*"))
+
+    assert len([key for key in keys if key.startswith("contacts:1:list:")]) == 2
+    assert "contacts:1:version" in keys
+    assert "contacts:2:version" in keys
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson(client: AsyncClient, contacts, monkeypatch):
+    monkeypatch.setattr(settings, "export_chunk_size", 2)
+
+    response = await client.get("/api/contacts/export")
+
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == [1, 2, 3, 4, 5]
+    assert all(len(line["contacts"]) == 2 for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_export_csv_gzip(client: AsyncClient, contacts):
+    response = await client.get("/api/contacts/export", params={"format": "csv", "gzip": True})
+
+    assert response.status_code == 200, response.text
+    assert response.headers["content-encoding"] == "gzip"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 5
+    assert rows[0]["emails"] == "tester0@example.com"
+    assert rows[0]["phones"] == "+380991112200"
+
+
+@pytest.mark.asyncio
+async def test_export_unknown_format(client: AsyncClient, current_user):
+    response = await client.get("/api/contacts/export", params={"format": "xml"})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_birthdays_across_new_year(client: AsyncClient, current_user, session: AsyncSession, monkeypatch):
+    class FakeDate(date):
+        @classmethod
+        def today(cls):
+            return cls(2023, 12, 28)
+
+    monkeypatch.setattr("src.repository.addressbook.date", FakeDate)
+    for i, birthday in enumerate([date(1990, 1, 4), date(1985, 12, 30), date(1990, 1, 5), date(1991, 12, 27), date(1992, 12, 28)]):
+        session.add(AddressBookContact(first_name=f"Name{i}", last_name="Tester", birthday=birthday, user_id=current_user.id))
+    await session.commit()
+
+    response = await client.get("/api/contacts/birthday/7")
+
+    assert response.status_code == 200, response.text
+    assert [item["birthday"] for item in response.json()] == ["1992-12-28", "1985-12-30", "1990-01-04"]
+
+    response = await client.get("/api/contacts/birthday/365")
+
+    assert len(response.json()) == 5
@@ -0,0 +1,83 @@
+import asyncio
+import json
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.database.models import Role, User
+from src.services.auth import auth_service
+from src.services.cache import LocalCache, dump_user, load_user, user_cache
+
+
+def make_user() -> User:
+    return User(
+        id=1,
+        username="reader",
+        email="reader@example.com",
+        password="secret",
+        confirmed=True,
+        roles=Role.moderator,
+        created_at=datetime(2023, 9, 1, 12, 30),
+        updated_at=datetime(2023, 9, 2, 8, 0),
+    )
+
+
+def test_local_cache_lru_and_ttl():
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    with patch("src.services.cache.time.monotonic", return_value=10**9):
+        assert cache.get("a") is None
+
+
+def test_dump_and_load_user():
+    payload = dump_user(make_user())
+    data = json.loads(payload)
+    data["removed_column"] = "ignored"
+    del data["avatar"]
+
+    user = load_user(data)
+
+    assert user.id == 1
+    assert user.roles is Role.moderator
+    assert user.created_at == datetime(2023, 9, 1, 12, 30)
+    assert user.avatar is None
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_cached(fake_redis):
+    token = await auth_service.create_access_token(data={"sub": "reader@example.com"})
+    with patch("src.services.auth.repository_users.get_user_by_email", AsyncMock(return_value=make_user())) as lookup:
+        first = await auth_service.get_current_user(token, AsyncMock())
+        user_cache.local.clear()
+        second = await auth_service.get_current_user(token, AsyncMock())
+        third = await auth_service.get_current_user(token, AsyncMock())
+
+    assert lookup.await_count == 1
+    assert first.email == second.email == third.email == "reader@example.com"
+    assert second.roles is Role.moderator
+    assert 0 < await fake_redis.ttl("user:reader@example.com") <= 900
+
+
+@pytest.mark.asyncio
+async def test_invalidate_evicts_every_worker(fake_redis):
+    await user_cache.set(make_user())
+    listener = asyncio.create_task(user_cache.listen())
+    await asyncio.sleep(0.05)
+
+    await fake_redis.publish(user_cache.channel, "reader@example.com")
+    await asyncio.sleep(0.05)
+    assert user_cache.local.get("reader@example.com") is None
+
+    await user_cache.invalidate("reader@example.com")
+    listener.cancel()
+
+    assert await fake_redis.get("user:reader@example.com") is None